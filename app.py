@@ -1,9 +1,23 @@
 # app.py
 
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+
 import streamlit as st
 import pandas as pd
-import numpy as np
-import io
+
+import bang_ma
+import ket_qua_chung
+from cham_tra import KY_CHAM_TRA, MOC_CHAM_TRA, moc_hop_le
+from excel_cache import file_hash
+from ingest import DEFAULT_WORKERS, nap_truoc, tao_pool
+from instrument import ghi_log
+from kiem_tra_truoc import kiem_tra_file, kiem_tra_uploads
+import lich_su
+from export import DINH_DANG_XUAT
+from pipeline import CHE_DO_XU_LY, dem_tieu_chi, process_data
+from schema import read_kwargs
+from viewer import hien_thi_bang
 
 st.set_page_config(page_title="CRM4 - CRM32 Kiểm toán", layout="wide")
 
@@ -27,7 +41,8 @@ chi_nhanh = st.sidebar.text_input(
 
 dia_ban_kt_input = st.sidebar.text_input(
     "Nhập tên tỉnh/thành của đơn vị đang kiểm toán (phân cách bằng dấu phẩy)",
-    placeholder="VD: Hồ Chí Minh, Long An"
+    placeholder="VD: Hồ Chí Minh, Long An",
+    help="Không phân biệt dấu, viết tắt (TP.HCM, HCM...); ngày đánh giá từ 01/07/2025 thì tên tỉnh cũ/mới sau sáp nhập được coi là một"
 )
 dia_ban_kt = [t.strip().lower() for t in dia_ban_kt_input.split(',') if t.strip()]
 
@@ -37,474 +52,283 @@ ngay_danh_gia_input = st.sidebar.date_input(
 )
 ngay_danh_gia = pd.to_datetime(ngay_danh_gia_input)
 
+# Tiêu chí "KH có cả GNG và TT trong 1 ngày" (Mục 55/56)
+so_ngay_gn_tt = st.sidebar.number_input(
+    "Cửa sổ ngày giữa giải ngân và tất toán (Mục 55/56)",
+    min_value=0,
+    max_value=30,
+    value=0,
+    help="0 = cùng một ngày như tiêu chí gốc; N = giải ngân và tất toán cách nhau không quá N ngày"
+)
+gn_tt_cung_khe_uoc = st.sidebar.checkbox(
+    "Chỉ khớp giải ngân – tất toán trên cùng khế ước",
+    value=False
+)
+
+# Mục 57 – chậm trả: kỳ xét theo năm đến hạn và mốc chia cấp
+with st.sidebar.expander("⚙️ Tham số chậm trả (Mục 57)"):
+    ky_cham_tra = st.slider(
+        "Năm đến hạn được xét",
+        min_value=2015,
+        max_value=2035,
+        value=KY_CHAM_TRA
+    )
+    moc_cham_tra_input = st.text_input(
+        "Mốc chia cấp (số ngày chậm trả)",
+        value=", ".join(str(m) for m in MOC_CHAM_TRA),
+        help="Mốc dưới của từng cấp, tăng dần. Mặc định 1, 4, 10 -> <4, 4-9, >=10 ngày; "
+             "hai cờ chậm trả lấy theo hai cấp nặng nhất"
+    )
+    try:
+        moc_cham_tra = tuple(int(m) for m in moc_cham_tra_input.split(",") if m.strip())
+    except ValueError:
+        moc_cham_tra = ()
+    if not moc_hop_le(moc_cham_tra):
+        st.warning("Mốc chia cấp không hợp lệ, dùng mặc định.")
+        moc_cham_tra = MOC_CHAM_TRA
+
+so_tien_trinh = st.sidebar.number_input(
+    "Số tiến trình đọc file CRM4/CRM32 song song",
+    min_value=1,
+    max_value=64,
+    value=min(DEFAULT_WORKERS, 64)
+)
+
+che_do = st.sidebar.selectbox(
+    "Chế độ xử lý",
+    list(CHE_DO_XU_LY),
+    format_func=CHE_DO_XU_LY.get,
+    help="Ngoài bộ nhớ: mỗi file CRM4/CRM32 được đọc rồi lọc ngay theo chi nhánh, "
+         "không giữ cả dữ liệu toàn hàng trong RAM. Kết quả giống hệt chế độ trong bộ nhớ."
+)
+
+do_bo_nho = st.sidebar.checkbox(
+    "Đo bộ nhớ đỉnh từng giai đoạn (tracemalloc)",
+    value=False,
+    help="Chậm hơn nhiều lần; số đo sai lệch nếu có phiên khác chạy cùng lúc"
+)
+
+# Kết quả dùng chung mọi phiên: cùng file + chi nhánh + ngày + địa bàn thì không tính lại
+tk_chung = ket_qua_chung.thong_ke()
+st.sidebar.caption(
+    f"🗄️ Kết quả dùng chung: {tk_chung['so_ket_qua']} bộ – "
+    f"{tk_chung['dung_luong_mb']:,.0f}/{tk_chung['ngan_sach_mb']:,.0f} MB"
+)
+
 st.sidebar.markdown("---")
 st.sidebar.markdown("### 📂 Upload file dữ liệu")
 
+
+# ------------------------------------------------------------
+# Parse trước ở nền ngay khi upload
+# ------------------------------------------------------------
+# Mỗi file vừa upload được gửi cho tiến trình nền parse vào cache Parquet
+# (ingest.nap_truoc) trong lúc người dùng điền tiếp sidebar; future giữ theo
+# hash nội dung + loại file, dùng chung mọi phiên. Bấm chạy thì chỉ đợi các
+# future còn dở rồi process_data đọc lại từ cache. Lỗi ở đây không chặn gì:
+# lúc chạy file sẽ được đọc lại như bình thường và báo lỗi ở đó.
+# Mỗi lần rerun (mọi thao tác trên giao diện) không hash lại nội dung file:
+# hash nhớ theo UploadedFile.file_id trong phiên; future đã xong quá
+# GIU_FUTURE_GIAY được bỏ khỏi danh sách dùng chung.
+
+GIU_FUTURE_GIAY = 3600
+
+
+@st.cache_resource
+def _nap_truoc_chung():
+    return tao_pool(max_workers=DEFAULT_WORKERS), {}
+
+
+def _hash_upload(f):
+    file_id = getattr(f, "file_id", None)
+    if file_id is None:
+        return file_hash(f)
+    ds_hash = st.session_state.setdefault("hash_upload", {})
+    if file_id not in ds_hash:
+        ds_hash[file_id] = file_hash(f)
+    return ds_hash[file_id]
+
+
+@st.cache_data(max_entries=256, show_spinner=False)
+def _kiem_tra_tieu_de(_f, khoa, loai):
+    # Kết quả kiểm tra dòng tiêu đề theo hash nội dung file: rerun không đọc lại file
+    return kiem_tra_file(_f, loai)
+
+
+def _bo_future_cu(ds_future):
+    han = time.time() - GIU_FUTURE_GIAY
+    for khoa, (future, t0) in list(ds_future.items()):
+        if future.done() and t0 < han:
+            ds_future.pop(khoa, None)
+
+
+def _hien_trang_thai(ds):
+    for ten, future, t0 in ds:
+        if not future.done():
+            st.caption(f"⏳ {ten}: đang đọc... {time.time() - t0:.0f}s")
+        elif future.exception() is not None:
+            st.caption(f"❌ {ten}: {future.exception()}")
+        else:
+            tg = future.result()[1]
+            st.caption(f"✅ {ten}: {tg['so_dong']:,} dòng – {tg['giay']}s")
+
+
+@st.fragment(run_every=1)
+def _cho_nap(ds):
+    # Cập nhật trạng thái mỗi giây, đọc xong hết thì rerun như _cho_xuat_file
+    if all(future.done() for _, future, _ in ds):
+        st.rerun()
+    _hien_trang_thai(ds)
+
+
+def nap_file(files, loai):
+    # Trả về danh sách future của các file đang upload ở ô này
+    if not files:
+        return []
+    if not isinstance(files, list):
+        files = [files]
+    if che_do == 'doc_luong' and loai in ('crm4', 'crm32'):
+        # Chế độ đọc luồng chỉ parse dòng của chi nhánh lúc chạy
+        st.sidebar.caption("ℹ️ Chế độ đọc luồng: CRM4/CRM32 được đọc khi chạy.")
+        return []
+
+    executor, ds_future = _nap_truoc_chung()
+    _bo_future_cu(ds_future)
+    ds = []
+    for f in files:
+        khoa = (_hash_upload(f), loai)
+        if khoa not in ds_future:
+            ds_future[khoa] = (nap_truoc(executor, f, **read_kwargs(loai)), time.time())
+        future, t0 = ds_future[khoa]
+        ds.append((getattr(f, "name", str(f)), future, t0))
+
+    with st.sidebar:
+        if all(future.done() for _, future, _ in ds):
+            _hien_trang_thai(ds)
+        else:
+            _cho_nap(ds)
+    return [future for _, future, _ in ds]
+
+
 crm4_files = st.sidebar.file_uploader(
     "Upload các file CRM4_Du_no_theo_tai_san_dam_bao_ALL (*.xls, *.xlsx)",
     type=["xls", "xlsx"],
     accept_multiple_files=True
 )
+dang_nap = nap_file(crm4_files, 'crm4')
 
 crm32_files = st.sidebar.file_uploader(
     "Upload các file RPT_CRM_32 (*.xls, *.xlsx)",
     type=["xls", "xlsx"],
     accept_multiple_files=True
 )
+dang_nap += nap_file(crm32_files, 'crm32')
 
 df_muc_dich_file_upload = st.sidebar.file_uploader(
-    "Upload CODE_MDSDV4.xlsx (bảng mã mục đích vay)",
+    "Upload CODE_MDSDV4.xlsx (bảng mã mục đích vay – bỏ trống nếu kho bảng mã đã có)",
     type=["xls", "xlsx"]
 )
+dang_nap += nap_file(df_muc_dich_file_upload, 'muc_dich')
 
 df_code_tsbd_file_upload = st.sidebar.file_uploader(
-    "Upload CODE_LOAI TSBD.xlsx (bảng mã loại TSBD)",
+    "Upload CODE_LOAI TSBD.xlsx (bảng mã loại TSBD – bỏ trống nếu kho bảng mã đã có)",
     type=["xls", "xlsx"]
 )
+dang_nap += nap_file(df_code_tsbd_file_upload, 'code_tsbd')
+
+# Kho bảng mã theo ngày hiệu lực (bang_ma.py): không upload thì dùng phiên bản
+# hiệu lực tại ngày đánh giá; file upload có thể lưu thành phiên bản mới
+bang_ma_upload = {'muc_dich': df_muc_dich_file_upload, 'code_tsbd': df_code_tsbd_file_upload}
+with st.sidebar.expander("📚 Kho bảng mã"):
+    for (loai, f), ten in zip(bang_ma_upload.items(), ("CODE_MDSDV4", "CODE_LOAI TSBD")):
+        phien_ban = bang_ma.tim_phien_ban(loai, ngay_danh_gia)
+        if f is not None:
+            st.caption(f"{ten}: dùng file upload")
+        elif phien_ban is not None:
+            st.caption(f"{ten}: dùng phiên bản hiệu lực {phien_ban['hieu_luc']:%d/%m/%Y} trong kho")
+        else:
+            st.caption(f"⚠️ {ten}: kho chưa có phiên bản hiệu lực tại ngày đánh giá, cần upload")
+    hieu_luc_bang_ma = st.date_input("Ngày hiệu lực khi lưu bảng mã upload", value=ngay_danh_gia_input)
+    if st.button("💾 Lưu bảng mã đã upload vào kho", disabled=all(f is None for f in bang_ma_upload.values())):
+        for loai, f in bang_ma_upload.items():
+            if f is not None:
+                bang_ma.luu_phien_ban(loai, f, hieu_luc_bang_ma)
+        st.success(f"Đã lưu phiên bản hiệu lực {hieu_luc_bang_ma:%d/%m/%Y}")
 
 df_giai_ngan_file_upload = st.sidebar.file_uploader(
     "Upload Giai_ngan_tien_mat_1_ty 6.xls (giải ngân tiền mặt)",
     type=["xls", "xlsx"]
 )
+dang_nap += nap_file(df_giai_ngan_file_upload, 'giai_ngan')
 
 df_sol_file_upload = st.sidebar.file_uploader(
     "Upload Muc17_Lop2_TSTC 4.xlsx (Mục 17 - Tài sản)",
     type=["xls", "xlsx"]
 )
+dang_nap += nap_file(df_sol_file_upload, 'muc17')
 
 df_55_file_upload = st.sidebar.file_uploader(
     "Upload Muc55_1405.xlsx (Mục 55 - Tất toán)",
     type=["xls", "xlsx"]
 )
+dang_nap += nap_file(df_55_file_upload, 'muc55')
 
 df_56_file_upload = st.sidebar.file_uploader(
     "Upload Muc56_1405.xlsx (Mục 56 - Giải ngân)",
     type=["xls", "xlsx"]
 )
+dang_nap += nap_file(df_56_file_upload, 'muc56')
 
 df_57_file_upload = st.sidebar.file_uploader(
     "Upload Muc57_1405.xlsx (Mục 57 - Chậm trả)",
     type=["xls", "xlsx"]
 )
-
-run_button = st.sidebar.button("▶️ Chạy xử lý dữ liệu")
-
-# ============================================================
-# HÀM CHÍNH XỬ LÝ DỮ LIỆU (CHUYỂN TỪ SCRIPT GỐC)
-# ============================================================
-
-def process_data(
-    crm4_files,
-    crm32_files,
-    df_muc_dich_file_upload,
-    df_code_tsbd_file_upload,
-    df_giai_ngan_file_upload,
-    df_sol_file_upload,
-    df_55_file_upload,
-    df_56_file_upload,
-    df_57_file_upload,
-    chi_nhanh,
-    ngay_danh_gia,
-    dia_ban_kt
-):
-    # 1. Đọc tất cả file HDV chi tiết CKH (*.xlsx)
-    df_crm4_ghep = [pd.read_excel(f) for f in crm4_files]
-    df_crm4 = pd.concat(df_crm4_ghep, ignore_index=True)
-
-    df_crm32_ghep = [pd.read_excel(f) for f in crm32_files]
-    df_crm32 = pd.concat(df_crm32_ghep, ignore_index=True)
-
-    df_muc_dich_file = pd.read_excel(df_muc_dich_file_upload)
-    df_code_tsbd_file = pd.read_excel(df_code_tsbd_file_upload)
-
-    # Chuẩn hóa CIF_KH_VAY và CUSTSEQLN
-    for df in [df_crm4]:
-        if 'CIF_KH_VAY' in df.columns:
-            df['CIF_KH_VAY'] = pd.to_numeric(df['CIF_KH_VAY'], errors='coerce')
-            df['CIF_KH_VAY'] = df['CIF_KH_VAY'].dropna().astype('int64').astype(str)
-
-    for df in [df_crm32]:
-        if 'CUSTSEQLN' in df.columns:
-            df['CUSTSEQLN'] = pd.to_numeric(df['CUSTSEQLN'], errors='coerce')
-            df['CUSTSEQLN'] = df['CUSTSEQLN'].dropna().astype('int64').astype(str)
-
-    df_crm4_list = df_crm4_ghep.copy()
-    df_crm32_list = df_crm32_ghep.copy()
-    df_muc_dich = df_muc_dich_file.copy()
-    df_code_tsbd = df_code_tsbd_file.copy()
-
-    # ✅ Lọc dữ liệu theo chi nhánh
-    df_crm4_filtered = df_crm4[df_crm4['BRANCH_VAY'].astype(str).str.upper().str.contains(chi_nhanh)]
-    df_crm32_filtered = df_crm32[df_crm32['BRCD'].astype(str).str.upper().str.contains(chi_nhanh)]
-
-    # --------------------------------------------------------
-    # XỬ LÝ LOẠI TSBD
-    # --------------------------------------------------------
-    df_code_tsbd = df_code_tsbd[['CODE CAP 2', 'CODE']]
-    df_code_tsbd.columns = ['CAP_2', 'LOAI_TS']
-
-    df_tsbd_code = df_code_tsbd[['CAP_2', 'LOAI_TS']].drop_duplicates()
-
-    df_crm4_filtered = df_crm4_filtered.merge(df_tsbd_code, how='left', on='CAP_2')
-
-    df_crm4_filtered['LOAI_TS'] = df_crm4_filtered.apply(
-        lambda row: 'Không TS' if pd.isna(row['CAP_2']) or str(row['CAP_2']).strip() == '' else row['LOAI_TS'],
-        axis=1
-    )
-
-    df_crm4_filtered['GHI_CHU_TSBD'] = df_crm4_filtered.apply(
-        lambda row: 'MỚI' if str(row['CAP_2']).strip() != '' and pd.isna(row['LOAI_TS']) else '',
-        axis=1
-    )
-
-    df_vay_4 = df_crm4_filtered.copy()
-
-    # Bỏ Bao lanh, LC
-    df_vay = df_vay_4[~df_vay_4['LOAI'].isin(['Bao lanh', 'LC'])]
-
-    pivot_ts = df_vay.pivot_table(
-        index='CIF_KH_VAY',
-        columns='LOAI_TS',
-        values='TS_KW_VND',
-        aggfunc='sum',
-        fill_value=0
-    ).add_suffix(' (Giá trị TS)').reset_index()
-
-    pivot_no = df_vay.pivot_table(
-        index='CIF_KH_VAY',
-        columns='LOAI_TS',
-        values='DU_NO_PHAN_BO_QUY_DOI',
-        aggfunc='sum',
-        fill_value=0
-    ).reset_index()
-
-    pivot_merge = pivot_no.merge(pivot_ts, on='CIF_KH_VAY', how='left')
-    pivot_merge['GIÁ TRỊ TS'] = pivot_ts.drop(columns='CIF_KH_VAY').sum(axis=1)
-    pivot_merge['DƯ NỢ'] = pivot_no.drop(columns='CIF_KH_VAY').sum(axis=1)
-
-    df_info = df_crm4_filtered[['CIF_KH_VAY', 'TEN_KH_VAY', 'CUSTTPCD', 'NHOM_NO']].drop_duplicates(subset='CIF_KH_VAY')
-    pivot_final = df_info.merge(pivot_merge, on='CIF_KH_VAY', how='left')
-    pivot_final = pivot_final.reset_index().rename(columns={'index': 'STT'})
-    pivot_final['STT'] += 1
-
-    cols_order = ['STT', 'CUSTTPCD', 'CIF_KH_VAY', 'TEN_KH_VAY', 'NHOM_NO'] + \
-                 sorted([col for col in pivot_merge.columns if col not in ['CIF_KH_VAY', 'GIÁ TRỊ TS', 'DƯ NỢ'] and '(Giá trị TS)' not in col]) + \
-                 sorted([col for col in pivot_merge.columns if '(Giá trị TS)' in col]) + \
-                 ['DƯ NỢ', 'GIÁ TRỊ TS']
-
-    pivot_final = pivot_final[cols_order]
-
-    # --------------------------------------------------------
-    # XỬ LÝ CRM32 & MỤC ĐÍCH VAY
-    # --------------------------------------------------------
-    df_crm32_filtered = df_crm32_filtered.copy()
-    df_crm32_filtered['MA_PHE_DUYET'] = df_crm32_filtered['CAP_PHE_DUYET'].astype(str).str.split('-').str[0].str.strip().str.zfill(2)
-
-    ma_cap_c = [f"{i:02d}" for i in range(1, 8)] + [f"{i:02d}" for i in range(28, 32)]
-    list_cif_cap_c = df_crm32_filtered[df_crm32_filtered['MA_PHE_DUYET'].isin(ma_cap_c)]['CUSTSEQLN'].unique()
-
-    list_co_cau = ['ACOV1', 'ACOV3', 'ATT01', 'ATT02', 'ATT03', 'ATT04',
-                   'BCOV1', 'BCOV2', 'BTT01', 'BTT02', 'BTT03',
-                   'CCOV2', 'CCOV3', 'CTT03', 'RCOV3', 'RTT03']
-    cif_co_cau = df_crm32_filtered[
-        df_crm32_filtered['SCHEME_CODE'].isin(list_co_cau)
-    ]['CUSTSEQLN'].unique()
-
-    df_muc_dich_vay = df_muc_dich[['CODE_MDSDV4', 'GROUP']]
-    df_muc_dich_vay.columns = ['MUC_DICH_VAY_CAP_4', 'MUC DICH']
-
-    df_muc_dich = df_muc_dich_vay[['MUC_DICH_VAY_CAP_4', 'MUC DICH']].drop_duplicates()
-
-    df_crm32_filtered = df_crm32_filtered.merge(df_muc_dich_vay, how='left', on='MUC_DICH_VAY_CAP_4')
-    df_crm32_filtered['MUC DICH'] = df_crm32_filtered['MUC DICH'].fillna('(blank)')
-    df_crm32_filtered['GHI_CHU_TSBD'] = df_crm32_filtered.apply(
-        lambda row: 'MỚI' if str(row['MUC_DICH_VAY_CAP_4']).strip() != '' and pd.isna(row['MUC DICH']) else '',
-        axis=1
-    )
-
-    pivot_mucdich = df_crm32_filtered.pivot_table(
-        index='CUSTSEQLN',
-        columns='MUC DICH',
-        values='DU_NO_QUY_DOI',
-        aggfunc='sum',
-        fill_value=0
-    ).reset_index()
-
-    pivot_mucdich['DƯ NỢ CRM32'] = pivot_mucdich.drop(columns='CUSTSEQLN').sum(axis=1)
-
-    pivot_final_CRM32 = pivot_mucdich.rename(columns={'CUSTSEQLN': 'CIF_KH_VAY'})
-    pivot_full = pivot_final.merge(pivot_final_CRM32, on='CIF_KH_VAY', how='left')
-    pivot_full.fillna(0, inplace=True)
-
-    # Lệch dư nợ
-    pivot_full['LECH'] = pivot_full['DƯ NỢ'] - pivot_full['DƯ NỢ CRM32']
-    pivot_full['LECH'] = pivot_full['LECH'].fillna(0)
-    cif_lech = pivot_full[pivot_full['LECH'] != 0]['CIF_KH_VAY'].unique()
-
-    # Bổ sung dư nợ (blank)
-    df_crm4_blank = df_crm4_filtered[~df_crm4_filtered['LOAI'].isin(['Cho vay', 'Bao lanh', 'LC'])].copy()
-
-    du_no_bosung = (
-        df_crm4_blank[df_crm4_blank['CIF_KH_VAY'].isin(cif_lech)]
-        .groupby('CIF_KH_VAY', as_index=False)['DU_NO_PHAN_BO_QUY_DOI']
-        .sum()
-        .rename(columns={'DU_NO_PHAN_BO_QUY_DOI': '(blank)'})
-    )
-
-    pivot_full = pivot_full.merge(du_no_bosung, on='CIF_KH_VAY', how='left')
-    pivot_full['(blank)'] = pivot_full['(blank)'].fillna(0)
-    pivot_full['DƯ NỢ CRM32'] = pivot_full['DƯ NỢ CRM32'] + pivot_full['(blank)']
-
-    cols = list(pivot_full.columns)
-    if '(blank)' in cols and 'DƯ NỢ CRM32' in cols:
-        cols.insert(cols.index('DƯ NỢ CRM32'), cols.pop(cols.index('(blank)')))
-        pivot_full = pivot_full[cols]
-
-    # pivot_full['LECH'] = pivot_full['DƯ NỢ'] - pivot_full['DƯ NỢ CRM32']
-
-    # Nợ nhóm 2 / Nợ xấu
-    pivot_full['Nợ nhóm 2'] = pivot_full['NHOM_NO'].apply(lambda x: 'x' if str(x).strip() == '2' else '')
-    pivot_full['Nợ xấu'] = pivot_full['NHOM_NO'].apply(lambda x: 'x' if str(x).strip() in ['3', '4', '5'] else '')
-
-    # Chuyên gia PD cấp C duyệt & NỢ CƠ_CẤU
-    pivot_full['Chuyên gia PD cấp C duyệt'] = pivot_full['CIF_KH_VAY'].apply(lambda x: 'x' if x in list_cif_cap_c else '')
-    pivot_full['NỢ CƠ_CẤU'] = pivot_full['CIF_KH_VAY'].apply(
-        lambda x: 'x' if x in cif_co_cau else ''
-    )
-
-    # --------------------------------------------------------
-    # BẢO LÃNH & LC
-    # --------------------------------------------------------
-    df_baolanh = df_crm4_filtered[df_crm4_filtered['LOAI'] == 'Bao lanh']
-    df_lc = df_crm4_filtered[df_crm4_filtered['LOAI'] == 'LC']
-
-    df_baolanh_sum = df_baolanh.groupby('CIF_KH_VAY', as_index=False)['DU_NO_PHAN_BO_QUY_DOI'].sum()
-    df_baolanh_sum = df_baolanh_sum.rename(columns={'DU_NO_PHAN_BO_QUY_DOI': 'DƯ_NỢ_BẢO_LÃNH'})
-
-    df_lc_sum = df_lc.groupby('CIF_KH_VAY', as_index=False)['DU_NO_PHAN_BO_QUY_DOI'].sum()
-    df_lc_sum = df_lc_sum.rename(columns={'DU_NO_PHAN_BO_QUY_DOI': 'DƯ_NỢ_LC'})
-
-    if 'DƯ_NỢ_BẢO_LÃNH' in pivot_full.columns:
-        pivot_full = pivot_full.drop(columns=['DƯ_NỢ_BẢO_LÃNH'])
-    pivot_full = pivot_full.merge(df_baolanh_sum, on='CIF_KH_VAY', how='left')
-
-    if 'DƯ_NỢ_LC' in pivot_full.columns:
-        pivot_full = pivot_full.drop(columns=['DƯ_NỢ_LC'])
-    pivot_full = pivot_full.merge(df_lc_sum, on='CIF_KH_VAY', how='left')
-
-    pivot_full['DƯ_NỢ_BẢO_LÃNH'] = pivot_full['DƯ_NỢ_BẢO_LÃNH'].fillna(0)
-    pivot_full['DƯ_NỢ_LC'] = pivot_full['DƯ_NỢ_LC'].fillna(0)
-
-    # --------------------------------------------------------
-    # GIẢI NGÂN TIỀN MẶT
-    # --------------------------------------------------------
-    df_giai_ngan = pd.read_excel(df_giai_ngan_file_upload)
-
-    df_crm32_filtered['KHE_UOC'] = df_crm32_filtered['KHE_UOC'].astype(str).str.strip()
-    df_crm32_filtered['CUSTSEQLN'] = df_crm32_filtered['CUSTSEQLN'].astype(str).str.strip()
-    df_giai_ngan['FORACID'] = df_giai_ngan['FORACID'].astype(str).str.strip()
-    pivot_full['CIF_KH_VAY'] = pivot_full['CIF_KH_VAY'].astype(str).str.strip()
-
-    df_match = df_crm32_filtered[df_crm32_filtered['KHE_UOC'].isin(df_giai_ngan['FORACID'])].copy()
-    ds_cif_tien_mat = df_match['CUSTSEQLN'].unique()
-
-    pivot_full['GIẢI_NGÂN_TIEN_MAT'] = pivot_full['CIF_KH_VAY'].isin(ds_cif_tien_mat).map({True: 'x', False: ''})
-
-    list_foracid = df_giai_ngan['FORACID'].astype(str).str.strip().unique()
-
-    df_cc_tctd = df_crm4_filtered[df_crm4_filtered['CAP_2'].str.contains('TCTD', case=False, na=False)]
-    df_cc_flag = df_cc_tctd[['CIF_KH_VAY']].drop_duplicates()
-    df_cc_flag['Cầm cố tại TCTD khác'] = 'x'
-
-    pivot_full = pivot_full.merge(df_cc_flag, on='CIF_KH_VAY', how='left')
-    pivot_full['Cầm cố tại TCTD khác'] = pivot_full['Cầm cố tại TCTD khác'].fillna('')
-
-    # TOP 10 DƯ NỢ KHCN / KHDN
-    top5_khcn = pivot_full[pivot_full['CUSTTPCD'] == 'Ca nhan'].nlargest(10, 'DƯ NỢ')['CIF_KH_VAY']
-    pivot_full['Top 10 dư nợ KHCN'] = pivot_full['CIF_KH_VAY'].apply(lambda x: 'x' if x in top5_khcn.values else '')
-
-    top5_khdn = pivot_full[pivot_full['CUSTTPCD'] == 'Doanh nghiep'].nlargest(10, 'DƯ NỢ')['CIF_KH_VAY']
-    pivot_full['Top 10 dư nợ KHDN'] = pivot_full['CIF_KH_VAY'].apply(lambda x: 'x' if x in top5_khdn.values else '')
-
-    # --------------------------------------------------------
-    # NGÀY ĐỊNH GIÁ TSBĐ (R34) – DÙNG NGÀY ĐÁNH GIÁ NGƯỜI DÙNG NHẬP
-    # --------------------------------------------------------
-    loai_ts_r34 = ['BĐS', 'MMTB', 'PTVT']
-    mask_r34 = df_crm4_filtered['LOAI_TS'].isin(loai_ts_r34)
-
-    df_crm4_filtered['VALUATION_DATE'] = pd.to_datetime(df_crm4_filtered['VALUATION_DATE'], errors='coerce')
-
-    df_crm4_filtered.loc[mask_r34, 'SO_NGAY_QUA_HAN'] = (
-        (ngay_danh_gia - df_crm4_filtered.loc[mask_r34, 'VALUATION_DATE']).dt.days - 365
-    )
-
-    df_crm4_filtered.loc[df_crm4_filtered['LOAI_TS'] == 'BĐS', 'SO_THANG_QUA_HAN'] = (
-        ((ngay_danh_gia - df_crm4_filtered.loc[df_crm4_filtered['LOAI_TS'] == 'BĐS', 'VALUATION_DATE']).dt.days / 31) - 18
-    )
-
-    df_crm4_filtered.loc[df_crm4_filtered['LOAI_TS'].isin(['MMTB', 'PTVT']), 'SO_THANG_QUA_HAN'] = (
-        ((ngay_danh_gia - df_crm4_filtered.loc[df_crm4_filtered['LOAI_TS'].isin(['MMTB', 'PTVT']), 'VALUATION_DATE']).dt.days / 31) - 12
-    )
-
-    cif_quahan = df_crm4_filtered[
-        df_crm4_filtered['SO_THANG_QUA_HAN'] > 0
-    ]['CIF_KH_VAY'].unique()
-
-    pivot_full['KH có TSBĐ quá hạn định giá'] = pivot_full['CIF_KH_VAY'].apply(
-        lambda x: 'X' if x in cif_quahan else ''
-    )
-
-    # --------------------------------------------------------
-    # TSBĐ KHÁC ĐỊA BÀN (MỤC 17)
-    # --------------------------------------------------------
-    df_sol = pd.read_excel(df_sol_file_upload)
-    ds_secu = df_crm4_filtered['SECU_SRL_NUM'].dropna().unique()
-    df_17_filtered = df_sol[df_sol['C01'].isin(ds_secu)]
-
-    df_bds = df_17_filtered[df_17_filtered['C02'].str.strip() == 'Bat dong san'].copy()
-    df_bds_matched = df_bds[df_bds['C01'].isin(df_crm4['SECU_SRL_NUM'])].copy()
-
-    def extract_tinh_thanh(diachi):
-        if pd.isna(diachi):
-            return ''
-        parts = str(diachi).split(',')
-        return parts[-1].strip().lower() if parts else ''
-
-    df_bds_matched['TINH_TP_TSBD'] = df_bds_matched['C19'].apply(extract_tinh_thanh)
-
-    df_bds_matched['CANH_BAO_TS_KHAC_DIABAN'] = df_bds_matched['TINH_TP_TSBD'].apply(
-        lambda x: 'x' if x and x.strip().lower() not in dia_ban_kt else ''
-    )
-
-    ma_ts_canh_bao = df_bds_matched[df_bds_matched['CANH_BAO_TS_KHAC_DIABAN'] == 'x']['C01'].unique()
-    cif_canh_bao = df_crm4[df_crm4['SECU_SRL_NUM'].isin(ma_ts_canh_bao)]['CIF_KH_VAY'].dropna().unique()
-
-    pivot_full['KH có TSBĐ khác địa bàn'] = pivot_full['CIF_KH_VAY'].apply(
-        lambda x: 'x' if x in cif_canh_bao else ''
-    )
-
-    # --------------------------------------------------------
-    # MỤC 55 & 56 – TẤT TOÁN / GIẢI NGÂN
-    # --------------------------------------------------------
-    df_55 = pd.read_excel(df_55_file_upload)
-    df_56 = pd.read_excel(df_56_file_upload)
-
-    df_tt = df_55[['CUSTSEQLN', 'NMLOC', 'KHE_UOC', 'SOTIENGIAINGAN', 'NGAYGN', 'NGAYDH', 'NGAY_TT', 'LOAITIEN']].copy()
-    df_tt.columns = ['CIF', 'TEN_KHACH_HANG', 'KHE_UOC', 'SO_TIEN_GIAI_NGAN_VND',
-                     'NGAY_GIAI_NGAN', 'NGAY_DAO_HAN', 'NGAY_TT', 'LOAI_TIEN_HD']
-    df_tt['GIAI_NGAN_TT'] = 'Tất toán'
-    df_tt['NGAY'] = pd.to_datetime(df_tt['NGAY_TT'], errors='coerce')
-
-    df_gn = df_56[['CIF', 'TEN_KHACH_HANG', 'KHE_UOC', 'SO_TIEN_GIAI_NGAN_VND',
-                   'NGAY_GIAI_NGAN', 'NGAY_DAO_HAN', 'LOAI_TIEN_HD']].copy()
-    df_gn['GIAI_NGAN_TT'] = 'Giải ngân'
-    df_gn['NGAY_GIAI_NGAN'] = pd.to_datetime(df_gn['NGAY_GIAI_NGAN'], format='%Y%m%d', errors='coerce')
-    df_gn['NGAY_DAO_HAN'] = pd.to_datetime(df_gn['NGAY_DAO_HAN'], format='%Y%m%d', errors='coerce')
-    df_gn['NGAY'] = df_gn['NGAY_GIAI_NGAN']
-
-    df_gop = pd.concat([df_tt, df_gn], ignore_index=True)
-    df_gop = df_gop[df_gop['NGAY'].notna()]
-    df_gop = df_gop.sort_values(by=['CIF', 'NGAY', 'GIAI_NGAN_TT'])
-
-    df_count = df_gop.groupby(['CIF', 'NGAY', 'GIAI_NGAN_TT']).size().unstack(fill_value=0).reset_index()
-    df_count['CO_CA_GN_VA_TT'] = ((df_count.get('Giải ngân', 0) > 0) & (df_count.get('Tất toán', 0) > 0)).astype(int)
-
-    df_count['CIF'] = df_count['CIF'].astype(str)
-    df_gop['CIF'] = df_gop['CIF'].astype(str)
-    df_tt['CIF'] = df_tt['CIF'].astype(str)
-    df_gn['CIF'] = df_gn['CIF'].astype(str)
-
-    ds_ca_gn_tt = df_count[df_count['CO_CA_GN_VA_TT'] == 1]['CIF'].astype(str).unique()
-
-    pivot_full['CIF_KH_VAY'] = pivot_full['CIF_KH_VAY'].astype(str)
-    pivot_full['KH có cả GNG và TT trong 1 ngày'] = pivot_full['CIF_KH_VAY'].apply(
-        lambda x: 'x' if x in ds_ca_gn_tt else ''
-    )
-
-    # --------------------------------------------------------
-    # MỤC 57 – CHẬM TRẢ
-    # --------------------------------------------------------
-    df_delay = pd.read_excel(df_57_file_upload)
-
-    df_delay['NGAY_DEN_HAN_TT'] = pd.to_datetime(df_delay['NGAY_DEN_HAN_TT'], errors='coerce')
-    df_delay['NGAY_THANH_TOAN'] = pd.to_datetime(df_delay['NGAY_THANH_TOAN'], errors='coerce')
-
-    df_delay['NGAY_THANH_TOAN_FILL'] = df_delay['NGAY_THANH_TOAN'].fillna(ngay_danh_gia)
-    df_delay['SO_NGAY_CHAM_TRA'] = (df_delay['NGAY_THANH_TOAN_FILL'] - df_delay['NGAY_DEN_HAN_TT']).dt.days
-
-    mask_period = df_delay['NGAY_DEN_HAN_TT'].dt.year.between(2023, 2025)
-    df_delay = df_delay[mask_period].copy()
-
-    df_crm32_tmp = pivot_full.copy()
-    df_crm32_tmp = df_crm32_tmp.rename(columns={'CIF_KH_VAY': 'CIF_ID'})
-
-    df_crm32_tmp['CIF_ID'] = df_crm32_tmp['CIF_ID'].astype(str)
-    df_delay['CIF_ID'] = df_delay['CIF_ID'].astype(str)
-
-    df_delay = df_delay.merge(
-        df_crm32_tmp[['CIF_ID', 'DƯ NỢ', 'NHOM_NO']],
-        on='CIF_ID', how='left'
-    )
-
-    df_delay = df_delay[df_delay['NHOM_NO'] == 1].copy()
-
-    def cap_cham_tra(days):
-        if pd.isna(days):
-            return None
-        elif days >= 10:
-            return '>=10'
-        elif days >= 4:
-            return '4-9'
-        elif days > 0:
-            return '<4'
-        else:
-            return None
-
-    df_delay['CAP_CHAM_TRA'] = df_delay['SO_NGAY_CHAM_TRA'].apply(cap_cham_tra)
-    df_delay = df_delay.dropna(subset=['CAP_CHAM_TRA']).copy()
-
-    df_delay['NGAY'] = df_delay['NGAY_DEN_HAN_TT'].dt.date
-    df_delay.sort_values(['CIF_ID', 'NGAY', 'CAP_CHAM_TRA'],
-                         key=lambda s: s.map({'>=10': 0, '4-9': 1, '<4': 2}),
-                         inplace=True)
-    df_unique = df_delay.drop_duplicates(subset=['CIF_ID', 'NGAY'], keep='first').copy()
-
-    df_dem = df_unique.groupby(['CIF_ID', 'CAP_CHAM_TRA']).size().unstack(fill_value=0)
-
-    df_dem['KH Phát sinh chậm trả > 10 ngày'] = np.where(df_dem.get('>=10', 0) > 0, 'x', '')
-    df_dem['KH Phát sinh chậm trả 4-9 ngày'] = np.where(
-        (df_dem.get('>=10', 0) == 0) & (df_dem.get('4-9', 0) > 0), 'x', ''
+dang_nap += nap_file(df_57_file_upload, 'muc57')
+
+# Chỉ giữ hash của các file còn đang upload trong phiên
+ds_upload = [
+    f for up in (crm4_files, crm32_files, df_muc_dich_file_upload, df_code_tsbd_file_upload,
+                 df_giai_ngan_file_upload, df_sol_file_upload, df_55_file_upload, df_56_file_upload,
+                 df_57_file_upload)
+    for f in (up if isinstance(up, list) else [up] if up is not None else [])
+]
+dang_upload = {getattr(f, "file_id", None) for f in ds_upload}
+st.session_state["hash_upload"] = {
+    k: v for k, v in st.session_state.get("hash_upload", {}).items() if k in dang_upload
+}
+
+# ------------------------------------------------------------
+# Kiểm tra trước dòng tiêu đề của mọi file đã upload (kiem_tra_truoc.py)
+# ------------------------------------------------------------
+# Chỉ đọc dòng 1 nên mất vài ms; file thiếu / đổi tên cột bị chặn trước khi chạy
+loi_tieu_de, tg_kiem_tra = kiem_tra_uploads({
+    'crm4': crm4_files,
+    'crm32': crm32_files,
+    'muc_dich': df_muc_dich_file_upload,
+    'code_tsbd': df_code_tsbd_file_upload,
+    'giai_ngan': df_giai_ngan_file_upload,
+    'muc17': df_sol_file_upload,
+    'muc55': df_55_file_upload,
+    'muc56': df_56_file_upload,
+    'muc57': df_57_file_upload,
+}, kiem_tra=lambda f, loai: _kiem_tra_tieu_de(f, _hash_upload(f), loai))
+if loi_tieu_de:
+    st.sidebar.error(
+        "❌ Sai cấu trúc cột:\n" + "\n".join(
+            f"- **{ten}**: {'; '.join(loi)}" for ten, loi in loi_tieu_de.items()
+        )
     )
+else:
+    st.sidebar.caption(f"✅ Tiêu đề cột các file đã upload hợp lệ ({tg_kiem_tra}s)")
 
-    pivot_full['CIF_KH_VAY'] = pivot_full['CIF_KH_VAY'].astype(str)
-
-    cols_to_merge = ['KH Phát sinh chậm trả > 10 ngày', 'KH Phát sinh chậm trả 4-9 ngày']
-    cols_to_merge_existing = [col for col in cols_to_merge if col in df_dem.columns]
-
-    if cols_to_merge_existing:
-        pivot_full = pivot_full.merge(
-            df_dem[cols_to_merge_existing],
-            left_on='CIF_KH_VAY', right_index=True, how='left'
-        )
+luu_lich_su = st.sidebar.checkbox(
+    "💾 Lưu kết quả vào lịch sử kiểm toán",
+    value=False,
+    help="Tùy chọn, mặc định tắt: lưu CIF, cờ tiêu chí và CRM4/CRM32 đã lọc của kỳ này (chi nhánh + ngày "
+         "đánh giá) để so sánh với các kỳ sau. Ghi SQLite sau khi xử lý xong nên mỗi lần chạy lâu hơn."
+)
 
-    for col in cols_to_merge_existing:
-        pivot_full[col] = pivot_full[col].fillna('')
-
-    # --------------------------------------------------------
-    # TRẢ VỀ CÁC BẢNG KẾT QUẢ
-    # --------------------------------------------------------
-    return {
-        "df_crm4_filtered": df_crm4_filtered,
-        "pivot_final": pivot_final,
-        "pivot_merge": pivot_merge,
-        "df_crm32_filtered": df_crm32_filtered,
-        "pivot_full": pivot_full,
-        "pivot_mucdich": pivot_mucdich,
-        "df_delay": df_delay,
-        "df_gop": df_gop,
-        "df_count": df_count,
-        "df_bds_matched": df_bds_matched
-    }
+run_button = st.sidebar.button("▶️ Chạy xử lý dữ liệu")
 
 # ============================================================
 # 3. CHẠY XỬ LÝ KHI NGƯỜI DÙNG BẤM NÚT
@@ -517,9 +341,9 @@ if run_button:
         missing.append("CRM4 files")
     if not crm32_files:
         missing.append("CRM32 files")
-    if df_muc_dich_file_upload is None:
+    if df_muc_dich_file_upload is None and bang_ma.tim_phien_ban('muc_dich', ngay_danh_gia) is None:
         missing.append("CODE_MDSDV4.xlsx")
-    if df_code_tsbd_file_upload is None:
+    if df_code_tsbd_file_upload is None and bang_ma.tim_phien_ban('code_tsbd', ngay_danh_gia) is None:
         missing.append("CODE_LOAI TSBD.xlsx")
     if df_giai_ngan_file_upload is None:
         missing.append("Giai_ngan_tien_mat_1_ty 6.xls")
@@ -538,7 +362,11 @@ if run_button:
 
     if missing:
         st.error("❌ Thiếu dữ liệu/thiết lập: " + ", ".join(missing))
+    elif loi_tieu_de:
+        st.error("❌ Có file sai cấu trúc cột (xem chi tiết ở sidebar), chưa chạy xử lý.")
     else:
+        with st.spinner("Đang đợi đọc xong các file đã upload..."):
+            wait(dang_nap)
         with st.spinner("Đang xử lý dữ liệu..."):
             results = process_data(
                 crm4_files,
@@ -552,99 +380,232 @@ if run_button:
                 df_57_file_upload,
                 chi_nhanh,
                 ngay_danh_gia,
-                dia_ban_kt
+                dia_ban_kt,
+                so_tien_trinh=int(so_tien_trinh),
+                do_bo_nho=do_bo_nho,
+                so_ngay_gn_tt=int(so_ngay_gn_tt),
+                gn_tt_cung_khe_uoc=gn_tt_cung_khe_uoc,
+                ky_cham_tra=tuple(ky_cham_tra),
+                moc_cham_tra=moc_cham_tra,
+                che_do=che_do,
+                # Bộ nhớ đệm giai đoạn chung theo bộ file (trong ngân sách ket_qua_chung):
+                # chỉ đổi ngày đánh giá / địa bàn -> chỉ tính lại R34, Mục 17, Mục 57
+                dung_chung=True
             )
 
-        st.success("✅ Đã xử lý xong!")
-
-        df_crm4_filtered = results["df_crm4_filtered"]
-        pivot_final = results["pivot_final"]
-        pivot_merge = results["pivot_merge"]
-        df_crm32_filtered = results["df_crm32_filtered"]
-        pivot_full = results["pivot_full"]
-        pivot_mucdich = results["pivot_mucdich"]
-        df_delay = results["df_delay"]
-        df_gop = results["df_gop"]
-        df_count = results["df_count"]
-        df_bds_matched = results["df_bds_matched"]
-
-        # ====================================================
-        # HIỂN THỊ CÁC BẢNG CHÍNH (SỬ DỤNG TAB)
-        # ====================================================
-        tab1, tab2, tab3, tab4, tab5, tab6, tab7 = st.tabs([
-            "KQ_KH (pivot_full)",
-            "KQ_CRM4 (pivot_final)",
-            "Pivot CRM4 (pivot_merge)",
-            "Pivot CRM32 (pivot_mucdich)",
-            "df_crm4_LOAI_TS",
-            "Cảnh báo / tiêu chí",
-            "df_crm32_LOAI_TS"
-        ])
-
-        with tab1:
-            st.subheader("KQ_KH – Tổng hợp theo CIF (pivot_full)")
-            st.dataframe(pivot_full)
-
-        with tab2:
-            st.subheader("KQ_CRM4 – Thông tin theo CIF từ CRM4")
-            st.dataframe(pivot_final)
-
-        with tab3:
-            st.subheader("Pivot_crm4 – Dư nợ & Giá trị TS theo loại TS")
-            st.dataframe(pivot_merge)
-
-        with tab4:
-            st.subheader("Pivot_crm32 – Dư nợ theo mục đích CRM32")
-            st.dataframe(pivot_mucdich)
-
-        with tab5:
-            st.subheader("df_crm4_LOAI_TS – CRM4 sau khi gán loại TS")
-            st.dataframe(df_crm4_filtered)
-
-        with tab6:
-            st.subheader("Tiêu chí 4 – Chậm trả (df_delay)")
-            st.dataframe(df_delay)
-
-            st.subheader("Tiêu chí 3_đợt 3 – Gộp GN/TT (df_gop)")
-            st.dataframe(df_gop)
-
-            st.subheader("Tiêu chí 3_đợt 3_1 – Đếm GN/TT theo ngày (df_count)")
-            st.dataframe(df_count)
-
-            st.subheader("Tiêu chí 2_đợt 3 – TSBĐ khác địa bàn (df_bds_matched)")
-            st.dataframe(df_bds_matched)
-
-        with tab7:
-            st.subheader("df_crm32_LOAI_TS – CRM32 sau khi gán mục đích vay")
-            st.dataframe(df_crm32_filtered)
-
-        # ====================================================
-        # XUẤT FILE EXCEL GIỐNG SCRIPT GỐC
-        # ====================================================
-        st.markdown("---")
-        st.subheader("📤 Xuất file Excel tổng hợp")
-
-        buffer = io.BytesIO()
-        with pd.ExcelWriter(buffer, engine='openpyxl') as writer:
-            df_crm4_filtered.to_excel(writer, sheet_name='df_crm4_LOAI_TS', index=False)
-            pivot_final.to_excel(writer, sheet_name='KQ_CRM4', index=False)
-            pivot_merge.to_excel(writer, sheet_name='Pivot_crm4', index=False)
-            df_crm32_filtered.to_excel(writer, sheet_name='df_crm32_LOAI_TS', index=False)
-            pivot_full.to_excel(writer, sheet_name='KQ_KH', index=False)
-            pivot_mucdich.to_excel(writer, sheet_name='Pivot_crm32', index=False)
-            df_delay.to_excel(writer, sheet_name='tieu chi 4', index=False)
-            df_gop.to_excel(writer, sheet_name='tieu chi 3_dot3', index=False)
-            df_count.to_excel(writer, sheet_name='tieu chi 3_dot3_1', index=False)
-            df_bds_matched.to_excel(writer, sheet_name='tieu chi 2_dot3', index=False)
-
-        buffer.seek(0)
-
-        st.download_button(
-            label="⬇️ Tải file KQ_1405_.xlsx",
-            data=buffer,
-            file_name="KQ_1405_.xlsx",
-            mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-        )
+        if results["dung_lai_ket_qua_chung"]:
+            st.info("♻️ Cùng bộ file và tham số đã được xử lý trong phiên khác – dùng lại kết quả chung.")
+        else:
+            # Nhật ký thời gian/bộ nhớ từng giai đoạn (JSON lines) để so sánh giữa các lần chạy
+            ghi_log(
+                results["tg_giai_doan"],
+                chi_nhanh=chi_nhanh,
+                ngay_danh_gia=ngay_danh_gia,
+                dia_ban_kt=dia_ban_kt,
+                so_file_crm4=len(crm4_files),
+                so_file_crm32=len(crm32_files)
+            )
 
-else:
+        # Lưu kỳ này vào kho lịch sử (chạy lại cùng chi nhánh + ngày -> ghi đè)
+        st.session_state["ky_hien_tai"] = {"chi_nhanh": chi_nhanh, "ngay_danh_gia": ngay_danh_gia, "ky_id": None}
+        if luu_lich_su:
+            try:
+                st.session_state["ky_hien_tai"]["ky_id"] = lich_su.luu_ky(
+                    results, chi_nhanh, ngay_danh_gia, dia_ban_kt
+                )
+            except Exception as e:
+                st.warning(f"⚠️ Không lưu được lịch sử kiểm toán: {e}")
+
+        st.session_state["results"] = results
+        # Thế hệ kết quả: bảng xem theo trang (viewer.py) bỏ vị trí dòng đã lọc/sắp xếp cũ
+        st.session_state["the_he_ket_qua"] = st.session_state.get("the_he_ket_qua", 0) + 1
+        # Kết quả mới -> bỏ các file xuất của lần chạy trước
+        st.session_state["export_jobs"] = {}
+
+# ============================================================
+# 4. HIỂN THỊ KẾT QUẢ (GIỮ TRONG SESSION GIỮA CÁC LẦN RERUN)
+# ============================================================
+
+@st.cache_resource
+def _export_executor():
+    # Luồng nền dùng chung để tạo file xuất, không chặn giao diện
+    return ThreadPoolExecutor(max_workers=2)
+
+
+@st.fragment(run_every=1)
+def _cho_xuat_file(future, nhan):
+    # Chỉ hiển thị khi có file đang tạo: kiểm tra mỗi giây, xong thì rerun để hiện nút tải
+    if future.done():
+        st.rerun()
+    st.caption(f"⏳ Đang tạo {nhan}...")
+
+
+def khu_xuat_file(results):
+    # Chỉ tạo file khi người dùng yêu cầu, chạy ở luồng nền
+    jobs = st.session_state.setdefault("export_jobs", {})
+    cols = st.columns(len(DINH_DANG_XUAT))
+
+    for col, (ma, (nhan, file_name, mime, ham)) in zip(cols, DINH_DANG_XUAT.items()):
+        with col:
+            future = jobs.get(ma)
+            if future is None:
+                if st.button(f"⚙️ Tạo {nhan}", key=f"tao_{ma}"):
+                    jobs[ma] = _export_executor().submit(ham, results)
+                    st.rerun()
+            elif not future.done():
+                _cho_xuat_file(future, nhan)
+            elif future.exception() is not None:
+                st.error(f"❌ Lỗi khi tạo {nhan}: {future.exception()}")
+                if st.button("Thử lại", key=f"lai_{ma}"):
+                    jobs.pop(ma)
+                    st.rerun()
+            else:
+                st.download_button(
+                    label=f"⬇️ Tải {file_name}",
+                    data=future.result(),
+                    file_name=file_name,
+                    mime=mime,
+                    key=f"tai_{ma}"
+                )
+
+
+def khu_lich_su(ky_hien_tai, the_he):
+    # So sánh kỳ vừa chạy với một kỳ đã lưu của cùng chi nhánh (truy vấn SQLite)
+    if not ky_hien_tai or ky_hien_tai["ky_id"] is None:
+        st.info("Kỳ này chưa được lưu vào lịch sử (bật “Lưu kết quả vào lịch sử kiểm toán” rồi chạy lại).")
+        return
+
+    ky_id = ky_hien_tai["ky_id"]
+    ds = lich_su.ds_ky(ky_hien_tai["chi_nhanh"])
+    ds = ds[ds["ky_id"] != ky_id]
+    if ds.empty:
+        st.info(f"Chưa có kỳ nào khác của chi nhánh {ky_hien_tai['chi_nhanh']} trong lịch sử.")
+        return
+
+    ky_mac_dinh = lich_su.ky_truoc(ky_hien_tai["chi_nhanh"], ky_hien_tai["ngay_danh_gia"])
+    ds_id = ds["ky_id"].tolist()
+    nhan = dict(zip(ds["ky_id"], ds["ngay_danh_gia"]))
+    ky_so_sanh = st.selectbox(
+        "So sánh với kỳ (ngày đánh giá)",
+        ds_id,
+        index=ds_id.index(ky_mac_dinh) if ky_mac_dinh in ds_id else len(ds_id) - 1,
+        format_func=nhan.get,
+        key="ky_so_sanh"
+    )
+
+    # Bảng so sánh chỉ đổi khi có kết quả mới hoặc chọn kỳ khác
+    the_he = (the_he, ky_so_sanh)
+    df_co = lich_su.thay_doi_co(ky_id, ky_so_sanh)
+    st.subheader("Cờ tiêu chí thay đổi")
+    if not df_co.empty:
+        st.dataframe(pd.crosstab(df_co["tieu_chi"], df_co["thay_doi"]))
+    hien_thi_bang(df_co, key="ls_thay_doi_co", the_he=the_he)
+
+    st.subheader("CIF mới so với kỳ được chọn")
+    hien_thi_bang(lich_su.cif_moi(ky_id, ky_so_sanh), key="ls_cif_moi", the_he=the_he)
+
+    st.subheader("CIF không còn ở kỳ này")
+    hien_thi_bang(lich_su.cif_moi(ky_so_sanh, ky_id), key="ls_cif_mat", the_he=the_he)
+
+    st.subheader("Dư nợ / nhóm nợ thay đổi")
+    hien_thi_bang(lich_su.thay_doi_du_no(ky_id, ky_so_sanh), key="ls_du_no", the_he=the_he)
+
+    cif = st.text_input("Tra cứu diễn biến một CIF qua các kỳ", key="ls_cif")
+    if cif.strip():
+        st.dataframe(lich_su.lich_su_cif(cif.strip()), hide_index=True)
+
+
+results = st.session_state.get("results")
+
+if results is not None:
+    st.success("✅ Đã xử lý xong!")
+
+    with st.sidebar.expander("⏱️ Thời gian xử lý từng giai đoạn"):
+        tg = results["tg_giai_doan"]
+        st.caption(f"Tổng: {tg['giay'].sum():.2f} giây · CPU {tg['cpu_giay'].sum():.2f} giây")
+        st.dataframe(tg, hide_index=True)
+
+    with st.expander("⏱️ Thời gian đọc từng file CRM4/CRM32"):
+        st.dataframe(results["tg_doc_file"])
+
+    with st.expander("💾 Bộ nhớ dữ liệu đầu vào sau khi thu gọn"):
+        st.dataframe(results["bao_cao_bo_nho"])
+
+    the_he = st.session_state.get("the_he_ket_qua", 0)
+    df_crm4_filtered = results["df_crm4_filtered"]
+    pivot_final = results["pivot_final"]
+    pivot_merge = results["pivot_merge"]
+    df_crm32_filtered = results["df_crm32_filtered"]
+    pivot_full = results["pivot_full"]
+    pivot_mucdich = results["pivot_mucdich"]
+    df_delay = results["df_delay"]
+    df_gop = results["df_gop"]
+    df_count = results["df_count"]
+    df_bds_matched = results["df_bds_matched"]
+
+    # ====================================================
+    # HIỂN THỊ CÁC BẢNG CHÍNH (SỬ DỤNG TAB)
+    # ====================================================
+    tab1, tab2, tab3, tab4, tab5, tab6, tab7, tab8 = st.tabs([
+        "KQ_KH (pivot_full)",
+        "KQ_CRM4 (pivot_final)",
+        "Pivot CRM4 (pivot_merge)",
+        "Pivot CRM32 (pivot_mucdich)",
+        "df_crm4_LOAI_TS",
+        "Cảnh báo / tiêu chí",
+        "df_crm32_LOAI_TS",
+        "Lịch sử & so sánh kỳ trước"
+    ])
+
+    with tab1:
+        st.subheader("KQ_KH – Tổng hợp theo CIF (pivot_full)")
+        st.dataframe(pd.DataFrame([dem_tieu_chi(pivot_full)], index=['Số KH']))
+        hien_thi_bang(pivot_full, key="kq_kh", the_he=the_he)
+
+    with tab2:
+        st.subheader("KQ_CRM4 – Thông tin theo CIF từ CRM4")
+        hien_thi_bang(pivot_final, key="kq_crm4", the_he=the_he)
+
+    with tab3:
+        st.subheader("Pivot_crm4 – Dư nợ & Giá trị TS theo loại TS")
+        hien_thi_bang(pivot_merge, key="pivot_crm4", the_he=the_he)
+
+    with tab4:
+        st.subheader("Pivot_crm32 – Dư nợ theo mục đích CRM32")
+        hien_thi_bang(pivot_mucdich, key="pivot_crm32", the_he=the_he)
+
+    with tab5:
+        st.subheader("df_crm4_LOAI_TS – CRM4 sau khi gán loại TS")
+        hien_thi_bang(df_crm4_filtered, key="crm4_loai_ts", the_he=the_he)
+
+    with tab6:
+        st.subheader("Tiêu chí 4 – Chậm trả (df_delay)")
+        hien_thi_bang(df_delay, key="tieu_chi_4", the_he=the_he)
+
+        st.subheader("Tiêu chí 3_đợt 3 – Gộp GN/TT (df_gop)")
+        hien_thi_bang(df_gop, key="tieu_chi_3", the_he=the_he)
+
+        st.subheader("Tiêu chí 3_đợt 3_1 – Đếm GN/TT theo ngày (df_count)")
+        hien_thi_bang(df_count, key="tieu_chi_3_1", the_he=the_he)
+
+        st.subheader("Tiêu chí 2_đợt 3 – TSBĐ khác địa bàn (df_bds_matched)")
+        hien_thi_bang(df_bds_matched, key="tieu_chi_2", the_he=the_he)
+
+    with tab7:
+        st.subheader("df_crm32_LOAI_TS – CRM32 sau khi gán mục đích vay")
+        hien_thi_bang(df_crm32_filtered, key="crm32_loai_ts", the_he=the_he)
+
+    with tab8:
+        khu_lich_su(st.session_state.get("ky_hien_tai"), the_he)
+
+    # ====================================================
+    # XUẤT FILE (CHỈ TẠO KHI ĐƯỢC YÊU CẦU, CHẠY NỀN)
+    # ====================================================
+    st.markdown("---")
+    st.subheader("📤 Xuất file tổng hợp")
+    st.caption("Excel giữ đúng định dạng file gốc; ZIP Parquet/CSV ghi nhanh hơn nhiều với bảng chi tiết lớn.")
+
+    khu_xuat_file(results)
+
+elif not run_button:
     st.info("👈 Vui lòng upload đầy đủ file, nhập chi nhánh / ngày đánh giá / địa bàn, rồi bấm **“Chạy xử lý dữ liệu”** ở sidebar.")
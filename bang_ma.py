@@ -0,0 +1,137 @@
+# bang_ma.py
+
+import argparse
+import os
+import threading
+import uuid
+
+import pandas as pd
+
+from excel_cache import read_excel_cached
+from schema import read_kwargs
+
+# ============================================================
+# KHO BẢNG MÃ (CODE_MDSDV4, CODE_LOAI TSBD) – THEO NGÀY HIỆU LỰC
+# ============================================================
+# Hai bảng mã ít thay đổi nên không cần upload và parse Excel mỗi lần chạy:
+#   - mỗi phiên bản lưu thành một file Parquet <THU_MUC>/<loại>/<YYYY-MM-DD>.parquet
+#     (ngày hiệu lực), chỉ gồm hai cột mã -> giá trị như trong file gốc
+#   - lúc chạy lấy phiên bản có ngày hiệu lực gần nhất không sau ngày đánh
+#     giá; mỗi file chỉ đọc một lần trong mỗi tiến trình server (nhớ theo
+#     đường dẫn + thời điểm sửa file)
+#   - bảng mã dùng dạng Series mã -> giá trị (bang_tra_cuu), gán LOAI_TS /
+#     MUC DICH bằng Series.map thay cho merge
+# Upload file bảng mã vẫn được ưu tiên (và có thể lưu thành phiên bản mới).
+#
+# Ví dụ:
+#   python bang_ma.py luu code_tsbd "CODE_LOAI TSBD.xlsx" --hieu-luc 2025-07-01
+#   python bang_ma.py ds
+
+THU_MUC = os.environ.get(
+    "CRM_BANG_MA_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".bang_ma")
+)
+
+# Loại bảng mã -> (cột mã, cột giá trị)
+BANG_MA = {
+    'muc_dich': ('CODE_MDSDV4', 'GROUP'),
+    'code_tsbd': ('CODE CAP 2', 'CODE'),
+}
+
+# Bảng mã đã nạp: đường dẫn -> (mtime, DataFrame); ghi đè phiên bản thì thay bản cũ
+_DA_NAP = {}
+_KHOA_NAP = threading.Lock()
+
+
+def _duong_dan(loai, hieu_luc):
+    return os.path.join(THU_MUC, loai, f"{pd.Timestamp(hieu_luc):%Y-%m-%d}.parquet")
+
+
+def luu_phien_ban(loai, f, hieu_luc):
+    # f: file Excel (upload / đường dẫn) hoặc DataFrame đã đọc; lưu cùng ngày hiệu lực thì ghi đè
+    df = f if isinstance(f, pd.DataFrame) else read_excel_cached(f, **read_kwargs(loai))
+    df = df[list(BANG_MA[loai])].reset_index(drop=True)
+
+    path = _duong_dan(loai, hieu_luc)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    try:
+        df.to_parquet(tmp_path, index=False)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return path
+
+
+def ds_phien_ban(loai=None):
+    dong = []
+    for ten in ([loai] if loai else BANG_MA):
+        thu_muc = os.path.join(THU_MUC, ten)
+        if not os.path.isdir(thu_muc):
+            continue
+        for file in os.listdir(thu_muc):
+            if file.endswith('.parquet'):
+                dong.append({
+                    'loai': ten,
+                    'hieu_luc': pd.Timestamp(file[:-len('.parquet')]),
+                    'duong_dan': os.path.join(thu_muc, file),
+                })
+    return pd.DataFrame(dong, columns=['loai', 'hieu_luc', 'duong_dan']).sort_values(['loai', 'hieu_luc'], ignore_index=True)
+
+
+def tim_phien_ban(loai, ngay=None):
+    # Phiên bản hiệu lực tại ngày (mới nhất nếu ngay=None); None nếu kho chưa có
+    ds = ds_phien_ban(loai)
+    if ngay is not None:
+        ds = ds[ds['hieu_luc'] <= pd.Timestamp(ngay)]
+    return None if ds.empty else ds.iloc[-1]
+
+
+def nap(loai, ngay=None):
+    # DataFrame bảng mã như đọc từ file Excel; attrs['phien_ban'] dùng làm khóa thay cho hash file
+    phien_ban = tim_phien_ban(loai, ngay)
+    if phien_ban is None:
+        return None
+    path = phien_ban['duong_dan']
+    mtime = os.stat(path).st_mtime_ns
+    with _KHOA_NAP:
+        da_nap = _DA_NAP.get(path)
+        if da_nap is not None and da_nap[0] == mtime:
+            return da_nap[1]
+        df = pd.read_parquet(path)
+        df.attrs['phien_ban'] = f"{loai}@{phien_ban['hieu_luc']:%Y-%m-%d}#{mtime}"
+        _DA_NAP[path] = (mtime, df)
+    return df
+
+
+def bang_tra_cuu(df, loai):
+    # Series mã -> giá trị (bảng băm cho Series.map); mã trùng lấy dòng đầu, bỏ mã rỗng
+    cot_ma, cot_gia_tri = BANG_MA[loai]
+    bang = df[[cot_ma, cot_gia_tri]].dropna(subset=[cot_ma]).drop_duplicates(subset=[cot_ma])
+    return pd.Series(bang[cot_gia_tri].to_numpy(), index=pd.Index(bang[cot_ma]), dtype=bang[cot_gia_tri].dtype)
+
+
+def tra_ma(s, bang):
+    # Giá trị bảng mã cho từng dòng của s (NaN khi không có mã), cùng kiểu với cột giá trị
+    return s.map(bang).astype(bang.dtype)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Kho bảng mã CODE_MDSDV4 / CODE_LOAI TSBD theo ngày hiệu lực")
+    lenh = parser.add_subparsers(dest='lenh', required=True)
+    luu = lenh.add_parser('luu', help="Lưu file bảng mã thành một phiên bản")
+    luu.add_argument('loai', choices=list(BANG_MA))
+    luu.add_argument('file', help="File Excel bảng mã")
+    luu.add_argument('--hieu-luc', required=True, help="Ngày hiệu lực (YYYY-MM-DD)")
+    lenh.add_parser('ds', help="Liệt kê các phiên bản trong kho")
+    args = parser.parse_args(argv)
+
+    if args.lenh == 'luu':
+        print(luu_phien_ban(args.loai, args.file, args.hieu_luc))
+    else:
+        print(ds_phien_ban().to_string(index=False))
+
+
+if __name__ == '__main__':
+    main()
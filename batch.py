@@ -0,0 +1,250 @@
+# batch.py
+
+import argparse
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+from cham_tra import KY_CHAM_TRA, MOC_CHAM_TRA, moc_hop_le
+from ingest import DEFAULT_WORKERS
+from kiem_tra_truoc import kiem_tra_uploads
+from export import xuat_excel_kq_streaming
+import lich_su
+from pipeline import (
+    CHE_DO_XU_LY, chia_theo_chi_nhanh, chon_bang_ma, dem_tieu_chi, doc_du_lieu, doc_du_lieu_ngoai_bo_nho,
+    giai_doan_chung, xu_ly_chi_nhanh
+)
+
+# ============================================================
+# CHẠY HÀNG LOẠT NHIỀU CHI NHÁNH (KHÔNG CẦN GIAO DIỆN STREAMLIT)
+# ============================================================
+# Đọc file toàn hàng một lần, chia CRM4/CRM32 theo chi nhánh bằng groupby,
+# xử lý song song từng chi nhánh trên nhiều tiến trình và xuất:
+#   - KQ_<chi nhánh>.xlsx cho từng chi nhánh (cùng định dạng file tải từ app)
+#   - TONG_HOP.xlsx: mỗi chi nhánh một dòng (số CIF, dư nợ, số KH theo tiêu chí)
+#   - --luu-lich-su: lưu thêm từng chi nhánh thành một kỳ trong kho lịch sử SQLite (lich_su.py)
+#   - bỏ --muc-dich / --code-tsbd: dùng kho bảng mã theo ngày đánh giá (bang_ma.py)
+#   - trước khi đọc, kiểm tra dòng tiêu đề của mọi file (kiem_tra_truoc.py), sai cột thì dừng ngay
+#
+# Ví dụ:
+#   python batch.py --crm4 CRM4_*.xlsx --crm32 RPT_CRM_32*.xlsx \
+#       --muc-dich CODE_MDSDV4.xlsx --code-tsbd "CODE_LOAI TSBD.xlsx" \
+#       --giai-ngan "Giai_ngan_tien_mat_1_ty 6.xls" --muc17 "Muc17_Lop2_TSTC 4.xlsx" \
+#       --muc55 Muc55_1405.xlsx --muc56 Muc56_1405.xlsx --muc57 Muc57_1405.xlsx \
+#       --ngay-danh-gia 2025-09-30 --dia-ban "Hồ Chí Minh, Long An" \
+#       --chi-nhanh @ds_chi_nhanh.txt --out ket_qua
+
+# Dữ liệu dùng chung cho mọi chi nhánh, nạp một lần vào mỗi tiến trình con;
+# _BO_NHO_CHUNG: kết quả các giai đoạn không phụ thuộc chi nhánh (Mục 55/56)
+_DU_LIEU_CHUNG = None
+_BO_NHO_CHUNG = None
+
+
+def _khoi_tao(du_lieu_chung, bo_nho_chung):
+    global _DU_LIEU_CHUNG, _BO_NHO_CHUNG
+    _DU_LIEU_CHUNG = du_lieu_chung
+    _BO_NHO_CHUNG = bo_nho_chung
+
+
+def _ten_file(chi_nhanh):
+    return re.sub(r'[^\w.-]+', '_', chi_nhanh)
+
+
+def tong_hop_chi_nhanh(chi_nhanh, results):
+    pivot_full = results['pivot_full']
+    dong = {
+        'CHI_NHANH': chi_nhanh,
+        'SO_CIF': pivot_full['CIF_KH_VAY'].nunique(),
+        'DƯ NỢ': pivot_full['DƯ NỢ'].sum(),
+        'DƯ NỢ CRM32': pivot_full['DƯ NỢ CRM32'].sum(),
+        'SO_CIF_LECH': int((pivot_full['LECH'] != 0).sum()),
+    }
+    dong.update(dem_tieu_chi(pivot_full))
+    return dong
+
+
+def _chay_mot_chi_nhanh(job):
+    chi_nhanh, df_crm4_filtered, df_crm32_filtered, ngay_danh_gia, dia_ban_kt, thu_muc, tham_so, lich_su_db = job
+    t0 = time.perf_counter()
+    try:
+        results = xu_ly_chi_nhanh(
+            _DU_LIEU_CHUNG, chi_nhanh, ngay_danh_gia, dia_ban_kt,
+            df_crm4_filtered=df_crm4_filtered,
+            df_crm32_filtered=df_crm32_filtered,
+            bo_nho_dem=dict(_BO_NHO_CHUNG),
+            **tham_so
+        )
+        path = os.path.join(thu_muc, f'KQ_{_ten_file(chi_nhanh)}.xlsx')
+        xuat_excel_kq_streaming(results, path)
+        if lich_su_db:
+            lich_su.luu_ky(results, chi_nhanh, ngay_danh_gia, dia_ban_kt, path=lich_su_db)
+        dong = tong_hop_chi_nhanh(chi_nhanh, results)
+        dong['FILE'] = path
+        dong['LOI'] = ''
+    except Exception as e:
+        # Một chi nhánh lỗi không làm dừng cả lượt chạy
+        dong = {'CHI_NHANH': chi_nhanh, 'FILE': '', 'LOI': f'{type(e).__name__}: {e}'}
+    dong['GIAY'] = round(time.perf_counter() - t0, 3)
+    return dong
+
+
+def chay_hang_loat(
+    crm4_files,
+    crm32_files,
+    df_muc_dich_file_upload,
+    df_code_tsbd_file_upload,
+    df_giai_ngan_file_upload,
+    df_sol_file_upload,
+    df_55_file_upload,
+    df_56_file_upload,
+    df_57_file_upload,
+    ds_chi_nhanh,
+    ngay_danh_gia,
+    dia_ban_kt,
+    thu_muc,
+    so_tien_trinh=None,
+    so_ngay_gn_tt=0,
+    gn_tt_cung_khe_uoc=False,
+    ky_cham_tra=KY_CHAM_TRA,
+    moc_cham_tra=MOC_CHAM_TRA,
+    lich_su_db=None,
+    che_do='trong_bo_nho'
+):
+    os.makedirs(thu_muc, exist_ok=True)
+    ds_chi_nhanh = [c.strip().upper() for c in ds_chi_nhanh if c.strip()]
+    files = [
+        crm4_files,
+        crm32_files,
+        chon_bang_ma(df_muc_dich_file_upload, 'muc_dich', ngay_danh_gia),
+        chon_bang_ma(df_code_tsbd_file_upload, 'code_tsbd', ngay_danh_gia),
+        df_giai_ngan_file_upload,
+        df_sol_file_upload,
+        df_55_file_upload,
+        df_56_file_upload,
+        df_57_file_upload,
+    ]
+
+    if che_do in ('ngoai_bo_nho', 'doc_luong'):
+        # Chỉ giữ phần của các chi nhánh trong danh sách (lọc ngay khi đọc từng file)
+        du_lieu = doc_du_lieu_ngoai_bo_nho(*files, ds_chi_nhanh, so_tien_trinh=so_tien_trinh,
+                                           doc_luong=che_do == 'doc_luong')
+        theo_cn = du_lieu.pop('theo_chi_nhanh')
+        crm4_theo_cn = {cn: v[0] for cn, v in theo_cn.items()}
+        crm32_theo_cn = {cn: v[1] for cn, v in theo_cn.items()}
+        du_lieu_chung = du_lieu
+    else:
+        du_lieu = doc_du_lieu(*files, so_tien_trinh=so_tien_trinh)
+        crm4_theo_cn = chia_theo_chi_nhanh(du_lieu['df_crm4'], 'BRANCH_VAY', ds_chi_nhanh)
+        crm32_theo_cn = chia_theo_chi_nhanh(du_lieu['df_crm32'], 'BRCD', ds_chi_nhanh)
+
+        # Mục 17 chỉ cần tra SECU_SRL_NUM -> CIF trên toàn hàng
+        du_lieu_chung = dict(du_lieu, df_crm4=du_lieu['df_crm4'][['SECU_SRL_NUM', 'CIF_KH_VAY']], df_crm32=None)
+
+    tham_so = {
+        'so_ngay_gn_tt': so_ngay_gn_tt,
+        'gn_tt_cung_khe_uoc': gn_tt_cung_khe_uoc,
+        'ky_cham_tra': ky_cham_tra,
+        'moc_cham_tra': moc_cham_tra,
+    }
+    jobs = [
+        (cn, crm4_theo_cn[cn], crm32_theo_cn[cn], ngay_danh_gia, dia_ban_kt, thu_muc, tham_so, lich_su_db)
+        for cn in ds_chi_nhanh
+    ]
+    # Mục 55/56 không phụ thuộc chi nhánh: tính một lần thay vì lặp lại ở mỗi chi nhánh
+    bo_nho_chung = giai_doan_chung(du_lieu_chung, so_ngay_gn_tt, gn_tt_cung_khe_uoc)
+    workers = min(so_tien_trinh or DEFAULT_WORKERS, len(jobs))
+    if workers <= 1:
+        _khoi_tao(du_lieu_chung, bo_nho_chung)
+        tong_hop = [_chay_mot_chi_nhanh(job) for job in jobs]
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_khoi_tao,
+                                 initargs=(du_lieu_chung, bo_nho_chung)) as executor:
+            tong_hop = list(executor.map(_chay_mot_chi_nhanh, jobs))
+
+    df_tong_hop = pd.DataFrame(tong_hop)
+    with pd.ExcelWriter(os.path.join(thu_muc, 'TONG_HOP.xlsx'), engine='openpyxl') as writer:
+        df_tong_hop.to_excel(writer, sheet_name='TONG_HOP', index=False)
+        du_lieu['tg_doc_file'].to_excel(writer, sheet_name='THOI_GIAN_DOC_FILE', index=False)
+    return df_tong_hop
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Chạy hàng loạt đối chiếu CRM4 – CRM32 cho nhiều chi nhánh",
+        fromfile_prefix_chars='@'
+    )
+    parser.add_argument('--crm4', nargs='+', required=True, help="Các file CRM4_Du_no_theo_tai_san_dam_bao_ALL")
+    parser.add_argument('--crm32', nargs='+', required=True, help="Các file RPT_CRM_32")
+    parser.add_argument('--muc-dich', help="CODE_MDSDV4.xlsx (bỏ trống: lấy từ kho bảng mã)")
+    parser.add_argument('--code-tsbd', help="CODE_LOAI TSBD.xlsx (bỏ trống: lấy từ kho bảng mã)")
+    parser.add_argument('--giai-ngan', required=True, help="Giai_ngan_tien_mat_1_ty 6.xls")
+    parser.add_argument('--muc17', required=True, help="Muc17_Lop2_TSTC 4.xlsx")
+    parser.add_argument('--muc55', required=True, help="Muc55_1405.xlsx")
+    parser.add_argument('--muc56', required=True, help="Muc56_1405.xlsx")
+    parser.add_argument('--muc57', required=True, help="Muc57_1405.xlsx")
+    parser.add_argument('--chi-nhanh', nargs='+', required=True,
+                        help="Tên chi nhánh / mã SOL (dùng @file.txt để đọc danh sách từ file, mỗi dòng một mã)")
+    parser.add_argument('--ngay-danh-gia', default='2025-09-30')
+    parser.add_argument('--dia-ban', required=True, help="Tỉnh/thành của đơn vị kiểm toán, phân cách bằng dấu phẩy")
+    parser.add_argument('--out', default='ket_qua', help="Thư mục ghi file kết quả")
+    parser.add_argument('--so-tien-trinh', type=int, default=DEFAULT_WORKERS)
+    parser.add_argument('--so-ngay-gn-tt', type=int, default=0,
+                        help="Cửa sổ ngày giữa giải ngân và tất toán (0 = cùng ngày)")
+    parser.add_argument('--gn-tt-cung-khe-uoc', action='store_true',
+                        help="Chỉ khớp giải ngân – tất toán trên cùng khế ước")
+    parser.add_argument('--ky-cham-tra', type=int, nargs=2, default=list(KY_CHAM_TRA), metavar=('TU_NAM', 'DEN_NAM'),
+                        help="Năm đến hạn được xét ở Mục 57 (tính cả hai đầu)")
+    parser.add_argument('--moc-cham-tra', type=int, nargs='+', default=list(MOC_CHAM_TRA),
+                        help="Mốc dưới của từng cấp chậm trả Mục 57, tăng dần (mặc định 1 4 10)")
+    parser.add_argument('--luu-lich-su', nargs='?', const=lich_su.DB_PATH, default=None, metavar='DB',
+                        help="Lưu từng chi nhánh vào kho lịch sử SQLite (mặc định %(const)s)")
+    parser.add_argument('--che-do', choices=list(CHE_DO_XU_LY), default='trong_bo_nho',
+                        help="ngoai_bo_nho: lọc chi nhánh ngay khi đọc từng file, không giữ cả dữ liệu toàn hàng; "
+                             "doc_luong: như ngoai_bo_nho nhưng chỉ parse các dòng của chi nhánh")
+    args = parser.parse_args(argv)
+    if not moc_hop_le(args.moc_cham_tra):
+        parser.error(f"--moc-cham-tra phải là các số nguyên dương tăng dần, nhận được: {args.moc_cham_tra}")
+
+    dia_ban_kt = [t.strip().lower() for t in args.dia_ban.split(',') if t.strip()]
+
+    # Chỉ đọc dòng tiêu đề: file thiếu / đổi tên cột thì dừng ngay, chưa parse gì
+    loi_tieu_de, _ = kiem_tra_uploads({
+        'crm4': args.crm4, 'crm32': args.crm32, 'muc_dich': args.muc_dich, 'code_tsbd': args.code_tsbd,
+        'giai_ngan': args.giai_ngan, 'muc17': args.muc17, 'muc55': args.muc55, 'muc56': args.muc56,
+        'muc57': args.muc57,
+    })
+    if loi_tieu_de:
+        parser.error("sai cấu trúc cột:\n" + "\n".join(f"  {ten}: {'; '.join(loi)}" for ten, loi in loi_tieu_de.items()))
+
+    t0 = time.perf_counter()
+    df_tong_hop = chay_hang_loat(
+        args.crm4,
+        args.crm32,
+        args.muc_dich,
+        args.code_tsbd,
+        args.giai_ngan,
+        args.muc17,
+        args.muc55,
+        args.muc56,
+        args.muc57,
+        args.chi_nhanh,
+        pd.to_datetime(args.ngay_danh_gia),
+        dia_ban_kt,
+        args.out,
+        so_tien_trinh=args.so_tien_trinh,
+        so_ngay_gn_tt=args.so_ngay_gn_tt,
+        gn_tt_cung_khe_uoc=args.gn_tt_cung_khe_uoc,
+        ky_cham_tra=tuple(args.ky_cham_tra),
+        moc_cham_tra=tuple(args.moc_cham_tra),
+        lich_su_db=args.luu_lich_su,
+        che_do=args.che_do
+    )
+    so_loi = int((df_tong_hop['LOI'] != '').sum())
+    print(f"Đã xử lý {len(df_tong_hop)} chi nhánh ({so_loi} lỗi) trong {time.perf_counter() - t0:.1f}s -> {args.out}")
+
+
+if __name__ == '__main__':
+    main()
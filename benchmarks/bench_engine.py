@@ -0,0 +1,96 @@
+# benchmarks/bench_engine.py
+
+# ============================================================
+# SO SÁNH THỜI GIAN CÁC ENGINE ĐỌC EXCEL
+# ============================================================
+# Chạy từ thư mục gốc repo:
+#   python -m benchmarks.bench_engine --rows 10000
+#   python -m benchmarks.bench_engine --du-lieu bench_data/1e6
+#
+# Với từng file trong manifest.json (đọc theo schema của loại file), đo thời
+# gian mỗi engine đã cài của định dạng đó (excel_engine.ENGINE_THEO_DINH_DANG)
+# so với engine mặc định của pandas (xlrd / openpyxl). CRM4/CRM32 đo thêm bộ
+# đọc luồng lọc chi nhánh (doc_luong.doc_excel_loc). Kết quả giống hệt giữa
+# các engine do tests/test_excel_engine.py kiểm tra.
+
+import argparse
+import json
+import os
+import sys
+import time
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.bench_pipeline import chuan_bi_du_lieu  # noqa: E402
+from doc_luong import doc_excel_loc, engine_doc_luong, loc_chua  # noqa: E402
+from excel_engine import ENGINE_THEO_DINH_DANG, co_engine, dinh_dang, read_excel  # noqa: E402
+from schema import read_kwargs  # noqa: E402
+
+# Cột chi nhánh để thử bộ đọc luồng
+COT_CHI_NHANH = {'crm4': 'BRANCH_VAY', 'crm32': 'BRCD'}
+
+
+def _doc(ham, lap):
+    giay = []
+    for _ in range(lap):
+        t0 = time.perf_counter()
+        df = ham()
+        giay.append(time.perf_counter() - t0)
+    return df, min(giay)
+
+
+def do_file(ten, data, loai, lap=1, chi_nhanh=None):
+    dong = []
+    ds_engine = [e for e in ENGINE_THEO_DINH_DANG[dinh_dang(data)] if co_engine(e)]
+    mac_dinh = ENGINE_THEO_DINH_DANG[dinh_dang(data)][-1]
+    kw = read_kwargs(loai)
+
+    cach_doc = [('read_excel', ds_engine, lambda e: read_excel(data, engine=e, **kw))]
+    if chi_nhanh and loai in COT_CHI_NHANH:
+        loc = (loc_chua(COT_CHI_NHANH[loai], [chi_nhanh]),)
+        # .xlsx luôn đọc luồng bằng openpyxl -> chỉ đo các engine thực sự khác nhau
+        ds_luong = list(dict.fromkeys(engine_doc_luong(data, e) for e in ds_engine))
+        cach_doc.append(('doc_luong', ds_luong, lambda e: doc_excel_loc(data, loc, engine=e, **kw)))
+
+    for cach, ds, ham in cach_doc:
+        mac_dinh_cach = engine_doc_luong(data, mac_dinh) if cach == 'doc_luong' else mac_dinh
+        df_ref, giay_ref = _doc(lambda: ham(mac_dinh_cach), lap)
+        for e in ds:
+            df, giay = (df_ref, giay_ref) if e == mac_dinh_cach else _doc(lambda: ham(e), lap)
+            dong.append({
+                'file': ten, 'loai': loai, 'cach_doc': cach, 'engine': e, 'so_dong': len(df),
+                'giay': round(giay, 3), 'nhanh_hon': round(giay_ref / giay, 1) if giay else None,
+            })
+    return dong
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="So sánh thời gian các engine đọc Excel")
+    nguon = parser.add_mutually_exclusive_group(required=True)
+    nguon.add_argument('--rows', type=int, help="Sinh dữ liệu (số dòng CRM4) vào --thu-muc-du-lieu nếu chưa có")
+    nguon.add_argument('--du-lieu', help="Thư mục dữ liệu có manifest.json")
+    parser.add_argument('--thu-muc-du-lieu', default='bench_data')
+    parser.add_argument('--lap', type=int, default=1, help="Số lần đọc mỗi file, lấy lần nhanh nhất")
+    args = parser.parse_args(argv)
+
+    thu_muc = args.du_lieu or chuan_bi_du_lieu(args.rows, args.thu_muc_du_lieu)
+    with open(os.path.join(thu_muc, 'manifest.json'), encoding='utf-8') as f:
+        manifest = json.load(f)
+    dong = []
+    for loai, ten in manifest['files'].items():
+        for file in ten if isinstance(ten, list) else [ten]:
+            with open(os.path.join(thu_muc, file), 'rb') as fh:
+                data = fh.read()
+            dong += do_file(file, data, loai, args.lap, manifest['chi_nhanh'][0])
+
+    df = pd.DataFrame(dong)
+    print(df.to_string(index=False))
+    tong = df.groupby(['cach_doc', 'engine'], sort=False)['giay'].sum()
+    print("\nTổng thời gian (giây):")
+    print(tong.to_string())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+# benchmarks/bench_export.py
+
+# ============================================================
+# SO SÁNH XUẤT FILE KQ: openpyxl (cách cũ) vs xlsxwriter streaming
+# ============================================================
+# Chạy từ thư mục gốc repo:
+#   python -m benchmarks.bench_export --rows 10000 50000
+# Đo thời gian và bộ nhớ đỉnh (tracemalloc) khi ghi workbook 10 sheet với
+# các sheet chi tiết (df_crm4_filtered, df_crm32_filtered, df_gop...) có số dòng cho trước.
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from export import SHEETS_KQ, xuat_excel_kq, xuat_excel_kq_streaming  # noqa: E402
+
+
+def tao_ket_qua(so_dong, seed=0):
+    rng = np.random.default_rng(seed)
+    ngay = pd.Timestamp('2024-01-01') + pd.to_timedelta(rng.integers(0, 700, so_dong), unit='D')
+    chi_tiet = pd.DataFrame({
+        'CIF_KH_VAY': rng.integers(10 ** 6, 10 ** 7, so_dong).astype(str),
+        'TEN_KH_VAY': [f'KHACH HANG {i}' for i in range(so_dong)],
+        'BRANCH_VAY': rng.choice(['001 - HANOI', '002 - HCM'], so_dong),
+        'LOAI_TS': rng.choice(['BĐS', 'MMTB', 'PTVT', 'Không TS'], so_dong),
+        'TS_KW_VND': rng.integers(1, 10 ** 6, so_dong) * 1000.0,
+        'DU_NO_PHAN_BO_QUY_DOI': rng.integers(1, 10 ** 6, so_dong) * 1000.0,
+        'VALUATION_DATE': ngay,
+        'SO_THANG_QUA_HAN': np.where(rng.random(so_dong) < 0.3, np.nan, rng.normal(0, 10, so_dong)),
+    })
+    tom_tat = chi_tiet.head(max(so_dong // 10, 1))
+    return {key: (chi_tiet if key in ('df_crm4_filtered', 'df_crm32_filtered', 'df_gop', 'df_delay') else tom_tat)
+            for _, key in SHEETS_KQ}
+
+
+def do(ham, results):
+    # Hai lượt: lượt đầu chỉ đo thời gian (tracemalloc làm chậm đáng kể),
+    # lượt sau đo bộ nhớ đỉnh
+    with tempfile.TemporaryDirectory() as d:
+        path = os.path.join(d, 'KQ.xlsx')
+        t0 = time.perf_counter()
+        ham(results, path)
+        giay = time.perf_counter() - t0
+        file_mb = os.path.getsize(path) / 1024 ** 2
+
+        tracemalloc.start()
+        ham(results, os.path.join(d, 'KQ_2.xlsx'))
+        _, dinh = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    return giay, dinh / 1024 ** 2, file_mb
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark xuất file KQ_1405_.xlsx")
+    parser.add_argument('--rows', type=int, nargs='+', default=[10000, 50000])
+    args = parser.parse_args(argv)
+
+    dong = []
+    for so_dong in args.rows:
+        results = tao_ket_qua(so_dong)
+        for ten, ham in [('openpyxl', xuat_excel_kq), ('xlsxwriter_streaming', xuat_excel_kq_streaming)]:
+            giay, dinh_mb, file_mb = do(ham, results)
+            dong.append({'so_dong': so_dong, 'engine': ten, 'giay': round(giay, 2),
+                         'bo_nho_dinh_mb': round(dinh_mb, 1), 'file_mb': round(file_mb, 1)})
+            print(dong[-1], flush=True)
+
+    print(pd.DataFrame(dong).to_string(index=False))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,169 @@
+# benchmarks/bench_pipeline.py
+
+# ============================================================
+# BENCHMARK process_data TRÊN DỮ LIỆU GIẢ LẬP (TOÀN LUỒNG + TỪNG GIAI ĐOẠN)
+# ============================================================
+# Chạy từ thư mục gốc repo:
+#   python -m benchmarks.bench_pipeline --rows 10000 100000
+#   python -m benchmarks.bench_pipeline --du-lieu bench_data/1e6 --lap 3 --bo-nho
+#
+# --rows: sinh dữ liệu (gen_data.py) vào thư mục bench_data/<số dòng> nếu chưa có;
+# --du-lieu: dùng sẵn thư mục có manifest.json.
+# Mỗi lượt chạy process_data cho chi nhánh đầu tiên trong manifest và ghi:
+#   - thời gian toàn luồng, số dòng CRM4/giây
+#   - từng giai đoạn (instrument.DoHieuNang): giây, CPU, dòng vào/ra, dòng/giây
+#   - RSS đỉnh của tiến trình chính và các tiến trình con đọc file (ru_maxrss)
+# --bo-nho chạy thêm một lượt có tracemalloc để lấy bộ nhớ đỉnh từng giai đoạn
+# (tách riêng vì tracemalloc làm chậm đáng kể).
+# Cache Parquet (excel_cache) được xóa trước mỗi lượt, trừ khi --cache-nong.
+# Kết quả nối thêm dạng JSON lines vào --out để so sánh giữa các commit/máy.
+
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+import pandas as pd
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# Cache riêng cho benchmark, không đụng .cache_excel của app
+os.environ.setdefault("CRM_CACHE_DIR", os.path.join(tempfile.gettempdir(), "crm_bench_cache"))
+
+from benchmarks.gen_data import ghi_bo_du_lieu, tao_du_lieu  # noqa: E402
+from excel_cache import clear_cache  # noqa: E402
+from pipeline import CHE_DO_XU_LY, process_data  # noqa: E402
+
+
+def _rss_dinh_mb():
+    # Linux: ru_maxrss tính bằng KB
+    tu_than = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    tien_trinh_con = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024
+    return round(tu_than, 1), round(tien_trinh_con, 1)
+
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT,
+                              capture_output=True, text=True).stdout.strip()
+    except OSError:
+        return ''
+
+
+def chuan_bi_du_lieu(so_dong, thu_muc_goc='bench_data', seed=0):
+    thu_muc = os.path.join(thu_muc_goc, str(so_dong))
+    if not os.path.exists(os.path.join(thu_muc, 'manifest.json')):
+        print(f"Sinh dữ liệu {so_dong:,} dòng CRM4 -> {thu_muc}", flush=True)
+        du_lieu, ds_chi_nhanh = tao_du_lieu(so_dong, seed=seed)
+        ghi_bo_du_lieu(du_lieu, ds_chi_nhanh, thu_muc)
+    return thu_muc
+
+
+def chay_mot_luot(thu_muc, manifest, so_tien_trinh=None, do_bo_nho=False, che_do='trong_bo_nho'):
+    files = {loai: (
+        [os.path.join(thu_muc, f) for f in ten] if isinstance(ten, list) else os.path.join(thu_muc, ten)
+    ) for loai, ten in manifest['files'].items()}
+
+    t0 = time.perf_counter()
+    results = process_data(
+        files['crm4'],
+        files['crm32'],
+        files['muc_dich'],
+        files['code_tsbd'],
+        files['giai_ngan'],
+        files['muc17'],
+        files['muc55'],
+        files['muc56'],
+        files['muc57'],
+        manifest['chi_nhanh'][0],
+        pd.to_datetime(manifest['ngay_danh_gia']),
+        manifest['dia_ban_kt'],
+        so_tien_trinh=so_tien_trinh,
+        do_bo_nho=do_bo_nho,
+        che_do=che_do
+    )
+    return time.perf_counter() - t0, results['tg_giai_doan']
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark process_data toàn luồng và từng giai đoạn")
+    nguon = parser.add_mutually_exclusive_group(required=True)
+    nguon.add_argument('--rows', type=int, nargs='+', help="Các cỡ dữ liệu (số dòng CRM4) cần đo")
+    nguon.add_argument('--du-lieu', nargs='+', help="Thư mục dữ liệu có manifest.json")
+    parser.add_argument('--thu-muc-du-lieu', default='bench_data', help="Nơi lưu dữ liệu sinh ra khi dùng --rows")
+    parser.add_argument('--lap', type=int, default=1, help="Số lượt đo mỗi cỡ dữ liệu")
+    parser.add_argument('--so-tien-trinh', type=int, default=None)
+    parser.add_argument('--cache-nong', action='store_true', help="Giữ cache Parquet giữa các lượt")
+    parser.add_argument('--bo-nho', action='store_true', help="Thêm một lượt đo bộ nhớ đỉnh (tracemalloc)")
+    parser.add_argument('--che-do', choices=list(CHE_DO_XU_LY), default='trong_bo_nho')
+    parser.add_argument('--out', default=os.path.join('logs', 'bench_pipeline.jsonl'))
+    args = parser.parse_args(argv)
+
+    ds_thu_muc = args.du_lieu or [chuan_bi_du_lieu(n, args.thu_muc_du_lieu) for n in args.rows]
+    meta = {
+        'commit': _git_commit(),
+        'may': platform.node(),
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'so_cpu': os.cpu_count(),
+        'thoi_diem': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'che_do': args.che_do,
+    }
+
+    tong_ket = []
+    dong_log = []
+    for thu_muc in ds_thu_muc:
+        with open(os.path.join(thu_muc, 'manifest.json'), encoding='utf-8') as f:
+            manifest = json.load(f)
+        so_dong = manifest['so_dong']['crm4']
+
+        luot = [('thoi_gian', False)] * args.lap + ([('bo_nho', True)] if args.bo_nho else [])
+        for i, (loai_luot, do_bo_nho) in enumerate(luot, start=1):
+            if not args.cache_nong:
+                clear_cache()
+            giay, tg = chay_mot_luot(thu_muc, manifest, args.so_tien_trinh, do_bo_nho, args.che_do)
+            rss, rss_con = _rss_dinh_mb()
+
+            dong = dict(meta, du_lieu=thu_muc, so_dong_crm4=so_dong, luot=i, loai_luot=loai_luot,
+                        giai_doan='TOÀN LUỒNG', giay=round(giay, 3), dong_moi_giay=round(so_dong / giay),
+                        rss_dinh_mb=rss, rss_con_dinh_mb=rss_con)
+            dong_log.append(dong)
+            tong_ket.append(dong)
+            print(f"{thu_muc} lượt {i} ({loai_luot}): {giay:.2f}s, {so_dong / giay:,.0f} dòng CRM4/s, "
+                  f"RSS đỉnh {rss:,.0f} MB (con {rss_con:,.0f} MB)", flush=True)
+
+            for rec in tg.astype(object).where(tg.notna(), None).to_dict('records'):
+                thong_luong = round(rec['dong_vao'] / rec['giay']) if rec['dong_vao'] and rec['giay'] else None
+                dong_log.append(dict(meta, du_lieu=thu_muc, so_dong_crm4=so_dong, luot=i,
+                                     loai_luot=loai_luot, dong_moi_giay=thong_luong, **rec))
+
+    os.makedirs(os.path.dirname(args.out) or '.', exist_ok=True)
+    with open(args.out, 'a', encoding='utf-8') as f:
+        for dong in dong_log:
+            f.write(json.dumps(dong, ensure_ascii=False, default=str) + '\n')
+
+    df_log = pd.DataFrame(dong_log)
+    giai_doan = df_log[df_log['giai_doan'] != 'TOÀN LUỒNG']
+    bang = giai_doan.pivot_table(index='giai_doan', columns='so_dong_crm4', values='giay',
+                                 aggfunc='median', sort=False)
+    print("\nThời gian từng giai đoạn (giây, trung vị các lượt):")
+    print(bang.to_string())
+    if args.bo_nho:
+        bo_nho = giai_doan[giai_doan['loai_luot'] == 'bo_nho'].pivot_table(
+            index='giai_doan', columns='so_dong_crm4', values='bo_nho_dinh_mb', aggfunc='max', sort=False)
+        print("\nBộ nhớ đỉnh từng giai đoạn (MB, tracemalloc):")
+        print(bo_nho.to_string())
+    print("\nToàn luồng:")
+    print(pd.DataFrame(tong_ket)[['du_lieu', 'luot', 'loai_luot', 'giay', 'dong_moi_giay',
+                                  'rss_dinh_mb', 'rss_con_dinh_mb']].to_string(index=False))
+    print(f"\nĐã ghi {len(dong_log)} dòng vào {args.out}")
+
+
+if __name__ == '__main__':
+    main()
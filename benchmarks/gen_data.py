@@ -0,0 +1,252 @@
+# benchmarks/gen_data.py
+
+# ============================================================
+# SINH DỮ LIỆU GIẢ LẬP CHO process_data (KHÔNG DÙNG DỮ LIỆU KHÁCH HÀNG)
+# ============================================================
+# Tạo đủ 9 loại file đầu vào, đúng tên cột mà schema.py / pipeline.py dùng:
+#   CRM4 (nhiều file), RPT_CRM_32 (nhiều file), CODE_MDSDV4, CODE_LOAI TSBD,
+#   Giải ngân tiền mặt, Mục 17, Mục 55, Mục 56, Mục 57
+# và manifest.json (danh sách file, chi nhánh, ngày đánh giá, địa bàn) cho
+# bench_pipeline.py.
+#
+# Chạy từ thư mục gốc repo:
+#   python -m benchmarks.gen_data --rows 100000 --out bench_data/1e5
+#
+# --rows là số dòng CRM4; các bảng khác tỉ lệ theo:
+#   CRM32 0.6x, Mục 17 0.4x, Mục 55 / Mục 56 0.2x, Mục 57 0.4x, số CIF 0.2x.
+# Mỗi sheet Excel tối đa 1.048.575 dòng dữ liệu nên CRM4/CRM32 được chia thành
+# nhiều file (như khi upload nhiều file thật); các bảng chỉ nhận một file
+# (Mục 17/55/56/57) bị chặn ở giới hạn này. Ghi bằng xlsxwriter constant_memory.
+
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+import xlsxwriter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from export import _ghi_sheet  # noqa: E402
+
+MAX_DONG_EXCEL = 1048575
+
+CAP_2 = {
+    'BDS_NHA_O': 'BĐS', 'BDS_DAT': 'BĐS', 'BDS_CONG_TRINH': 'BĐS',
+    'MMTB': 'MMTB', 'PTVT_OTO': 'PTVT', 'PTVT_TAU': 'PTVT',
+    'CC TCTD KHAC': 'Cầm cố', 'STK': 'Cầm cố', 'GTCG': 'GTCG', 'HANG_HOA': 'Hàng hóa',
+}
+# Mã cấp 2 có trong CRM4 nhưng chưa có trong bảng mã -> GHI_CHU_TSBD = 'MỚI'
+CAP_2_MOI = ['QUYEN_DOI_NO', 'TS_KHAC']
+
+MUC_DICH = {
+    'TD01': 'Tiêu dùng', 'TD02': 'Tiêu dùng', 'KD01': 'Kinh doanh', 'KD02': 'Kinh doanh',
+    'BDS01': 'Bất động sản', 'BDS02': 'Bất động sản', 'SX01': 'Sản xuất', 'K01': 'Khác',
+}
+
+SCHEME_CODE = ['CLN01', 'CLN02', 'CTD01', 'CKD03', 'ACOV1', 'BTT02', 'CCOV2', 'RTT03']
+
+# Địa chỉ TSBĐ với nhiều cách ghi tên tỉnh/thành như dữ liệu thật
+TINH_THANH = [
+    'TP. Hồ Chí Minh', 'Hồ Chí Minh', 'TP.HCM', 'Long An', 'Tỉnh Long An', 'Hà Nội',
+    'Thành phố Hà Nội', 'Đà Nẵng', 'Bình Dương', 'Đồng Nai', 'Cần Thơ', 'Tây Ninh',
+]
+
+
+def _chia_tron(n, phan):
+    return max(int(round(n * phan)), 1)
+
+
+def tao_du_lieu(so_dong, so_chi_nhanh=5, seed=0):
+    rng = np.random.default_rng(seed)
+    ds_chi_nhanh = [str(1400 + i) for i in range(1, so_chi_nhanh + 1)]
+
+    # ---- Khách hàng ----
+    so_cif = _chia_tron(so_dong, 0.2)
+    cif = np.arange(10 ** 7, 10 ** 7 + so_cif)
+    cif_cn = rng.integers(0, so_chi_nhanh, so_cif)
+    cif_loai = rng.choice(['Ca nhan', 'Doanh nghiep'], so_cif, p=[0.8, 0.2])
+    cif_nhom = rng.choice([1, 2, 3, 4, 5], so_cif, p=[0.9, 0.05, 0.02, 0.01, 0.02])
+    ten_cn = np.array([f'{cn} - CHI NHANH {cn}' for cn in ds_chi_nhanh])
+
+    # ---- CRM4 ----
+    i4 = rng.integers(0, so_cif, so_dong)
+    cap_2 = np.array(list(CAP_2) + CAP_2_MOI, dtype=object)
+    p_cap_2 = np.r_[np.full(len(CAP_2), 0.98 / len(CAP_2)), np.full(len(CAP_2_MOI), 0.01)]
+    cap_2 = rng.choice(cap_2, so_dong, p=p_cap_2)
+    cap_2[rng.random(so_dong) < 0.15] = None  # khoản vay tín chấp
+    so_ts = _chia_tron(so_dong, 0.5)
+    secu = np.char.add('TS', rng.integers(0, so_ts, so_dong).astype(str)).astype(object)
+    secu[pd.isna(cap_2)] = None
+    df_crm4 = pd.DataFrame({
+        'CIF_KH_VAY': cif[i4],
+        'TEN_KH_VAY': np.char.add('KHACH HANG ', cif[i4].astype(str)),
+        'CUSTTPCD': cif_loai[i4],
+        'NHOM_NO': cif_nhom[i4],
+        'BRANCH_VAY': ten_cn[cif_cn[i4]],
+        'LOAI': rng.choice(['Cho vay', 'Bao lanh', 'LC', 'Khac'], so_dong, p=[0.8, 0.1, 0.05, 0.05]),
+        'CAP_2': cap_2,
+        'TS_KW_VND': rng.integers(1, 50000, so_dong) * 1e6,
+        'DU_NO_PHAN_BO_QUY_DOI': rng.integers(1, 20000, so_dong) * 1e6,
+        'VALUATION_DATE': pd.Timestamp('2021-01-01') + pd.to_timedelta(rng.integers(0, 1700, so_dong), unit='D'),
+        'SECU_SRL_NUM': secu,
+    })
+
+    # ---- RPT_CRM_32 ----
+    so_dong_32 = _chia_tron(so_dong, 0.6)
+    i32 = rng.integers(0, so_cif, so_dong_32)
+    khe_uoc = np.char.add('KU', np.arange(so_dong_32).astype(str)).astype(object)
+    cap_pd = rng.integers(1, 35, so_dong_32)
+    df_crm32 = pd.DataFrame({
+        'CUSTSEQLN': cif[i32],
+        'BRCD': np.char.add('VN', np.array(ds_chi_nhanh)[cif_cn[i32]]),
+        'CAP_PHE_DUYET': [f'{c:02d} - CAP PHE DUYET {c}' for c in cap_pd],
+        'SCHEME_CODE': rng.choice(SCHEME_CODE, so_dong_32, p=[0.3, 0.3, 0.2, 0.15, 0.01, 0.01, 0.01, 0.02]),
+        'MUC_DICH_VAY_CAP_4': rng.choice(list(MUC_DICH), so_dong_32),
+        'DU_NO_QUY_DOI': rng.integers(1, 30000, so_dong_32) * 1e6,
+        'KHE_UOC': khe_uoc,
+    })
+
+    df_muc_dich = pd.DataFrame({'CODE_MDSDV4': list(MUC_DICH), 'GROUP': list(MUC_DICH.values())})
+    df_code_tsbd = pd.DataFrame({'CODE CAP 2': list(CAP_2), 'CODE': list(CAP_2.values())})
+    df_giai_ngan = pd.DataFrame({
+        'FORACID': rng.choice(khe_uoc, _chia_tron(so_dong_32, 0.01), replace=False)
+    })
+
+    # ---- Mục 17: TSBĐ, phần lớn là mã tài sản có trong CRM4 ----
+    so_dong_17 = min(_chia_tron(so_dong, 0.4), MAX_DONG_EXCEL)
+    ma_ts = np.char.add('TS', rng.permutation(int(so_ts * 1.1))[:so_dong_17].astype(str))
+    df_sol = pd.DataFrame({
+        'C01': ma_ts,
+        'C02': rng.choice(['Bat dong san', 'Phuong tien van tai', 'May moc thiet bi'], so_dong_17, p=[0.7, 0.2, 0.1]),
+        'C19': [f'So {i % 500 + 1}, Phuong {i % 20 + 1}, {t}'
+                for i, t in enumerate(rng.choice(TINH_THANH, so_dong_17))],
+    })
+
+    # ---- Mục 55 (tất toán) / Mục 56 (giải ngân) trên cùng khoảng ngày ----
+    ngay_goc = pd.Timestamp('2025-01-01')
+    so_dong_55 = min(_chia_tron(so_dong, 0.2), MAX_DONG_EXCEL)
+    i55 = rng.integers(0, so_dong_32, so_dong_55)
+    ngay_gn = ngay_goc - pd.to_timedelta(rng.integers(30, 720, so_dong_55), unit='D')
+    df_55 = pd.DataFrame({
+        'CUSTSEQLN': df_crm32['CUSTSEQLN'].to_numpy()[i55],
+        'NMLOC': np.char.add('KHACH HANG ', df_crm32['CUSTSEQLN'].to_numpy()[i55].astype(str)),
+        'KHE_UOC': khe_uoc[i55],
+        'SOTIENGIAINGAN': rng.integers(1, 20000, so_dong_55) * 1e6,
+        'NGAYGN': ngay_gn,
+        'NGAYDH': ngay_gn + pd.Timedelta(days=360),
+        'NGAY_TT': ngay_goc + pd.to_timedelta(rng.integers(0, 180, so_dong_55), unit='D'),
+        'LOAITIEN': rng.choice(['VND', 'USD'], so_dong_55, p=[0.95, 0.05]),
+    })
+
+    so_dong_56 = min(_chia_tron(so_dong, 0.2), MAX_DONG_EXCEL)
+    i56 = rng.integers(0, so_dong_32, so_dong_56)
+    ngay_gn = ngay_goc + pd.to_timedelta(rng.integers(0, 180, so_dong_56), unit='D')
+    df_56 = pd.DataFrame({
+        'CIF': df_crm32['CUSTSEQLN'].to_numpy()[i56],
+        'TEN_KHACH_HANG': np.char.add('KHACH HANG ', df_crm32['CUSTSEQLN'].to_numpy()[i56].astype(str)),
+        'KHE_UOC': khe_uoc[i56],
+        'SO_TIEN_GIAI_NGAN_VND': rng.integers(1, 20000, so_dong_56) * 1e6,
+        # Mục 56 ghi ngày dạng số yyyymmdd
+        'NGAY_GIAI_NGAN': ngay_gn.strftime('%Y%m%d').astype(int),
+        'NGAY_DAO_HAN': (ngay_gn + pd.Timedelta(days=360)).strftime('%Y%m%d').astype(int),
+        'LOAI_TIEN_HD': rng.choice(['VND', 'USD'], so_dong_56, p=[0.95, 0.05]),
+    })
+
+    # ---- Mục 57: lịch trả nợ, một phần trả chậm / chưa trả ----
+    so_dong_57 = min(_chia_tron(so_dong, 0.4), MAX_DONG_EXCEL)
+    i57 = rng.integers(0, so_cif, so_dong_57)
+    den_han = pd.Timestamp('2023-01-01') + pd.to_timedelta(rng.integers(0, 1000, so_dong_57), unit='D')
+    tre = rng.choice([-2, 0, 0, 0, 3, 12, 45], so_dong_57)
+    thanh_toan = pd.Series(den_han + pd.to_timedelta(tre, unit='D'))
+    thanh_toan[rng.random(so_dong_57) < 0.03] = pd.NaT
+    df_57 = pd.DataFrame({
+        'CIF_ID': cif[i57],
+        'NGAY_DEN_HAN_TT': den_han,
+        'NGAY_THANH_TOAN': thanh_toan,
+    })
+
+    return {
+        'crm4': df_crm4,
+        'crm32': df_crm32,
+        'muc_dich': df_muc_dich,
+        'code_tsbd': df_code_tsbd,
+        'giai_ngan': df_giai_ngan,
+        'muc17': df_sol,
+        'muc55': df_55,
+        'muc56': df_56,
+        'muc57': df_57,
+    }, ds_chi_nhanh
+
+
+# Tên file giống file thật người dùng upload
+TEN_FILE = {
+    'crm4': 'CRM4_Du_no_theo_tai_san_dam_bao_ALL_{}.xlsx',
+    'crm32': 'RPT_CRM_32_{}.xlsx',
+    'muc_dich': 'CODE_MDSDV4.xlsx',
+    'code_tsbd': 'CODE_LOAI TSBD.xlsx',
+    'giai_ngan': 'Giai_ngan_tien_mat_1_ty.xlsx',
+    'muc17': 'Muc17_Lop2_TSTC.xlsx',
+    'muc55': 'Muc55_1405.xlsx',
+    'muc56': 'Muc56_1405.xlsx',
+    'muc57': 'Muc57_1405.xlsx',
+}
+
+
+def ghi_xlsx(df, path, sheet_name='Sheet1'):
+    workbook = xlsxwriter.Workbook(path, {
+        'constant_memory': True,
+        'default_date_format': 'yyyy-mm-dd',
+        'nan_inf_to_errors': True,
+    })
+    _ghi_sheet(workbook, sheet_name, df, workbook.add_format({'bold': True}))
+    workbook.close()
+
+
+def ghi_bo_du_lieu(du_lieu, ds_chi_nhanh, thu_muc, so_dong_moi_file=MAX_DONG_EXCEL):
+    os.makedirs(thu_muc, exist_ok=True)
+    manifest = {
+        'chi_nhanh': ds_chi_nhanh,
+        'ngay_danh_gia': '2025-09-30',
+        'dia_ban_kt': ['hồ chí minh', 'long an'],
+        'so_dong': {loai: len(df) for loai, df in du_lieu.items()},
+        'files': {},
+    }
+    for loai, df in du_lieu.items():
+        if loai in ('crm4', 'crm32'):
+            files = []
+            for k, start in enumerate(range(0, len(df), so_dong_moi_file), start=1):
+                files.append(TEN_FILE[loai].format(k))
+                ghi_xlsx(df.iloc[start:start + so_dong_moi_file], os.path.join(thu_muc, files[-1]))
+            manifest['files'][loai] = files
+        else:
+            manifest['files'][loai] = TEN_FILE[loai]
+            ghi_xlsx(df, os.path.join(thu_muc, TEN_FILE[loai]))
+
+    with open(os.path.join(thu_muc, 'manifest.json'), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    return manifest
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Sinh bộ file đầu vào giả lập cho process_data")
+    parser.add_argument('--rows', type=int, default=100000, help="Số dòng CRM4 (10^4 – 10^7)")
+    parser.add_argument('--chi-nhanh', type=int, default=5, help="Số chi nhánh")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--so-dong-moi-file', type=int, default=MAX_DONG_EXCEL,
+                        help="Số dòng tối đa mỗi file CRM4/CRM32")
+    parser.add_argument('--out', required=True, help="Thư mục ghi file")
+    args = parser.parse_args(argv)
+
+    t0 = time.perf_counter()
+    du_lieu, ds_chi_nhanh = tao_du_lieu(args.rows, args.chi_nhanh, args.seed)
+    manifest = ghi_bo_du_lieu(du_lieu, ds_chi_nhanh, args.out, min(args.so_dong_moi_file, MAX_DONG_EXCEL))
+    print(json.dumps(manifest['so_dong'], ensure_ascii=False))
+    print(f"Đã ghi {sum(manifest['so_dong'].values()):,} dòng vào {args.out} trong {time.perf_counter() - t0:.1f}s")
+
+
+if __name__ == '__main__':
+    main()
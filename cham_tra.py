@@ -0,0 +1,81 @@
+# cham_tra.py
+
+import numpy as np
+import pandas as pd
+
+# ============================================================
+# PHÂN CẤP CHẬM TRẢ (MỤC 57) – VECTOR HÓA
+# ============================================================
+# Thay cho .apply(cap_cham_tra) từng dòng + sort_values(key=...) +
+# drop_duplicates(CIF_ID, NGAY):
+#   - số ngày chậm trả chia cấp bằng pd.cut trên cả cột -> Categorical có
+#     thứ tự, mã cấp càng lớn càng nặng
+#   - mỗi (CIF, ngày đến hạn) giữ cấp nặng nhất bằng groupby(...).max() trên
+#     mã số nguyên (CIF factorize × số ngày), không cần sắp xếp cả bảng
+#   - đếm số ngày theo CIF × cấp bằng np.add.at
+# Kỳ xét (năm đến hạn) và các mốc cấp truyền vào được, mặc định giữ như script gốc.
+
+# Năm đến hạn được xét (từ, đến – tính cả hai đầu)
+KY_CHAM_TRA = (2023, 2025)
+
+# Mốc dưới (tính cả mốc) của từng cấp, tăng dần: (1, 4, 10) -> '<4', '4-9', '>=10'
+# Chậm dưới mốc đầu tiên (<= 0 ngày) không tính là chậm trả.
+MOC_CHAM_TRA = (1, 4, 10)
+
+# Cờ theo hai cấp nặng nhất (tên cột với mốc mặc định, giữ như script gốc)
+COT_CO_CHAM_TRA = ['KH Phát sinh chậm trả > 10 ngày', 'KH Phát sinh chậm trả 4-9 ngày']
+TIEN_TO_CO_CHAM_TRA = 'KH Phát sinh chậm trả'
+
+
+def moc_hop_le(moc):
+    # Mốc là số nguyên dương, tăng ngặt
+    moc = list(moc)
+    return bool(moc) and moc[0] >= 1 and all(a < b for a, b in zip(moc, moc[1:]))
+
+
+def nhan_cap(moc=MOC_CHAM_TRA):
+    if len(moc) == 1:
+        return [f'>={moc[0]}']
+    nhan = [f'<{moc[1]}']
+    nhan += [f'{a}-{b - 1}' for a, b in zip(moc[1:-1], moc[2:])]
+    nhan.append(f'>={moc[-1]}')
+    return nhan
+
+
+def ten_co_cham_tra(moc=MOC_CHAM_TRA):
+    # Tên cột cờ theo hai cấp nặng nhất (một cột nếu chỉ có một cấp)
+    if tuple(moc) == MOC_CHAM_TRA:
+        return list(COT_CO_CHAM_TRA)
+    return [f'{TIEN_TO_CO_CHAM_TRA} {nhan} ngày' for nhan in nhan_cap(moc)[::-1][:2]]
+
+
+def cap_cham_tra(so_ngay, moc=MOC_CHAM_TRA):
+    # Số ngày chậm trả -> cấp (Categorical có thứ tự); NaN hoặc dưới mốc đầu -> NaN
+    return pd.cut(so_ngay, bins=[*moc, np.inf], right=False, labels=nhan_cap(moc), ordered=True)
+
+
+def dem_cham_tra(cif, ngay, cap, moc=MOC_CHAM_TRA):
+    # cif, ngay (datetime), cap (Categorical) cùng độ dài, không có NaN.
+    # Trả về bảng CIF × cấp: số ngày đến hạn mà cấp nặng nhất trong ngày là cấp đó
+    ma_cif, ds_cif = pd.factorize(cif)
+    so_ngay = pd.DatetimeIndex(ngay).to_numpy(dtype='datetime64[D]').astype('int64')
+    ma_ngay, ds_ngay = pd.factorize(so_ngay)
+    khoa = ma_cif.astype('int64') * max(len(ds_ngay), 1) + ma_ngay
+
+    nang_nhat = pd.Series(np.asarray(cap.cat.codes)).groupby(khoa, sort=False).max()
+    hang = nang_nhat.index.to_numpy() // max(len(ds_ngay), 1)
+
+    ds_cap = cap.cat.categories
+    mang = np.zeros((len(ds_cif), len(ds_cap)), dtype='int64')
+    np.add.at(mang, (hang, nang_nhat.to_numpy()), 1)
+
+    df_dem = pd.DataFrame(mang, index=pd.Index(ds_cif, name='CIF_ID'),
+                          columns=pd.Index(ds_cap, name='CAP_CHAM_TRA'))
+
+    ten_co = ten_co_cham_tra(moc)
+    nang = df_dem.iloc[:, len(ds_cap) - 1]
+    df_dem[ten_co[0]] = np.where(nang > 0, 'x', '')
+    if len(ten_co) > 1:
+        nhi = df_dem.iloc[:, len(ds_cap) - 2]
+        df_dem[ten_co[1]] = np.where((nang == 0) & (nhi > 0), 'x', '')
+    return df_dem
@@ -0,0 +1,113 @@
+# cif.py
+
+import numpy as np
+import pandas as pd
+
+# ============================================================
+# CHIỀU CIF – KHÓA SỐ NGUYÊN DÙNG CHUNG MỌI GIAI ĐOẠN
+# ============================================================
+# CIF ở CRM4 (CIF_KH_VAY), CRM32 (CUSTSEQLN), Mục 55 (CUSTSEQLN), Mục 56 (CIF)
+# và Mục 57 (CIF_ID) được chuẩn hóa đúng một lần sau khi đọc file:
+#   - giá trị số (to_numeric, bỏ phần thập phân) của mọi bảng gộp thành một
+#     danh mục CIF tăng dần; CIF không phải số (vd. 'KH01') giữ nguyên chuỗi đã
+#     bỏ khoảng trắng, xếp sau các CIF số. CRM4/CRM32 vẫn như chuẩn hóa cũ: qua
+#     so_cif trước nên CIF không phải số ở đó là NaN (pipeline._chuan_hoa_cif)
+#   - thay đổi có chủ đích so với chuẩn hóa cũ: CIF số khác nhau chỉ ở số 0 đứng
+#     đầu ('001234' và 1234) là cùng một KH ở mọi bảng (trước đây Mục 55/56/57
+#     giữ nguyên chuỗi nên tách thành hai KH)
+#   - mỗi cột CIF thành Categorical cùng một CategoricalDtype: mã int32 là vị
+#     trí trong danh mục, danh mục chính là bảng giải mã
+#   - merge / groupby / isin / gắn cờ giữa các bảng đều chạy trên mã số nguyên
+#     (cùng dtype nên pandas join thẳng trên mã, không so chuỗi)
+#   - chỉ khi trả kết quả (ghep_ket_qua) mới giải mã về chuỗi như trước
+
+# Tên cột CIF trong các bảng kết quả, giải mã về chuỗi trước khi xuất
+COT_CIF = ('CIF_KH_VAY', 'CUSTSEQLN', 'CIF', 'CIF_ID')
+
+
+def so_cif(s):
+    # Giá trị số của CIF (Int64, NaN khi không phải số)
+    if isinstance(s.dtype, pd.CategoricalDtype):
+        s = s.astype(object)
+    so = pd.to_numeric(s, errors='coerce')
+    if pd.api.types.is_float_dtype(so.dtype):
+        so = np.trunc(so)
+    return so.astype('Int64')
+
+
+def _tach_cif(s):
+    # -> (giá trị số Int64, mask dòng là CIF không phải số, chuỗi của các dòng đó)
+    so = so_cif(s)
+    if isinstance(s.dtype, pd.CategoricalDtype):
+        s = s.astype(object)
+    la_chuoi = np.zeros(len(s), dtype=bool)
+    if pd.api.types.is_numeric_dtype(s.dtype):
+        return so, la_chuoi, np.array([], dtype=object)
+    khac = (so.isna() & s.notna()).to_numpy()
+    chuoi = s[khac].astype(str).str.strip().to_numpy(dtype=object)
+    la_chuoi[khac] = chuoi != ''
+    return so, la_chuoi, chuoi[chuoi != '']
+
+
+def chieu_cif(*ds_cot):
+    # CategoricalDtype chung từ các cột CIF (đã qua so_cif hoặc chưa):
+    # CIF số tăng dần, sau đó CIF không phải số theo thứ tự chuỗi
+    so, chuoi = [], []
+    for s in ds_cot:
+        if s is None:
+            continue
+        gia_tri, _, khac = _tach_cif(s)
+        so.append(gia_tri.dropna().to_numpy(dtype='int64'))
+        chuoi.append(khac)
+    danh_muc = np.unique(np.concatenate(so)) if so else np.array([], dtype='int64')
+    chuoi = np.unique(np.concatenate(chuoi)) if chuoi else []
+    if not len(chuoi):
+        return pd.CategoricalDtype(pd.Index(danh_muc, dtype='int64'))
+    return pd.CategoricalDtype(pd.Index([*danh_muc.tolist(), *chuoi], dtype=object))
+
+
+def ma_hoa_cif(s, kieu):
+    # Cột CIF -> Categorical theo chiều CIF (CIF số tra bằng searchsorted trên phần
+    # số đã sắp xếp của danh mục, CIF không phải số tra trên phần chuỗi)
+    if s.dtype == kieu:
+        return s
+    so, la_chuoi, chuoi = _tach_cif(s)
+    gia_tri = so.to_numpy(dtype='int64', na_value=0)
+    danh_muc = kieu.categories
+    if danh_muc.dtype == object:
+        n_so = len(danh_muc) - sum(isinstance(v, str) for v in danh_muc)
+    else:
+        n_so = len(danh_muc)
+    danh_muc_so = danh_muc[:n_so].to_numpy(dtype='int64')
+    if n_so:
+        ma = np.minimum(np.searchsorted(danh_muc_so, gia_tri), n_so - 1)
+        co = so.notna().to_numpy() & (danh_muc_so[ma] == gia_tri)
+    else:
+        ma = co = np.zeros(len(so), dtype=bool)
+    ma = np.where(co, ma, -1).astype('int32')
+    if len(chuoi):
+        ma_chuoi = danh_muc[n_so:].get_indexer(chuoi)
+        ma[la_chuoi] = np.where(ma_chuoi >= 0, ma_chuoi + n_so, -1)
+    return pd.Series(pd.Categorical.from_codes(ma, dtype=kieu), index=s.index, name=s.name)
+
+
+def ma_cif(gia_tri, kieu):
+    # Mã trong chiều CIF của một tập CIF (Categorical cùng dtype: lấy thẳng mã)
+    return pd.Categorical(gia_tri, dtype=kieu).codes
+
+
+def giai_ma_cif(s):
+    # Categorical CIF -> chuỗi như chuẩn hóa cũ ('1234'), NaN giữ nguyên
+    if not isinstance(s.dtype, pd.CategoricalDtype):
+        return s
+    ma = s.cat.codes.to_numpy()
+    chuoi = np.asarray(s.cat.categories.astype(str), dtype=object)
+    gia_tri = chuoi[ma] if len(chuoi) else np.full(len(ma), np.nan, dtype=object)
+    gia_tri[ma < 0] = np.nan
+    return pd.Series(gia_tri, index=s.index, name=s.name)
+
+
+def giai_ma_bang(df):
+    # Giải mã các cột CIF (COT_CIF) của một bảng kết quả, không sửa bảng gốc
+    cot = [c for c in COT_CIF if c in df.columns and isinstance(df[c].dtype, pd.CategoricalDtype)]
+    return df.assign(**{c: giai_ma_cif(df[c]) for c in cot}) if cot else df
@@ -0,0 +1,317 @@
+# doc_luong.py
+
+import io
+import math
+import posixpath
+import re
+import zipfile
+from datetime import date, datetime, time
+from xml.etree.ElementTree import iterparse
+
+import numpy as np
+import pandas as pd
+from pandas.io.parsers import TextParser
+
+from excel_engine import chon_engine, dinh_dang
+
+# ============================================================
+# ĐỌC LUỒNG FILE EXCEL – CHỈ DỰNG DATAFRAME TỪ CÁC DÒNG CẦN DÙNG
+# ============================================================
+# pd.read_excel đổi mọi ô của mọi dòng sang giá trị Python rồi mới dựng
+# DataFrame; kiểm toán một chi nhánh thì phần lớn số dòng đó bị bỏ ngay sau
+# khi lọc BRANCH_VAY / BRCD. Ở đây:
+#   - .xlsx: openpyxl read_only + iter_rows(values_only=True), đọc tuần tự
+#     từng dòng, không giữ cả sheet
+#   - .xls : xlrd (định dạng BIFF buộc nạp cả sheet, nhưng tối đa 65.536 dòng);
+#     đã cài python-calamine (excel_engine.py) thì dùng calamine, cũng nạp cả
+#     sheet nhưng nhanh hơn. .xlsx không dùng calamine: python-calamine chỉ
+#     có iter_rows trên sheet đã nạp hết vào bộ nhớ, mất lợi thế đọc luồng
+#   - điều kiện lọc (loc_dong) xét trên vài cột của dòng thô; chỉ dòng khớp
+#     mới được đổi kiểu ô và chiếu về các cột usecols
+#   - dòng khớp gom thành từng khối, mỗi khối qua TextParser với đúng tham số
+#     pd.read_excel dùng (dtype, parse_dates, ô rỗng -> NaN) rồi ghép lại
+#   - index = số thứ tự dòng trong file (như read_excel cả file), tổng số dòng
+#     của file ghi ở df.attrs['so_dong_goc']
+#
+# loc_dong: tuple các điều kiện, dòng được giữ khi khớp ít nhất một điều kiện
+#   ('chua', cột, (mẫu, ...))  : str(giá trị).upper() chứa một trong các mẫu
+#                                (regex, như str.contains ở loc_chi_nhanh)
+#   ('thuoc', cột, (giá trị, ...)): str(giá trị) nằm trong danh sách
+
+KICH_THUOC_KHOI = 50_000
+
+# Ô lỗi của Excel: pd.read_excel đọc thành NaN
+try:
+    from openpyxl.cell.cell import ERROR_CODES
+except ImportError:
+    ERROR_CODES = ()
+
+
+def loc_chua(cot, ds_mau):
+    return ('chua', cot, tuple(ds_mau))
+
+
+def loc_thuoc(cot, ds_gia_tri):
+    # So sánh theo chuỗi như ô đã đổi kiểu (1234.0 -> '1234'); sắp xếp để khóa
+    # cache (repr của tham số đọc) ổn định giữa các lần chạy
+    return ('thuoc', cot, tuple(sorted({str(_o_xlsx(v)) for v in ds_gia_tri})))
+
+
+def _o_xlsx(v):
+    # Như OpenpyxlReader._convert_cell của pandas
+    if v is None:
+        return ''
+    if isinstance(v, float) and v.is_integer():
+        return int(v)
+    if isinstance(v, str) and v in ERROR_CODES:
+        return np.nan
+    return v
+
+
+def _dong_xlsx(data):
+    from openpyxl import load_workbook
+
+    wb = load_workbook(io.BytesIO(data), read_only=True, data_only=True, keep_links=False)
+    try:
+        ws = wb.worksheets[0]
+        ws.reset_dimensions()
+        yield from ws.iter_rows(values_only=True)
+    finally:
+        wb.close()
+
+
+def _dong_xls(data, so_dong=None):
+    # so_dong: chỉ chuyển đổi so_dong dòng đầu (None = cả sheet)
+    import xlrd
+
+    book = xlrd.open_workbook(file_contents=data, on_demand=True)
+    sheet = book.sheet_by_index(0)
+
+    def o(v, loai):
+        # Như XlrdReader.get_sheet_data của pandas
+        if loai == xlrd.XL_CELL_DATE:
+            try:
+                v = xlrd.xldate.xldate_as_datetime(v, book.datemode)
+            except OverflowError:
+                return v
+            if (not book.datemode and v.timetuple()[0:3] == (1899, 12, 31)) or (
+                book.datemode and v.timetuple()[0:3] == (1904, 1, 1)
+            ):
+                v = time(v.hour, v.minute, v.second, v.microsecond)
+            return v
+        if loai == xlrd.XL_CELL_ERROR:
+            return np.nan
+        if loai == xlrd.XL_CELL_BOOLEAN:
+            return bool(v)
+        if loai == xlrd.XL_CELL_NUMBER and math.isfinite(v) and int(v) == v:
+            return int(v)
+        return v
+
+    try:
+        for i in range(sheet.nrows if so_dong is None else min(so_dong, sheet.nrows)):
+            yield [o(v, t) for v, t in zip(sheet.row_values(i), sheet.row_types(i))]
+    finally:
+        book.release_resources()
+
+
+def _dong_calamine(data):
+    from python_calamine import load_workbook
+
+    sheet = load_workbook(io.BytesIO(data)).get_sheet_by_index(0)
+    # iter_rows bắt đầu từ dòng 1 nhưng từ cột có dữ liệu đầu tiên -> bù các cột trống bên trái
+    dem = [''] * (sheet.start or (0, 0))[1]
+    for d in sheet.iter_rows():
+        # Như CalamineReader.get_sheet_data của pandas: date -> datetime
+        yield dem + [datetime(v.year, v.month, v.day) if type(v) is date else v for v in d]
+
+
+def engine_doc_luong(data, engine=None):
+    # Engine doc_excel_loc thực sự dùng: .xlsx luôn đọc luồng bằng openpyxl
+    return chon_engine(data, engine) if dinh_dang(data) == 'xls' else 'openpyxl'
+
+
+def _ham_loc(header, loc_dong):
+    # Trả về hàm (dòng thô) -> bool
+    dk = []
+    for loai, cot, gia_tri in loc_dong:
+        if cot not in header:
+            continue
+        vi_tri = header.index(cot)
+        if loai == 'chua':
+            mau = re.compile('|'.join(f'(?:{m})' for m in gia_tri))
+            dk.append((vi_tri, lambda s, mau=mau: mau.search(s.upper()) is not None))
+        else:
+            tap = frozenset(gia_tri)
+            dk.append((vi_tri, lambda s, tap=tap: s in tap))
+
+    def khop(dong):
+        for vi_tri, ham in dk:
+            if vi_tri < len(dong):
+                v = _o_xlsx(dong[vi_tri])
+                if v != '' and not (isinstance(v, float) and np.isnan(v)) and ham(str(v)):
+                    return True
+        return False
+
+    return khop
+
+
+def _dung_khoi(ten_cot, khoi, chi_so, dtype, parse_dates):
+    df = TextParser(
+        [ten_cot] + khoi,
+        header=0,
+        dtype=dtype,
+        parse_dates=parse_dates,
+        skip_blank_lines=False,
+    ).read()
+    df.index = pd.Index(chi_so, dtype='int64')
+    return df
+
+
+def doc_excel_loc(f, loc_dong, usecols=None, dtype=None, parse_dates=None, kich_thuoc_khoi=KICH_THUOC_KHOI,
+                  engine=None):
+    # f: bytes hoặc file-like. Tham số usecols / dtype / parse_dates / engine như pd.read_excel
+    data = f if isinstance(f, bytes) else f.read()
+    engine = engine_doc_luong(data, engine)
+    if engine == 'calamine':
+        dong = _dong_calamine(data)
+    else:
+        dong = _dong_xls(data) if engine == 'xlrd' else _dong_xlsx(data)
+
+    header = [_o_xlsx(v) for v in next(dong, ())]
+    while header and header[-1] == '':
+        header.pop()
+    header = [str(h) for h in header]
+    thieu = [c for c in (usecols or []) if c not in header]
+    if thieu:
+        raise ValueError(f"Usecols do not match columns, columns expected but not found: {thieu}")
+    chieu = [i for i, h in enumerate(header) if usecols is None or h in usecols]
+    ten_cot = [header[i] for i in chieu]
+    khop = _ham_loc(header, loc_dong)
+
+    khoi, chi_so, cac_khoi = [], [], []
+    so_dong = 0
+    for i, d in enumerate(dong):
+        if any(v is not None and v != '' for v in d):
+            so_dong = i + 1
+        if not khop(d):
+            continue
+        khoi.append([_o_xlsx(d[j]) if j < len(d) else '' for j in chieu])
+        chi_so.append(i)
+        if len(khoi) >= kich_thuoc_khoi:
+            cac_khoi.append(_dung_khoi(ten_cot, khoi, chi_so, dtype, parse_dates))
+            khoi, chi_so = [], []
+
+    if khoi or not cac_khoi:
+        cac_khoi.append(_dung_khoi(ten_cot, khoi, chi_so, dtype, parse_dates))
+    df = pd.concat(cac_khoi) if len(cac_khoi) > 1 else cac_khoi[0]
+    df.attrs['so_dong_goc'] = so_dong
+    return df
+
+
+# ------------------------------------------------------------
+# CHỈ ĐỌC DÒNG TIÊU ĐỀ (KIỂM TRA TRƯỚC – kiem_tra_truoc.py)
+# ------------------------------------------------------------
+# .xlsx là file zip: đọc luồng XML của sheet đầu tiên và dừng ngay sau dòng
+# 1; shared strings cũng chỉ đọc tới chỉ số lớn nhất dòng 1 cần. Không nạp
+# workbook bằng openpyxl (openpyxl đọc hết bảng shared strings ngay khi mở).
+
+_NS_MAIN = '{http://schemas.openxmlformats.org/spreadsheetml/2006/main}'
+_NS_REL = '{http://schemas.openxmlformats.org/officeDocument/2006/relationships}'
+_NS_PKG_REL = '{http://schemas.openxmlformats.org/package/2006/relationships}'
+
+
+def _cot_so(ref):
+    # 'C1' -> 2
+    n = 0
+    for ch in ref:
+        if not ch.isalpha():
+            break
+        n = n * 26 + ord(ch.upper()) - 64
+    return n - 1
+
+
+def _sheet_dau(z):
+    r_id = None
+    for _, el in iterparse(z.open('xl/workbook.xml')):
+        if el.tag == f'{_NS_MAIN}sheet':
+            r_id = el.get(f'{_NS_REL}id')
+            break
+    for _, el in iterparse(z.open('xl/_rels/workbook.xml.rels')):
+        if el.tag == f'{_NS_PKG_REL}Relationship' and el.get('Id') == r_id:
+            dich = el.get('Target')
+            return dich.lstrip('/') if dich.startswith('/') else posixpath.normpath(posixpath.join('xl', dich))
+    return 'xl/worksheets/sheet1.xml'
+
+
+def _chuoi_dung_chung(z, can):
+    # {chỉ số: chuỗi} cho các chỉ số trong can, dừng khi đã đủ
+    ket_qua = {}
+    if not can or 'xl/sharedStrings.xml' not in z.namelist():
+        return ket_qua
+    lon_nhat = max(can)
+    i = 0
+    for _, el in iterparse(z.open('xl/sharedStrings.xml')):
+        if el.tag != f'{_NS_MAIN}si':
+            continue
+        if i in can:
+            # Chuỗi thường (<t>) hoặc rich text (<r><t>); bỏ phần phiên âm (rPh) như openpyxl
+            t = el.find(f'{_NS_MAIN}t')
+            ket_qua[i] = t.text or '' if t is not None else ''.join(
+                r.findtext(f'{_NS_MAIN}t') or '' for r in el.findall(f'{_NS_MAIN}r')
+            )
+        el.clear()
+        i += 1
+        if i > lon_nhat:
+            break
+    return ket_qua
+
+
+def _tieu_de_xlsx(data):
+    z = zipfile.ZipFile(io.BytesIO(data))
+    o = {}
+    for su_kien, el in iterparse(z.open(_sheet_dau(z)), events=('start', 'end')):
+        if el.tag == f'{_NS_MAIN}row':
+            if su_kien == 'start':
+                # Dòng đầu tiên có dữ liệu không phải dòng 1 -> tiêu đề rỗng
+                if el.get('r') not in (None, '1'):
+                    return []
+                continue
+            break
+        if su_kien != 'end' or el.tag != f'{_NS_MAIN}c':
+            continue
+        vi_tri = _cot_so(el.get('r')) if el.get('r') else len(o)
+        loai = el.get('t', 'n')
+        if loai == 'inlineStr':
+            v = ''.join(t.text or '' for t in el.iter(f'{_NS_MAIN}t'))
+        else:
+            v = el.findtext(f'{_NS_MAIN}v')
+            if v is None:
+                continue
+            if loai == 'n':
+                v = float(v)
+            elif loai == 'b':
+                v = bool(int(v))
+            elif loai == 's':
+                v = int(v)
+        o[vi_tri] = (loai, v)
+
+    chuoi = _chuoi_dung_chung(z, {v for loai, v in o.values() if loai == 's'})
+    tieu_de = [None] * (max(o) + 1 if o else 0)
+    for vi_tri, (loai, v) in o.items():
+        tieu_de[vi_tri] = chuoi.get(v) if loai == 's' else v
+    return tieu_de
+
+
+def doc_tieu_de(f):
+    # Tên cột (dòng 1 của sheet đầu tiên) đúng như doc_excel_loc / pd.read_excel nhận
+    data = f if isinstance(f, bytes) else f.read()
+    if dinh_dang(data) == 'xls':
+        # Đọc hết generator để giải phóng workbook ngay (release_resources)
+        dong = list(_dong_xls(data, so_dong=1))
+        header = dong[0] if dong else ()
+    else:
+        header = _tieu_de_xlsx(data)
+    header = [_o_xlsx(v) for v in header]
+    while header and header[-1] == '':
+        header.pop()
+    return [str(h) for h in header]
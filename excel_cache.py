@@ -0,0 +1,142 @@
+# excel_cache.py
+
+import hashlib
+import os
+import uuid
+
+import pandas as pd
+
+from doc_luong import doc_excel_loc, engine_doc_luong
+from excel_engine import chon_engine, read_excel
+
+# ============================================================
+# CACHE FILE EXCEL ĐÃ PARSE (THEO HASH NỘI DUNG FILE)
+# ============================================================
+# Lần đầu đọc một file Excel: parse bằng pd.read_excel rồi ghi bản sao dạng
+# Parquet vào CACHE_DIR. Các lần chạy sau (kể cả phiên khác, khởi động lại
+# server) cùng nội dung file sẽ đọc lại từ Parquet thay vì parse lại .xls/.xlsx.
+# loc_dong (xem doc_luong.py): chỉ đọc các dòng khớp điều kiện bằng bộ đọc
+# luồng; bản cache khi đó chỉ chứa các dòng này (khóa cache gồm cả điều kiện).
+# Engine parse chọn theo định dạng file (excel_engine.py) và nằm trong khóa
+# cache, để bản cache luôn ứng với đúng engine đã đọc.
+
+CACHE_DIR = os.environ.get(
+    "CRM_CACHE_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache_excel")
+)
+
+# Dung lượng tối đa của thư mục cache, vượt quá thì xóa file ít dùng nhất (LRU)
+CACHE_MAX_BYTES = int(os.environ.get("CRM_CACHE_MAX_MB", "2048")) * 1024 * 1024
+
+
+def read_bytes(f):
+    # f có thể là bytes, UploadedFile của Streamlit, file-like hoặc đường dẫn
+    if isinstance(f, bytes):
+        return f
+    if hasattr(f, "getvalue"):
+        return f.getvalue()
+    if hasattr(f, "read"):
+        f.seek(0)
+        return f.read()
+    with open(f, "rb") as fh:
+        return fh.read()
+
+
+def file_hash(f):
+    return hashlib.sha256(read_bytes(f)).hexdigest()
+
+
+def _cache_key(data, read_kwargs):
+    h = hashlib.sha256(data)
+    # Tham số đọc khác nhau (sheet, cột...) cho ra DataFrame khác nhau
+    h.update(repr(sorted(read_kwargs.items())).encode("utf-8"))
+    return h.hexdigest()
+
+
+def _evict(max_bytes=None):
+    max_bytes = CACHE_MAX_BYTES if max_bytes is None else max_bytes
+    entries = []
+    for name in os.listdir(CACHE_DIR):
+        if not name.endswith(".parquet"):
+            continue
+        path = os.path.join(CACHE_DIR, name)
+        try:
+            info = os.stat(path)
+        except FileNotFoundError:
+            continue
+        entries.append((info.st_mtime, info.st_size, path))
+
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total -= size
+
+
+def _duong_dan_cache(data, loc_dong, read_kwargs):
+    engine = chon_engine(data) if loc_dong is None else engine_doc_luong(data)
+    khoa = dict(read_kwargs, engine=engine)
+    if loc_dong is not None:
+        khoa['loc_dong'] = loc_dong
+    return os.path.join(CACHE_DIR, _cache_key(data, khoa) + ".parquet"), engine
+
+
+def _parse_va_ghi(data, path, engine, loc_dong, read_kwargs):
+    if loc_dong is not None:
+        df = doc_excel_loc(data, loc_dong, engine=engine, **read_kwargs)
+    else:
+        df = read_excel(data, engine=engine, **read_kwargs)
+
+    tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        df.to_parquet(tmp_path, index=True)
+        os.replace(tmp_path, path)
+        _evict()
+    except Exception:
+        # Cột kiểu hỗn hợp không ghi được Parquet: bỏ qua cache, vẫn trả kết quả
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+    return df
+
+
+def read_excel_cached(f, loc_dong=None, **read_kwargs):
+    data = read_bytes(f)
+    path, engine = _duong_dan_cache(data, loc_dong, read_kwargs)
+
+    if os.path.exists(path):
+        try:
+            df = pd.read_parquet(path)
+            # Cập nhật mtime để đánh dấu vừa được dùng (phục vụ LRU)
+            os.utime(path)
+            return df
+        except Exception:
+            # File cache hỏng / đang bị xóa -> parse lại từ Excel
+            pass
+
+    return _parse_va_ghi(data, path, engine, loc_dong, read_kwargs)
+
+
+def ghi_cache_excel(f, loc_dong=None, **read_kwargs):
+    # Như read_excel_cached nhưng không đọc lại bản cache đã có: trả về
+    # (đường dẫn Parquet, None), hoặc (None, DataFrame) khi không ghi được cache
+    data = read_bytes(f)
+    path, engine = _duong_dan_cache(data, loc_dong, read_kwargs)
+    if os.path.exists(path):
+        try:
+            os.utime(path)
+            return path, None
+        except FileNotFoundError:
+            pass
+    df = _parse_va_ghi(data, path, engine, loc_dong, read_kwargs)
+    return (path, None) if os.path.exists(path) else (None, df)
+
+
+def clear_cache():
+    if os.path.isdir(CACHE_DIR):
+        _evict(max_bytes=0)
@@ -0,0 +1,58 @@
+# excel_engine.py
+
+import importlib.util
+import io
+import os
+
+import pandas as pd
+
+# ============================================================
+# CHỌN ENGINE ĐỌC EXCEL THEO ĐỊNH DẠNG FILE
+# ============================================================
+# pd.read_excel mặc định dùng xlrd (.xls) và openpyxl (.xlsx), đều viết bằng
+# Python thuần nên chậm. Mỗi định dạng có danh sách engine theo thứ tự ưu
+# tiên; lấy engine đầu tiên đã cài:
+#   - calamine (gói python-calamine, viết bằng Rust): đọc cả .xls và .xlsx,
+#     nhanh hơn nhiều lần, cho ra DataFrame giống hệt (kiểm tra bằng
+#     tests/test_excel_engine.py – cả cột ngày và CIF dạng số; thời gian đo
+#     bằng benchmarks/bench_engine.py)
+#   - chưa cài thì dùng lại engine mặc định như trước
+# Biến môi trường CRM_EXCEL_ENGINE ép dùng một engine (so sánh / khắc phục
+# khi nghi engine nhanh đọc sai một file); chỉ áp dụng cho định dạng engine đó
+# đọc được, ví dụ CRM_EXCEL_ENGINE=openpyxl vẫn đọc .xls bằng calamine/xlrd.
+
+ENGINE_THEO_DINH_DANG = {
+    'xls': ('calamine', 'xlrd'),
+    'xlsx': ('calamine', 'openpyxl'),
+}
+
+# Engine -> module cần có
+_MODULE = {
+    'calamine': 'python_calamine',
+    'xlrd': 'xlrd',
+    'openpyxl': 'openpyxl',
+}
+
+ENGINE_CHI_DINH = os.environ.get("CRM_EXCEL_ENGINE") or None
+
+
+def dinh_dang(data):
+    # File BIFF (.xls) bắt đầu bằng chữ ký OLE2, còn lại coi là .xlsx (zip)
+    return 'xls' if data[:8] == b'\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1' else 'xlsx'
+
+
+def co_engine(engine):
+    return importlib.util.find_spec(_MODULE[engine]) is not None
+
+
+def chon_engine(data, engine=None):
+    ds = ENGINE_THEO_DINH_DANG[dinh_dang(data)]
+    engine = engine or ENGINE_CHI_DINH
+    if engine in ds:
+        return engine
+    return next((e for e in ds if co_engine(e)), ds[-1])
+
+
+def read_excel(data, engine=None, **read_kwargs):
+    # data: bytes của file; tham số còn lại như pd.read_excel
+    return pd.read_excel(io.BytesIO(data), engine=chon_engine(data, engine), **read_kwargs)
@@ -0,0 +1,156 @@
+# export.py
+
+import io
+import tempfile
+import zipfile
+from datetime import date
+
+import pandas as pd
+import xlsxwriter
+
+# ============================================================
+# XUẤT FILE EXCEL KẾT QUẢ (GIỐNG SCRIPT GỐC)
+# ============================================================
+
+# (tên sheet, khóa trong dict kết quả)
+SHEETS_KQ = [
+    ('df_crm4_LOAI_TS', 'df_crm4_filtered'),
+    ('KQ_CRM4', 'pivot_final'),
+    ('Pivot_crm4', 'pivot_merge'),
+    ('df_crm32_LOAI_TS', 'df_crm32_filtered'),
+    ('KQ_KH', 'pivot_full'),
+    ('Pivot_crm32', 'pivot_mucdich'),
+    ('tieu chi 4', 'df_delay'),
+    ('tieu chi 3_dot3', 'df_gop'),
+    ('tieu chi 3_dot3_1', 'df_count'),
+    ('tieu chi 2_dot3', 'df_bds_matched'),
+]
+
+# Số dòng chuyển sang kiểu Python mỗi lượt khi ghi streaming
+CHUNK_ROWS = 10000
+
+# Giới hạn của một sheet Excel (.xlsx); xlsxwriter bỏ qua, không báo lỗi, các ô vượt quá
+MAX_DONG_EXCEL = 1048576
+MAX_COT_EXCEL = 16384
+
+# Như mặc định của pd.ExcelWriter: ô date chỉ có ngày, ô datetime có cả giờ
+DATE_FORMAT = 'yyyy-mm-dd'
+DATETIME_FORMAT = 'yyyy-mm-dd hh:mm:ss'
+
+# File kết quả nhỏ hơn ngưỡng này nằm trong RAM, lớn hơn thì tràn ra file tạm
+SPOOL_MAX_BYTES = 64 * 1024 * 1024
+
+
+def xuat_excel_kq(results, output):
+    # Cách cũ: openpyxl dựng toàn bộ workbook trong RAM rồi mới ghi
+    # output: đường dẫn file hoặc buffer (io.BytesIO)
+    with pd.ExcelWriter(output, engine='openpyxl') as writer:
+        for sheet_name, key in SHEETS_KQ:
+            results[key].to_excel(writer, sheet_name=sheet_name, index=False)
+
+
+def _kiem_tra_kich_thuoc(sheet_name, df):
+    # Báo lỗi như pandas/openpyxl thay vì để xlsxwriter cắt bớt dòng (kể cả dòng tiêu đề)
+    if len(df) + 1 > MAX_DONG_EXCEL or len(df.columns) > MAX_COT_EXCEL:
+        raise ValueError(
+            f"Sheet '{sheet_name}' quá lớn: {len(df) + 1:,} dòng, {len(df.columns):,} cột "
+            f"(tối đa {MAX_DONG_EXCEL:,} dòng, {MAX_COT_EXCEL:,} cột). Dùng xuất nhanh ZIP Parquet/CSV."
+        )
+
+
+def _ghi_sheet(workbook, sheet_name, df, header_format, date_format=None):
+    ws = workbook.add_worksheet(sheet_name)
+    ws.write_row(0, 0, [str(c) for c in df.columns], header_format)
+    if date_format is not None:
+        # default_date_format của workbook áp cho mọi ô ngày; datetime.date (vd.
+        # cột ngày của df_delay) ghi riêng với định dạng không có giờ
+        ws.add_write_handler(date, lambda ws, r, c, v, *_: ws.write_datetime(r, c, v, date_format))
+
+    # constant_memory chỉ giữ một dòng trong RAM nên phải ghi lần lượt theo dòng
+    for start in range(0, len(df), CHUNK_ROWS):
+        chunk = df.iloc[start:start + CHUNK_ROWS].astype(object)
+        chunk = chunk.where(chunk.notna(), None)
+        for r, row in enumerate(chunk.itertuples(index=False, name=None), start=start + 1):
+            ws.write_row(r, 0, row)
+
+
+def xuat_excel_kq_streaming(results, output):
+    # xlsxwriter ở chế độ constant_memory: mỗi dòng được ghi thẳng ra file tạm
+    # của sheet rồi giải phóng, không dựng object graph của cả workbook.
+    # output: đường dẫn file hoặc file-like (SpooledTemporaryFile, BytesIO...)
+    # Kiểm tra mọi sheet trước khi ghi để không để lại file dở dang
+    for sheet_name, key in SHEETS_KQ:
+        _kiem_tra_kich_thuoc(sheet_name, results[key])
+    workbook = xlsxwriter.Workbook(output, {
+        'constant_memory': True,
+        'default_date_format': DATETIME_FORMAT,
+        'nan_inf_to_errors': True,
+    })
+    header_format = workbook.add_format({'bold': True, 'border': 1, 'align': 'center', 'valign': 'top'})
+    date_format = workbook.add_format({'num_format': DATE_FORMAT})
+    for sheet_name, key in SHEETS_KQ:
+        _ghi_sheet(workbook, sheet_name, results[key], header_format, date_format)
+    workbook.close()
+
+
+def excel_kq_bytes(results):
+    # Dùng cho st.download_button: ghi ra SpooledTemporaryFile rồi trả về bytes
+    with tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_BYTES) as tmp:
+        xuat_excel_kq_streaming(results, tmp)
+        tmp.seek(0)
+        return tmp.read()
+
+
+# ============================================================
+# XUẤT NHANH: ZIP CÁC BẢNG DẠNG PARQUET / CSV
+# ============================================================
+
+SHEETS_ZIP = [
+    'pivot_full',
+    'pivot_merge',
+    'pivot_mucdich',
+    'df_delay',
+    'df_gop',
+    'df_count',
+    'df_bds_matched',
+]
+
+
+def _parquet_bytes(df):
+    buf = io.BytesIO()
+    try:
+        df.to_parquet(buf, index=False)
+    except Exception:
+        # Cột object lẫn nhiều kiểu (vd. ngày dạng số lẫn datetime) -> ghi dạng chuỗi
+        buf = io.BytesIO()
+        obj_cols = df.select_dtypes(include='object').columns
+        df.astype({c: str for c in obj_cols}).to_parquet(buf, index=False)
+    return buf.getvalue()
+
+
+def zip_kq_bytes(results, dinh_dang='parquet'):
+    # dinh_dang: 'parquet' hoặc 'csv'; mỗi bảng một file trong ZIP
+    with tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_BYTES) as tmp:
+        with zipfile.ZipFile(tmp, 'w') as zf:
+            for key in SHEETS_ZIP:
+                df = results[key]
+                if dinh_dang == 'parquet':
+                    # Parquet đã nén sẵn, không nén thêm trong ZIP
+                    zf.writestr(f'{key}.parquet', _parquet_bytes(df), compress_type=zipfile.ZIP_STORED)
+                else:
+                    # utf-8-sig để Excel mở đúng tiếng Việt
+                    data = df.to_csv(index=False).encode('utf-8-sig')
+                    zf.writestr(f'{key}.csv', data, compress_type=zipfile.ZIP_DEFLATED, compresslevel=1)
+        tmp.seek(0)
+        return tmp.read()
+
+
+# (nhãn hiển thị, tên file, mime, hàm tạo bytes)
+DINH_DANG_XUAT = {
+    'xlsx': ('Excel – KQ_1405_.xlsx', 'KQ_1405_.xlsx',
+             'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet', excel_kq_bytes),
+    'parquet': ('Xuất nhanh – ZIP Parquet', 'KQ_1405_parquet.zip',
+                'application/zip', lambda results: zip_kq_bytes(results, 'parquet')),
+    'csv': ('Xuất nhanh – ZIP CSV', 'KQ_1405_csv.zip',
+            'application/zip', lambda results: zip_kq_bytes(results, 'csv')),
+}
@@ -0,0 +1,55 @@
+# flags.py
+
+import numpy as np
+import pandas as pd
+
+from cif import ma_cif
+
+# ============================================================
+# GẮN CỜ TIÊU CHÍ THEO CIF (VECTOR HÓA)
+# ============================================================
+# Thay cho các .apply(lambda x: 'x' if x in <mảng numpy> else '') – mỗi lần
+# "in" là một lượt quét tuyến tính -> O(n·m). Ở đây cột khóa được factorize
+# một lần, mỗi tiêu chí chỉ cần isin (bảng băm) trên các giá trị khóa duy nhất
+# rồi trải ngược về từng dòng theo mã factorize. Khóa đã là Categorical theo
+# chiều CIF (cif.py) thì mã category chính là mã factorize, tập CIF của từng
+# tiêu chí cũng đổi thẳng sang mã -> cờ tra bằng chỉ số mảng.
+
+
+def gan_co_theo_cif(df, key, co):
+    # co: {tên cột cờ: (tập CIF | Series bool cùng index với df, ký hiệu)}
+    # CIF rỗng (NaN) không bao giờ được gắn cờ theo tập CIF.
+    s = df[key]
+    if isinstance(s.dtype, pd.CategoricalDtype):
+        codes = s.cat.codes.to_numpy()
+    else:
+        codes, uniques = pd.factorize(s)
+        uniques = pd.Index(uniques)
+
+    cot_co = {}
+    for ten_cot, (gia_tri, ky_hieu) in co.items():
+        if isinstance(gia_tri, pd.Series) and gia_tri.dtype == bool:
+            mask = gia_tri.to_numpy()
+        elif isinstance(s.dtype, pd.CategoricalDtype):
+            # Ô cuối (chỉ số -1 = CIF rỗng) luôn False
+            co_ma = np.zeros(len(s.cat.categories) + 1, dtype=bool)
+            co_ma[ma_cif(gia_tri, s.dtype)] = True
+            co_ma[-1] = False
+            mask = co_ma[codes]
+        else:
+            mask_unique = uniques.isin(pd.Index(gia_tri).dropna())
+            mask = np.where(codes >= 0, mask_unique[codes], False)
+        cot_co[ten_cot] = np.where(mask, ky_hieu, '')
+
+    df = df.drop(columns=[c for c in cot_co if c in df.columns])
+    return pd.concat([df, pd.DataFrame(cot_co, index=df.index)], axis=1)
+
+
+def co_gia_tri(s):
+    # Tương đương str(x).strip() != '' trên từng dòng (NaN -> 'nan' -> có giá trị)
+    return s.isna() | (s.astype(str).str.strip() != '')
+
+
+def danh_dau_ma_moi(ma, ket_qua_tra_cuu):
+    # 'MỚI' khi dòng có mã nhưng tra bảng mã không ra kết quả
+    return np.where(co_gia_tri(ma) & ket_qua_tra_cuu.isna(), 'MỚI', '')
@@ -0,0 +1,90 @@
+# gn_tt.py
+
+import numpy as np
+import pandas as pd
+
+# ============================================================
+# KHỚP GIẢI NGÂN (MỤC 56) – TẤT TOÁN (MỤC 55) THEO CIF & NGÀY
+# ============================================================
+# Hash join trực tiếp trên khóa (CIF[, KHE_UOC], ngày) thay cho
+# concat + sort + groupby(...).size().unstack():
+#   - CIF / KHE_UOC được factorize chung cho hai phía thành mã số nguyên (CIF
+#     đã mã hóa theo chiều CIF – cif.py – thì dùng thẳng mã category), ngày
+#     đổi thành số ngày -> join trên cột int64, không so chuỗi
+#   - mỗi phía chỉ giữ các khóa duy nhất (khóa, ngày)
+#   - cửa sổ N ngày: chia ngày thành ô rộng N+1 ngày; cặp cách nhau <= N ngày
+#     chỉ có thể nằm cùng ô hoặc ô kề bên, nên mỗi khóa tất toán chỉ nhân 3
+#     (ô -1, 0, +1) bất kể N, join bằng bảng băm rồi lọc |lệch| <= N
+#     -> tuyến tính theo số dòng, không cần sắp xếp
+#   - cung_khe_uoc=True: chỉ khớp giải ngân và tất toán trên cùng khế ước
+# so_ngay=0, cung_khe_uoc=False cho đúng tiêu chí gốc "GN và TT trong cùng 1 ngày".
+
+
+def _ma_khoa(df_gn, df_tt, khoa):
+    # Mã int64 chung cho khóa (CIF[, KHE_UOC]) của cả hai phía, -1 khi thiếu CIF
+    n_gn = len(df_gn)
+    ma = np.zeros(n_gn + len(df_tt), dtype='int64')
+    thieu = np.zeros(len(ma), dtype=bool)
+    uniques = []
+    for cot in khoa:
+        s = pd.concat([df_gn[cot], df_tt[cot]], ignore_index=True)
+        if isinstance(s.dtype, pd.CategoricalDtype):
+            codes = s.cat.codes.to_numpy().astype('int64')
+            thieu |= codes < 0
+            u = pd.CategoricalIndex(s.cat.categories, dtype=s.dtype)
+        else:
+            codes, u = pd.factorize(s.astype(str))
+        ma = ma * (len(u) + 1) + codes
+        uniques.append(u)
+    ma[thieu] = -1
+    return ma[:n_gn], ma[n_gn:], uniques
+
+
+def _so_ngay(s):
+    ngay = pd.to_datetime(s, errors='coerce')
+    return ngay.to_numpy(dtype='datetime64[D]').astype('int64'), ngay.isna().to_numpy()
+
+
+def _khoa_ngay(ma, s):
+    ngay, thieu = _so_ngay(s)
+    thieu = thieu | (ma < 0)
+    return pd.DataFrame({'MA': ma[~thieu], 'NGAY': ngay[~thieu]}).drop_duplicates(ignore_index=True)
+
+
+def khop_gn_tt(df_gn, df_tt, so_ngay=0, cung_khe_uoc=False):
+    # df_gn, df_tt: có cột CIF, KHE_UOC, NGAY
+    # Trả về các cặp (ngày giải ngân, ngày tất toán) cách nhau không quá so_ngay
+    khoa = ['CIF', 'KHE_UOC'] if cung_khe_uoc else ['CIF']
+    ma_gn, ma_tt, uniques = _ma_khoa(df_gn, df_tt, khoa)
+    gn = _khoa_ngay(ma_gn, df_gn['NGAY'])
+    tt = _khoa_ngay(ma_tt, df_tt['NGAY'])
+
+    rong = so_ngay + 1
+    gn['O'] = gn['NGAY'] // rong
+    lech_o = [0] if so_ngay == 0 else [-1, 0, 1]
+    tt = pd.concat([tt.assign(O=tt['NGAY'] // rong + d) for d in lech_o], ignore_index=True)
+
+    cap = gn.merge(tt, on=['MA', 'O'], how='inner', suffixes=('_GN', '_TT'))
+    cap = cap[(cap['NGAY_TT'] - cap['NGAY_GN']).abs() <= so_ngay]
+
+    # Giải mã về CIF[, KHE_UOC] và ngày
+    out = {}
+    ma = cap['MA'].to_numpy()
+    for cot, u in zip(reversed(khoa), reversed(uniques)):
+        out[cot] = u.take(ma % (len(u) + 1))
+        ma = ma // (len(u) + 1)
+    out = pd.DataFrame({cot: out[cot] for cot in khoa})
+    out['NGAY_GN'] = cap['NGAY_GN'].to_numpy().astype('datetime64[D]').astype('datetime64[ns]')
+    out['NGAY_TT'] = cap['NGAY_TT'].to_numpy().astype('datetime64[D]').astype('datetime64[ns]')
+    out['SO_NGAY_CACH'] = cap['NGAY_TT'].to_numpy() - cap['NGAY_GN'].to_numpy()
+    return out
+
+
+def ngay_co_khop(df, cap):
+    # Dòng (CIF, NGAY) của df nằm trong một cặp khớp (ở phía giải ngân hoặc tất toán)
+    ngay = pd.concat([
+        cap[['CIF', 'NGAY_GN']].set_axis(['CIF', 'NGAY'], axis=1),
+        cap[['CIF', 'NGAY_TT']].set_axis(['CIF', 'NGAY'], axis=1),
+    ]).drop_duplicates()
+    khoa_df = pd.MultiIndex.from_arrays([df['CIF'], pd.to_datetime(df['NGAY']).dt.normalize()])
+    return khoa_df.isin(pd.MultiIndex.from_frame(ngay))
@@ -0,0 +1,130 @@
+# ingest.py
+
+import io
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import pandas as pd
+
+from excel_cache import ghi_cache_excel, read_bytes, read_excel_cached
+
+# ============================================================
+# ĐỌC NHIỀU FILE EXCEL SONG SONG (CRM4 / RPT_CRM_32)
+# ============================================================
+# Tiến trình con không tạo bằng fork: server Streamlit chạy nhiều luồng, fork
+# giữa chừng có thể chép theo khóa đang bị luồng khác giữ. forkserver (Linux /
+# macOS) fork từ một tiến trình sạch đã nạp sẵn module này; Windows chỉ có spawn.
+# Tiến trình con kiểu này nạp lại script chính (app.py chạy dưới tên
+# __mp_main__, không có phiên Streamlit nên không làm gì) nên khởi động chậm:
+# pool tạo một lần cho mỗi số tiến trình rồi dùng lại (pool_chung).
+# Không có xu_ly, tiến trình con chỉ ghi bản Parquet vào cache (excel_cache) và
+# trả về đường dẫn; tiến trình chính đọc lại Parquet thay vì nhận DataFrame
+# pickle qua pipe.
+
+DEFAULT_WORKERS = os.cpu_count() or 1
+
+if 'forkserver' in multiprocessing.get_all_start_methods():
+    MP_CONTEXT = multiprocessing.get_context('forkserver')
+    MP_CONTEXT.set_forkserver_preload(['ingest'])
+else:
+    MP_CONTEXT = multiprocessing.get_context('spawn')
+
+
+_POOL = {}
+_KHOA_POOL = threading.Lock()
+
+
+def tao_pool(max_workers=None, **kwargs):
+    return ProcessPoolExecutor(max_workers=max_workers, mp_context=MP_CONTEXT, **kwargs)
+
+
+def pool_chung(max_workers):
+    with _KHOA_POOL:
+        if max_workers not in _POOL:
+            _POOL[max_workers] = tao_pool(max_workers=max_workers)
+        return _POOL[max_workers]
+
+
+def _bo_pool(max_workers, pool):
+    # Một tiến trình con chết (vd. hết bộ nhớ) làm hỏng cả pool -> lần sau tạo lại
+    with _KHOA_POOL:
+        if _POOL.get(max_workers) is pool:
+            del _POOL[max_workers]
+
+
+def _file_name(f, i):
+    return getattr(f, "name", None) or (f if isinstance(f, str) else f"file_{i + 1}")
+
+
+def _read_one(job):
+    # Chạy trong tiến trình con: nhận (tên file, bytes) để không phải pickle UploadedFile
+    name, data, xu_ly, tra_duong_dan, read_kwargs = job
+    t0 = time.perf_counter()
+    if tra_duong_dan and xu_ly is None:
+        path, df = ghi_cache_excel(data, **read_kwargs)
+        if path is not None:
+            # Số dòng điền lại ở _nhan_ket_qua sau khi đọc Parquet
+            return path, {"file": name, "so_dong": None, "giay": round(time.perf_counter() - t0, 3)}
+    else:
+        df = read_excel_cached(io.BytesIO(data), **read_kwargs)
+    # Bộ đọc luồng (doc_luong.py) chỉ trả về các dòng cần dùng, số dòng cả file ở attrs
+    so_dong = df.attrs.get('so_dong_goc', len(df))
+    if xu_ly is not None:
+        df = xu_ly(df)
+    return df, {"file": name, "so_dong": so_dong, "giay": round(time.perf_counter() - t0, 3)}
+
+
+def _nhan_ket_qua(ket_qua, job):
+    # Tiến trình con trả về đường dẫn cache -> đọc Parquet (cache vừa bị xóa thì đọc lại file)
+    df, tg = ket_qua
+    if isinstance(df, str):
+        try:
+            df = pd.read_parquet(df)
+        except Exception:
+            df = read_excel_cached(io.BytesIO(job[1]), **job[4])
+        tg["so_dong"] = df.attrs.get('so_dong_goc', len(df))
+    return df, tg
+
+
+def read_excel_files(files, max_workers=None, xu_ly=None, **read_kwargs):
+    # Trả về (danh sách DataFrame theo đúng thứ tự upload, thời gian đọc từng file).
+    # xu_ly: hàm (pickle được) áp lên từng file ngay trong tiến trình con, vd. chỉ
+    # giữ các dòng cần dùng để không phải gửi và giữ cả file trong tiến trình chính;
+    # khi đó danh sách trả về là kết quả của xu_ly.
+    workers = min(max_workers or DEFAULT_WORKERS, len(files))
+    jobs = [(_file_name(f, i), read_bytes(f), xu_ly, workers > 1, read_kwargs) for i, f in enumerate(files)]
+
+    if workers <= 1:
+        results = [_read_one(job) for job in jobs]
+    else:
+        executor = pool_chung(workers)
+        try:
+            # executor.map giữ nguyên thứ tự đầu vào -> kết quả concat ổn định
+            results = [_nhan_ket_qua(kq, job) for kq, job in zip(executor.map(_read_one, jobs), jobs)]
+        except BrokenProcessPool:
+            _bo_pool(workers, executor)
+            raise
+
+    frames = [df for df, _ in results]
+    timings = [t for _, t in results]
+    return frames, timings
+
+
+# ============================================================
+# PARSE TRƯỚC Ở NỀN NGAY KHI UPLOAD
+# ============================================================
+# Chỉ ghi vào cache Parquet (excel_cache), không gửi DataFrame về: lúc chạy xử
+# lý, read_excel_cached / read_excel_files với cùng tham số đọc sẽ trúng cache.
+
+def _bo_khung(df):
+    return None
+
+
+def nap_truoc(executor, f, **read_kwargs):
+    # Future trả về (None, thời gian đọc file như read_excel_files)
+    job = (_file_name(f, 0), read_bytes(f), _bo_khung, False, read_kwargs)
+    return executor.submit(_read_one, job)
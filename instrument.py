@@ -0,0 +1,97 @@
+# instrument.py
+
+import json
+import os
+import time
+import tracemalloc
+from datetime import datetime
+
+import pandas as pd
+
+# ============================================================
+# ĐO THỜI GIAN / CPU / BỘ NHỚ TỪNG GIAI ĐOẠN CỦA process_data
+# ============================================================
+# Dùng:
+#   do = DoHieuNang()
+#   do.bat_dau('Mục 17', dong_vao=len(df_sol))
+#   ...
+#   do.ket_thuc(dong_ra=len(df_bds_matched))
+#   do.bang()            -> DataFrame hiển thị
+#   ghi_log(do.bang(), **meta) -> nối thêm từng giai đoạn dạng JSON lines vào LOG_PATH
+#
+# Bộ nhớ đỉnh đo bằng tracemalloc (chỉ trong tiến trình hiện tại, không tính
+# các tiến trình con đọc file song song). Mặc định tắt: tracemalloc làm chậm
+# process_data nhiều lần và dùng chung cả tiến trình, nên các phiên Streamlit /
+# luồng xuất file chạy cùng lúc làm sai số đỉnh của nhau. Chỉ bật khi đo riêng
+# (bench_pipeline --bo-nho hoặc tùy chọn trong sidebar).
+
+LOG_PATH = os.environ.get(
+    "CRM_LOG_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "logs", "process_data.jsonl")
+)
+
+
+class DoHieuNang:
+    def __init__(self, do_bo_nho=False):
+        self.do_bo_nho = do_bo_nho
+        self.records = []
+        self._hien_tai = None
+        self._tu_bat_tracemalloc = False
+
+    def bat_dau(self, giai_doan, dong_vao=None):
+        if self._hien_tai is not None:
+            self.ket_thuc()
+
+        if self.do_bo_nho:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                self._tu_bat_tracemalloc = True
+            tracemalloc.reset_peak()
+
+        self._hien_tai = {
+            "giai_doan": giai_doan,
+            "dong_vao": dong_vao,
+            "_wall": time.perf_counter(),
+            "_cpu": time.process_time(),
+        }
+
+    def ket_thuc(self, dong_ra=None):
+        rec = self._hien_tai
+        if rec is None:
+            return
+        self._hien_tai = None
+
+        rec["dong_ra"] = dong_ra
+        rec["giay"] = round(time.perf_counter() - rec.pop("_wall"), 4)
+        rec["cpu_giay"] = round(time.process_time() - rec.pop("_cpu"), 4)
+        rec["bo_nho_dinh_mb"] = None
+        if self.do_bo_nho and tracemalloc.is_tracing():
+            rec["bo_nho_dinh_mb"] = round(tracemalloc.get_traced_memory()[1] / 1024 ** 2, 2)
+        self.records.append(rec)
+
+    def dong(self):
+        # Kết thúc giai đoạn đang mở và tắt tracemalloc nếu do lớp này bật
+        self.ket_thuc()
+        if self._tu_bat_tracemalloc:
+            tracemalloc.stop()
+            self._tu_bat_tracemalloc = False
+
+    def bang(self):
+        cols = ["giai_doan", "giay", "cpu_giay", "bo_nho_dinh_mb", "dong_vao", "dong_ra"]
+        return pd.DataFrame(self.records, columns=cols)
+
+    def ghi_log(self, path=None, **meta):
+        ghi_log(self.records, path, **meta)
+
+
+def ghi_log(records, path=None, **meta):
+    # records: danh sách dict hoặc DataFrame từ DoHieuNang.bang()
+    if isinstance(records, pd.DataFrame):
+        # NaN không hợp lệ trong JSON -> null
+        records = records.astype(object).where(records.notna(), None).to_dict("records")
+    path = path or LOG_PATH
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    thoi_diem = datetime.now().isoformat(timespec="seconds")
+    with open(path, "a", encoding="utf-8") as f:
+        for rec in records:
+            f.write(json.dumps(dict(meta, thoi_diem=thoi_diem, **rec), ensure_ascii=False, default=str) + "\n")
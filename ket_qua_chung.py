@@ -0,0 +1,132 @@
+# ket_qua_chung.py
+
+import os
+import threading
+from collections import OrderedDict
+
+import pandas as pd
+
+from memory import bo_nho_mb
+
+# ============================================================
+# BỘ NHỚ KẾT QUẢ DÙNG CHUNG GIỮA CÁC PHIÊN (MỘT SERVER – NHIỀU KIỂM TOÁN VIÊN)
+# ============================================================
+# Nhiều người mở cùng chi nhánh với cùng bộ file thì mỗi phiên trước đây tự
+# chạy lại process_data và giữ riêng một bản mọi bảng kết quả. Ở đây:
+#   - kết quả giữ một lần cho cả tiến trình server, khóa theo (khóa nội dung
+#     các file, chi nhánh, ngày đánh giá, địa bàn, tham số tiêu chí)
+#   - tổng dung lượng các bảng giới hạn bởi NGAN_SACH_BYTES, vượt quá thì bỏ
+#     kết quả lâu không dùng nhất (LRU); kết quả lớn hơn cả ngân sách thì không giữ
+#   - nhiều phiên cùng hỏi một khóa chưa có: chỉ một phiên tính, các phiên còn
+#     lại đợi rồi dùng chung kết quả
+#   - mỗi phiên nhận bản sao nông (copy(deep=False)) của từng bảng: dùng chung
+#     vùng nhớ, nhưng với copy-on-write của pandas (bắt buộc từ pandas 3, xem
+#     requirements.txt) một phiên sửa bảng thì chỉ bảng của phiên đó được chép
+#     ra, bản dùng chung không đổi
+#   - bộ nhớ đệm giai đoạn (bo_nho_dem của pipeline, gồm cả du_lieu toàn quốc)
+#     cũng nằm ở đây, một bộ cho mỗi bộ file, và tính vào cùng ngân sách thay vì
+#     mỗi phiên giữ riêng một bộ trong st.session_state
+
+NGAN_SACH_BYTES = int(os.environ.get("CRM_KQ_CHUNG_MAX_MB", "2048")) * 1024 * 1024
+
+_KET_QUA = OrderedDict()   # khóa -> (kết quả hoặc bộ nhớ đệm giai đoạn, số byte)
+_DANG_TINH = {}            # khóa -> Lock của phiên đang tính
+_KHOA = threading.Lock()
+_DUNG_LUONG = 0
+
+
+def _kich_thuoc(gia_tri):
+    # Cộng dồn mọi DataFrame/Series lồng trong dict/list/tuple; bảng dùng chung
+    # vùng nhớ giữa kết quả và bộ nhớ đệm giai đoạn bị tính hai lần (thừa, không thiếu)
+    if isinstance(gia_tri, pd.DataFrame):
+        return int(bo_nho_mb(gia_tri) * 1024 ** 2)
+    if isinstance(gia_tri, pd.Series):
+        return int(gia_tri.memory_usage(deep=True))
+    if isinstance(gia_tri, dict):
+        return sum(_kich_thuoc(v) for v in gia_tri.values())
+    if isinstance(gia_tri, (list, tuple)):
+        return sum(_kich_thuoc(v) for v in gia_tri)
+    return 0
+
+
+def _ban_sao(results):
+    return {k: v.copy(deep=False) if isinstance(v, pd.DataFrame) else v for k, v in results.items()}
+
+
+def _lay(khoa):
+    with _KHOA:
+        muc = _KET_QUA.get(khoa)
+        if muc is None:
+            return None
+        _KET_QUA.move_to_end(khoa)
+        return muc[0]
+
+
+def _luu(khoa, gia_tri):
+    global _DUNG_LUONG
+    kich_thuoc = _kich_thuoc(gia_tri)
+    with _KHOA:
+        if khoa in _KET_QUA:
+            _DUNG_LUONG -= _KET_QUA.pop(khoa)[1]
+        if kich_thuoc > NGAN_SACH_BYTES:
+            return
+        _KET_QUA[khoa] = (gia_tri, kich_thuoc)
+        _DUNG_LUONG += kich_thuoc
+        while _DUNG_LUONG > NGAN_SACH_BYTES:
+            _DUNG_LUONG -= _KET_QUA.popitem(last=False)[1][1]
+
+
+def lay_hoac_tinh(khoa, ham):
+    # Trả về (kết quả, có dùng lại hay không); ham() chỉ chạy khi chưa có khóa
+    results = _lay(khoa)
+    if results is not None:
+        return _ban_sao(results), True
+
+    with _KHOA:
+        khoa_tinh = _DANG_TINH.setdefault(khoa, threading.Lock())
+    with khoa_tinh:
+        # Phiên khác vừa tính xong trong lúc đợi
+        results = _lay(khoa)
+        if results is not None:
+            return _ban_sao(results), True
+        try:
+            results = ham()
+            _luu(khoa, results)
+        finally:
+            with _KHOA:
+                _DANG_TINH.pop(khoa, None)
+    return _ban_sao(results), False
+
+
+def bo_nho_giai_doan(khoa_file):
+    # Bộ nhớ đệm giai đoạn dùng chung cho bộ file; chưa có thì tạo rỗng.
+    # Gọi cap_nhat_giai_doan sau khi chạy để tính lại dung lượng
+    khoa = ('giai_doan', khoa_file)
+    with _KHOA:
+        muc = _KET_QUA.get(khoa)
+        if muc is None:
+            muc = _KET_QUA[khoa] = ({}, 0)
+        _KET_QUA.move_to_end(khoa)
+        return muc[0]
+
+
+def cap_nhat_giai_doan(khoa_file, bo_nho_dem):
+    # Đo lại bộ nhớ đệm sau khi các giai đoạn ghi thêm; vượt ngân sách thì bỏ
+    # mục lâu không dùng nhất như kết quả (lớn hơn cả ngân sách thì không giữ)
+    _luu(('giai_doan', khoa_file), bo_nho_dem)
+
+
+def thong_ke():
+    with _KHOA:
+        return {
+            'so_ket_qua': sum(1 for k in _KET_QUA if k[0] != 'giai_doan'),
+            'dung_luong_mb': _DUNG_LUONG / 1024 ** 2,
+            'ngan_sach_mb': NGAN_SACH_BYTES / 1024 ** 2,
+        }
+
+
+def xoa():
+    global _DUNG_LUONG
+    with _KHOA:
+        _KET_QUA.clear()
+        _DUNG_LUONG = 0
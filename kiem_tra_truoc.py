@@ -0,0 +1,53 @@
+# kiem_tra_truoc.py
+
+import difflib
+import time
+
+from doc_luong import doc_tieu_de
+from excel_cache import read_bytes
+from schema import SCHEMAS
+
+# ============================================================
+# KIỂM TRA TRƯỚC: SO DÒNG TIÊU ĐỀ VỚI DANH MỤC CỘT (schema.py)
+# ============================================================
+# Thiếu / đổi tên một cột (BRANCH_VAY, CAP_2, KHE_UOC, C19, NGAY_DEN_HAN_TT...)
+# trước đây chỉ lộ ra bằng KeyError sâu trong pipeline, sau khi đã parse hết
+# mọi file. Ở đây mỗi file chỉ đọc dòng tiêu đề (doc_luong.doc_tieu_de, vài
+# ms kể cả file lớn), so với SCHEMAS của loại file đó và gom đủ mọi lỗi của
+# mọi file để báo một lần, trước khi chạy.
+
+
+def kiem_tra_file(f, loai):
+    # Danh sách lỗi của một file (rỗng = hợp lệ)
+    try:
+        tieu_de = doc_tieu_de(read_bytes(f))
+    except Exception as e:
+        return [f"không đọc được dòng tiêu đề ({type(e).__name__}: {e})"]
+    if not tieu_de:
+        return ["dòng 1 không có tiêu đề cột"]
+
+    loi = []
+    # Gợi ý cột gần giống (đổi tên, sai hoa/thường, thừa khoảng trắng)
+    chuan_hoa = {c.strip().upper(): c for c in tieu_de}
+    for cot in SCHEMAS[loai]:
+        if cot in tieu_de:
+            continue
+        gan = difflib.get_close_matches(cot.upper(), list(chuan_hoa), n=1, cutoff=0.8)
+        loi.append(f"thiếu cột {cot}" + (f" (có cột '{chuan_hoa[gan[0]]}' – đổi tên?)" if gan else ""))
+    return loi
+
+
+def kiem_tra_uploads(uploads, kiem_tra=kiem_tra_file):
+    # uploads: {loại: file | [file, ...] | None}; bỏ qua loại chưa upload
+    # kiem_tra(f, loai): hàm kiểm tra một file (app truyền bản nhớ theo hash nội dung)
+    # Trả về ({tên file: [lỗi, ...]} chỉ gồm file có lỗi, số giây)
+    t0 = time.perf_counter()
+    ket_qua = {}
+    for loai, files in uploads.items():
+        if files is None:
+            continue
+        for f in files if isinstance(files, (list, tuple)) else [files]:
+            loi = kiem_tra(f, loai)
+            if loi:
+                ket_qua[f"{getattr(f, 'name', f)} ({loai})"] = loi
+    return ket_qua, round(time.perf_counter() - t0, 3)
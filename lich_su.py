@@ -0,0 +1,266 @@
+# lich_su.py
+
+import os
+import sqlite3
+from contextlib import closing
+from datetime import datetime
+
+import pandas as pd
+
+from pipeline import cot_tieu_chi
+
+# ============================================================
+# LƯU TRỮ KẾT QUẢ CÁC KỲ KIỂM TOÁN (SQLITE NHÚNG)
+# ============================================================
+# Mỗi lần chạy (chi nhánh × ngày đánh giá) được lưu thành một "kỳ" trong một
+# file SQLite cục bộ, để so sánh với kỳ trước bằng truy vấn có chỉ mục thay
+# vì mở lại các file KQ_*.xlsx cũ:
+#   - ky          : một dòng mỗi kỳ (chạy lại cùng chi nhánh + ngày -> ghi đè)
+#   - kh          : một dòng mỗi CIF mỗi kỳ (dư nợ, nhóm nợ, giá trị TS...)
+#   - co_tieu_chi : dạng dài, chỉ các cờ khác rỗng (kỳ, tiêu chí, CIF, giá trị)
+#   - crm4, crm32 : CRM4/CRM32 đã lọc chi nhánh và chuẩn hóa của kỳ
+#                   (thêm cột ky_id; cột mới phát sinh được tự thêm vào bảng)
+# Không cần cài thêm thư viện: dùng sqlite3 của Python.
+
+DB_PATH = os.environ.get(
+    "CRM_LICH_SU_DB",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".lich_su", "kiem_toan.sqlite")
+)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS ky (
+    ky_id         INTEGER PRIMARY KEY,
+    chi_nhanh     TEXT NOT NULL,
+    ngay_danh_gia TEXT NOT NULL,
+    thoi_diem     TEXT NOT NULL,
+    dia_ban_kt    TEXT,
+    so_cif        INTEGER,
+    UNIQUE (chi_nhanh, ngay_danh_gia)
+);
+CREATE TABLE IF NOT EXISTS kh (
+    ky_id       INTEGER NOT NULL,
+    cif         TEXT NOT NULL,
+    ten_kh      TEXT,
+    custtpcd    TEXT,
+    nhom_no     INTEGER,
+    du_no       REAL,
+    gia_tri_ts  REAL,
+    du_no_crm32 REAL,
+    PRIMARY KEY (ky_id, cif)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS ix_kh_cif ON kh (cif, ky_id);
+CREATE TABLE IF NOT EXISTS co_tieu_chi (
+    ky_id    INTEGER NOT NULL,
+    tieu_chi TEXT NOT NULL,
+    cif      TEXT NOT NULL,
+    gia_tri  TEXT NOT NULL,
+    PRIMARY KEY (ky_id, tieu_chi, cif)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS ix_co_tieu_chi_cif ON co_tieu_chi (cif, ky_id);
+"""
+
+# Bảng chi tiết -> (khóa trong results, cột CIF để đánh chỉ mục)
+BANG_CHI_TIET = {
+    'crm4': ('df_crm4_filtered', 'CIF_KH_VAY'),
+    'crm32': ('df_crm32_filtered', 'CUSTSEQLN'),
+}
+
+# Cột kh <- cột pivot_full
+_COT_KH = {
+    'cif': 'CIF_KH_VAY',
+    'ten_kh': 'TEN_KH_VAY',
+    'custtpcd': 'CUSTTPCD',
+    'nhom_no': 'NHOM_NO',
+    'du_no': 'DƯ NỢ',
+    'gia_tri_ts': 'GIÁ TRỊ TS',
+    'du_no_crm32': 'DƯ NỢ CRM32',
+}
+
+
+def ket_noi(path=None):
+    path = path or DB_PATH
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    # timeout: nhiều tiến trình chạy hàng loạt cùng ghi một file
+    con = sqlite3.connect(path, timeout=60)
+    con.execute("PRAGMA journal_mode=WAL")
+    con.executescript(_SCHEMA)
+    return con
+
+
+def _ngay(ngay_danh_gia):
+    return pd.Timestamp(ngay_danh_gia).strftime('%Y-%m-%d')
+
+
+def _cho_sqlite(df):
+    # Categorical -> giá trị gốc, ngày -> chuỗi ISO (sqlite3 không nhận Timestamp/Categorical)
+    df = df.copy()
+    for col in df.columns:
+        s = df[col]
+        if isinstance(s.dtype, pd.CategoricalDtype):
+            s = s.astype(object)
+        if pd.api.types.is_datetime64_any_dtype(s):
+            s = s.dt.strftime('%Y-%m-%d %H:%M:%S')
+        df[col] = s
+    return df
+
+
+def _ghi_bang_chi_tiet(con, ten, df, ky_id, cot_cif):
+    df = _cho_sqlite(df)
+    df.insert(0, 'ky_id', ky_id)
+    co_san = {r[1] for r in con.execute(f'PRAGMA table_info("{ten}")')}
+    if co_san:
+        for col in df.columns:
+            if col not in co_san:
+                con.execute(f'ALTER TABLE "{ten}" ADD COLUMN "{col}"')
+    df.to_sql(ten, con, if_exists='append', index=False, chunksize=50_000)
+    if cot_cif in df.columns:
+        con.execute(f'CREATE INDEX IF NOT EXISTS "ix_{ten}_cif" ON "{ten}" ("{cot_cif}", ky_id)')
+    con.execute(f'CREATE INDEX IF NOT EXISTS "ix_{ten}_ky" ON "{ten}" (ky_id)')
+
+
+def luu_ky(results, chi_nhanh, ngay_danh_gia, dia_ban_kt=(), path=None):
+    # Ghi một kỳ (ghi đè nếu đã có cùng chi nhánh + ngày đánh giá), trả về ky_id
+    pivot_full = results['pivot_full']
+    ngay = _ngay(ngay_danh_gia)
+
+    kh = pd.DataFrame({
+        cot: pivot_full[nguon] if nguon in pivot_full.columns else None
+        for cot, nguon in _COT_KH.items()
+    })
+    # CIF rỗng (không phải số, giữ NaN từ chiều CIF) không có khóa để lưu / so sánh giữa các kỳ
+    kh = kh[kh['cif'].notna()]
+    kh['cif'] = kh['cif'].astype(str)
+    kh = _cho_sqlite(kh).drop_duplicates('cif')
+
+    cot_co = cot_tieu_chi(pivot_full)
+    co = pivot_full[['CIF_KH_VAY'] + cot_co].melt(
+        id_vars='CIF_KH_VAY', var_name='tieu_chi', value_name='gia_tri'
+    ).rename(columns={'CIF_KH_VAY': 'cif'})
+    co = co[co['cif'].notna() & co['gia_tri'].notna() & (co['gia_tri'] != '')]
+    co['cif'] = co['cif'].astype(str)
+
+    with closing(ket_noi(path)) as con, con:
+        cu = con.execute(
+            "SELECT ky_id FROM ky WHERE chi_nhanh = ? AND ngay_danh_gia = ?", (chi_nhanh, ngay)
+        ).fetchone()
+        if cu is not None:
+            xoa_ky(cu[0], con=con)
+
+        ky_id = con.execute(
+            "INSERT INTO ky (chi_nhanh, ngay_danh_gia, thoi_diem, dia_ban_kt, so_cif) VALUES (?, ?, ?, ?, ?)",
+            (chi_nhanh, ngay, datetime.now().isoformat(timespec='seconds'), ', '.join(dia_ban_kt), len(kh))
+        ).lastrowid
+
+        cot = ['ky_id', *_COT_KH]
+        con.executemany(
+            f"INSERT INTO kh ({', '.join(cot)}) VALUES ({', '.join('?' * len(cot))})",
+            ((ky_id, *r) for r in kh.astype(object).where(kh.notna(), None).itertuples(index=False))
+        )
+        con.executemany(
+            "INSERT INTO co_tieu_chi (ky_id, tieu_chi, cif, gia_tri) VALUES (?, ?, ?, ?)",
+            ((ky_id, t, c, str(g)) for c, t, g in co[['cif', 'tieu_chi', 'gia_tri']].itertuples(index=False))
+        )
+        for ten, (khoa, cot_cif) in BANG_CHI_TIET.items():
+            if results.get(khoa) is not None:
+                _ghi_bang_chi_tiet(con, ten, results[khoa], ky_id, cot_cif)
+    return ky_id
+
+
+def xoa_ky(ky_id, path=None, con=None):
+    if con is None:
+        with closing(ket_noi(path)) as con, con:
+            return xoa_ky(ky_id, con=con)
+    bang = ['kh', 'co_tieu_chi'] + [
+        t for t in BANG_CHI_TIET
+        if con.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (t,)).fetchone()
+    ]
+    for ten in bang:
+        con.execute(f'DELETE FROM "{ten}" WHERE ky_id = ?', (ky_id,))
+    con.execute("DELETE FROM ky WHERE ky_id = ?", (ky_id,))
+
+
+# ============================================================
+# TRUY VẤN SO SÁNH
+# ============================================================
+
+def _doc(sql, params=(), path=None):
+    with closing(ket_noi(path)) as con:
+        return pd.read_sql_query(sql, con, params=params)
+
+
+def ds_ky(chi_nhanh=None, path=None):
+    sql = "SELECT * FROM ky"
+    params = ()
+    if chi_nhanh is not None:
+        sql += " WHERE chi_nhanh = ?"
+        params = (chi_nhanh,)
+    return _doc(sql + " ORDER BY chi_nhanh, ngay_danh_gia", params, path)
+
+
+def tim_ky(chi_nhanh, ngay_danh_gia, path=None):
+    ky = _doc("SELECT ky_id FROM ky WHERE chi_nhanh = ? AND ngay_danh_gia = ?",
+              (chi_nhanh, _ngay(ngay_danh_gia)), path)
+    return int(ky['ky_id'].iloc[0]) if len(ky) else None
+
+
+def ky_truoc(chi_nhanh, ngay_danh_gia, path=None):
+    # Kỳ gần nhất của cùng chi nhánh có ngày đánh giá trước ngay_danh_gia
+    ky = _doc(
+        "SELECT ky_id FROM ky WHERE chi_nhanh = ? AND ngay_danh_gia < ? ORDER BY ngay_danh_gia DESC LIMIT 1",
+        (chi_nhanh, _ngay(ngay_danh_gia)), path
+    )
+    return int(ky['ky_id'].iloc[0]) if len(ky) else None
+
+
+def cif_moi(ky_id, ky_so_sanh, path=None):
+    # CIF có trong kỳ ky_id nhưng không có trong kỳ so sánh
+    return _doc("""
+        SELECT k.cif, k.ten_kh, k.custtpcd, k.nhom_no, k.du_no, k.gia_tri_ts
+        FROM kh k
+        WHERE k.ky_id = ?
+          AND NOT EXISTS (SELECT 1 FROM kh t WHERE t.ky_id = ? AND t.cif = k.cif)
+        ORDER BY k.du_no DESC
+    """, (ky_id, ky_so_sanh), path)
+
+
+def thay_doi_co(ky_id, ky_so_sanh, path=None):
+    # Cờ tiêu chí bật mới / tắt đi giữa kỳ so sánh (TRUOC) và kỳ ky_id (SAU)
+    return _doc("""
+        SELECT s.cif, s.tieu_chi, t.gia_tri AS truoc, s.gia_tri AS sau, 'Bật mới' AS thay_doi
+        FROM co_tieu_chi s
+        LEFT JOIN co_tieu_chi t ON t.ky_id = ? AND t.tieu_chi = s.tieu_chi AND t.cif = s.cif
+        WHERE s.ky_id = ? AND t.cif IS NULL
+        UNION ALL
+        SELECT t.cif, t.tieu_chi, t.gia_tri AS truoc, NULL AS sau, 'Tắt đi' AS thay_doi
+        FROM co_tieu_chi t
+        LEFT JOIN co_tieu_chi s ON s.ky_id = ? AND s.tieu_chi = t.tieu_chi AND s.cif = t.cif
+        WHERE t.ky_id = ? AND s.cif IS NULL
+        ORDER BY 2, 1
+    """, (ky_so_sanh, ky_id, ky_id, ky_so_sanh), path)
+
+
+def thay_doi_du_no(ky_id, ky_so_sanh, path=None):
+    # CIF có ở cả hai kỳ mà dư nợ hoặc nhóm nợ thay đổi
+    return _doc("""
+        SELECT s.cif, s.ten_kh,
+               t.nhom_no AS nhom_no_truoc, s.nhom_no AS nhom_no_sau,
+               t.du_no AS du_no_truoc, s.du_no AS du_no_sau,
+               COALESCE(s.du_no, 0) - COALESCE(t.du_no, 0) AS chenh_lech
+        FROM kh s
+        JOIN kh t ON t.ky_id = ? AND t.cif = s.cif
+        WHERE s.ky_id = ?
+          AND (s.nhom_no IS NOT t.nhom_no OR s.du_no IS NOT t.du_no)
+        ORDER BY ABS(COALESCE(s.du_no, 0) - COALESCE(t.du_no, 0)) DESC
+    """, (ky_so_sanh, ky_id), path)
+
+
+def lich_su_cif(cif, path=None):
+    # Diễn biến một CIF qua các kỳ: dư nợ, nhóm nợ và các cờ đã bật
+    return _doc("""
+        SELECT ky.chi_nhanh, ky.ngay_danh_gia, kh.nhom_no, kh.du_no, kh.gia_tri_ts,
+               (SELECT GROUP_CONCAT(c.tieu_chi, '; ') FROM co_tieu_chi c
+                WHERE c.ky_id = kh.ky_id AND c.cif = kh.cif) AS tieu_chi
+        FROM kh JOIN ky ON ky.ky_id = kh.ky_id
+        WHERE kh.cif = ?
+        ORDER BY ky.ngay_danh_gia
+    """, (str(cif),), path)
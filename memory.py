@@ -0,0 +1,112 @@
+# memory.py
+
+import numpy as np
+import pandas as pd
+
+# ============================================================
+# THU GỌN DỮ LIỆU TRONG RAM NGAY SAU KHI ĐỌC FILE
+# ============================================================
+# - Cột chuỗi ít giá trị (LOAI, CAP_2, BRANCH_VAY, BRCD, NHOM_NO...) -> category
+# - Cột số nguyên -> kiểu nguyên nhỏ nhất đủ chứa
+# - Cột số thực chỉ hạ xuống float32 khi không mất giá trị nào. Cột tiền VND
+#   (COT_TIEN) luôn giữ float64: float32 chỉ có ~7 chữ số có nghĩa, tổng dư nợ
+#   tính trên float32 sẽ bị sai lệch.
+
+COT_TIEN = [
+    'TS_KW_VND',
+    'DU_NO_PHAN_BO_QUY_DOI',
+    'DU_NO_QUY_DOI',
+    'SOTIENGIAINGAN',
+    'SO_TIEN_GIAI_NGAN_VND',
+]
+
+# Chỉ chuyển sang category khi số giá trị khác nhau không quá tỷ lệ này
+TY_LE_CATEGORY = 0.5
+
+
+def bo_nho_mb(df):
+    return df.memory_usage(deep=True).sum() / 1024 ** 2
+
+
+def toi_uu_bo_nho(df, cot_category=()):
+    df = df.copy()
+    for col in df.columns:
+        s = df[col]
+        if col in cot_category:
+            if not isinstance(s.dtype, pd.CategoricalDtype) and s.nunique(dropna=True) <= TY_LE_CATEGORY * max(len(s), 1):
+                df[col] = s.astype('category')
+        elif pd.api.types.is_integer_dtype(s.dtype) and not pd.api.types.is_bool_dtype(s.dtype):
+            df[col] = pd.to_numeric(s, downcast='integer')
+        elif pd.api.types.is_float_dtype(s.dtype) and col not in COT_TIEN:
+            s32 = s.astype('float32')
+            if np.array_equal(s32.to_numpy(dtype='float64'), s.to_numpy(dtype='float64'), equal_nan=True):
+                df[col] = s32
+    return df
+
+
+# ------------------------------------------------------------
+# THU GỌN THEO TỪNG PHẦN (ĐỌC NGOÀI BỘ NHỚ)
+# ------------------------------------------------------------
+# Khi bảng được đọc từng file và chỉ giữ lại một phần dòng, kiểu thu gọn vẫn
+# phải quyết định trên toàn bộ dữ liệu để giống hệt toi_uu_bo_nho(concat(...)).
+# Mỗi file rút ra vài dòng đại diện cho từng cột (cột category: các giá trị
+# duy nhất; cột số: min, max và giá trị đầu tiên không giữ nguyên ở float32),
+# gộp đại diện của mọi file rồi quyết định kiểu đúng như toi_uu_bo_nho.
+
+def mau_dai_dien(df, cot_category=()):
+    mau = {}
+    for col in df.columns:
+        s = df[col]
+        if col in cot_category:
+            mau[col] = s.drop_duplicates()
+        elif pd.api.types.is_numeric_dtype(s.dtype) and not pd.api.types.is_bool_dtype(s.dtype):
+            vi_tri = set()
+            if s.notna().any():
+                vi_tri.update([s.argmin(), s.argmax()])
+            v = s.to_numpy(dtype='float64', na_value=np.nan)
+            lech = np.flatnonzero((v.astype('float32').astype('float64') != v) & ~np.isnan(v))
+            vi_tri.update(lech[:1].tolist())
+            mau[col] = s.iloc[sorted(vi_tri)]
+        else:
+            mau[col] = s.iloc[:0]
+    return {'so_dong': len(df), 'mau': mau}
+
+
+def kieu_thu_gon(ds_mau, cot_category=()):
+    # {cột: kiểu} mà toi_uu_bo_nho sẽ chọn cho bảng ghép từ các file có ds_mau
+    so_dong = sum(m['so_dong'] for m in ds_mau)
+    ds_cot = dict.fromkeys(col for m in ds_mau for col in m['mau'])
+    kieu = {}
+    for col in ds_cot:
+        s = pd.concat([m['mau'][col] for m in ds_mau if col in m['mau']], ignore_index=True)
+        if col in cot_category:
+            if not isinstance(s.dtype, pd.CategoricalDtype) and s.nunique(dropna=True) <= TY_LE_CATEGORY * max(so_dong, 1):
+                kieu[col] = s.astype('category').dtype
+        elif pd.api.types.is_integer_dtype(s.dtype) and not pd.api.types.is_bool_dtype(s.dtype):
+            kieu[col] = pd.to_numeric(s, downcast='integer').dtype
+        elif pd.api.types.is_float_dtype(s.dtype) and col not in COT_TIEN:
+            s32 = s.astype('float32')
+            if np.array_equal(s32.to_numpy(dtype='float64'), s.to_numpy(dtype='float64'), equal_nan=True):
+                kieu[col] = s32.dtype
+    return kieu
+
+
+def ap_kieu(df, kieu):
+    return df.astype({col: t for col, t in kieu.items() if col in df.columns})
+
+
+def bao_cao_bo_nho(truoc, sau):
+    # truoc / sau: {tên bảng: DataFrame} trước và sau khi thu gọn
+    dong = []
+    for ten, df in sau.items():
+        mb_truoc = bo_nho_mb(truoc[ten])
+        mb_sau = bo_nho_mb(df)
+        dong.append({
+            'bang': ten,
+            'so_dong': len(df),
+            'so_cot_category': len(df.select_dtypes('category').columns),
+            'mb_truoc': round(mb_truoc, 2),
+            'mb_sau': round(mb_sau, 2),
+            'giam_%': round(100 * (1 - mb_sau / mb_truoc), 1) if mb_truoc else 0.0,
+        })
+    return pd.DataFrame(dong)
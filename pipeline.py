@@ -0,0 +1,967 @@
+# pipeline.py
+
+import re
+from functools import partial
+
+import numpy as np
+import pandas as pd
+
+import bang_ma
+import ket_qua_chung
+from cham_tra import KY_CHAM_TRA, MOC_CHAM_TRA, TIEN_TO_CO_CHAM_TRA, cap_cham_tra, dem_cham_tra, ten_co_cham_tra
+from cif import chieu_cif, giai_ma_bang, ma_hoa_cif, so_cif
+from doc_luong import loc_chua, loc_thuoc
+from excel_cache import file_hash, read_excel_cached
+from flags import danh_dau_ma_moi, gan_co_theo_cif
+from gn_tt import khop_gn_tt, ngay_co_khop
+from ingest import read_excel_files
+from instrument import DoHieuNang
+from memory import ap_kieu, bao_cao_bo_nho, kieu_thu_gon, mau_dai_dien, toi_uu_bo_nho
+from pivot import PivotTong
+from schema import COT_CATEGORY, read_kwargs
+from tinh_thanh import chuan_hoa_tinh, da_sap_nhap, tinh_cuoi_dia_chi, tinh_tu_dia_chi
+
+# Các cột cờ tiêu chí ('x' / 'X' / '') trong pivot_full, theo thứ tự xuất hiện
+COT_TIEU_CHI = [
+    'Nợ nhóm 2',
+    'Nợ xấu',
+    'Chuyên gia PD cấp C duyệt',
+    'NỢ CƠ_CẤU',
+    'GIẢI_NGÂN_TIEN_MAT',
+    'Cầm cố tại TCTD khác',
+    'Top 10 dư nợ KHCN',
+    'Top 10 dư nợ KHDN',
+    'KH có TSBĐ quá hạn định giá',
+    'KH có TSBĐ khác địa bàn',
+    'KH có cả GNG và TT trong 1 ngày',
+    'KH Phát sinh chậm trả > 10 ngày',
+    'KH Phát sinh chậm trả 4-9 ngày',
+]
+
+def cot_tieu_chi(pivot_full):
+    # Các cột cờ có trong pivot_full; cờ chậm trả đổi tên theo mốc cấp (cham_tra.ten_co_cham_tra)
+    cot = [c for c in COT_TIEU_CHI if c in pivot_full.columns]
+    return cot + [
+        c for c in pivot_full.columns
+        if isinstance(c, str) and c.startswith(TIEN_TO_CO_CHAM_TRA) and c not in COT_TIEU_CHI
+    ]
+
+
+def dem_tieu_chi(pivot_full):
+    # Số KH được gắn cờ theo từng tiêu chí
+    return {col: int((pivot_full[col] != '').sum()) for col in cot_tieu_chi(pivot_full)}
+
+
+# ============================================================
+# ĐỌC & CHUẨN HÓA TOÀN BỘ FILE ĐẦU VÀO
+# ============================================================
+
+def _chuan_hoa_cif(df, cot):
+    # CRM4/CRM32: chỉ giữ CIF dạng số như chuẩn hóa cũ (không phải số -> NaN)
+    if cot in df.columns:
+        df[cot] = so_cif(df[cot])
+
+
+def doc_bang_ma(f, loai):
+    # Bảng mã: DataFrame lấy từ kho (chon_bang_ma) hoặc file upload
+    return f if isinstance(f, pd.DataFrame) else read_excel_cached(f, **read_kwargs(loai))
+
+
+def chon_bang_ma(f, loai, ngay_danh_gia):
+    # Có upload thì dùng file upload, không thì lấy phiên bản trong kho bảng mã
+    # (bang_ma.py) có hiệu lực tại ngày đánh giá
+    if f is not None:
+        return f
+    df = bang_ma.nap(loai, ngay_danh_gia)
+    if df is None:
+        raise ValueError(
+            f"Chưa upload bảng mã {bang_ma.BANG_MA[loai][0]} và kho bảng mã chưa có phiên bản "
+            f"hiệu lực tại {pd.Timestamp(ngay_danh_gia):%d/%m/%Y}"
+        )
+    return df
+
+
+def _khoa_file(f):
+    # Bảng mã từ kho: khóa theo phiên bản thay cho hash nội dung file
+    return f.attrs['phien_ban'] if isinstance(f, pd.DataFrame) else file_hash(f)
+
+
+# Cột CIF của từng bảng đầu vào, mã hóa theo chiều CIF chung (cif.py)
+COT_CIF_DAU_VAO = {
+    "df_crm4": "CIF_KH_VAY",
+    "df_crm32": "CUSTSEQLN",
+    "df_55": "CUSTSEQLN",
+    "df_56": "CIF",
+    "df_57": "CIF_ID",
+}
+
+
+def _ma_hoa_cif(du_lieu, kieu):
+    for ten, cot in COT_CIF_DAU_VAO.items():
+        if du_lieu.get(ten) is not None:
+            du_lieu[ten] = du_lieu[ten].assign(**{cot: ma_hoa_cif(du_lieu[ten][cot], kieu)})
+
+
+def doc_du_lieu(
+    crm4_files,
+    crm32_files,
+    df_muc_dich_file_upload,
+    df_code_tsbd_file_upload,
+    df_giai_ngan_file_upload,
+    df_sol_file_upload,
+    df_55_file_upload,
+    df_56_file_upload,
+    df_57_file_upload,
+    so_tien_trinh=None,
+    do=None
+):
+    do = do or DoHieuNang(do_bo_nho=False)
+
+    # 1. Đọc tất cả file HDV chi tiết CKH (*.xlsx) – song song theo tiến trình
+    do.bat_dau('Đọc CRM4/CRM32')
+    df_crm4_ghep, tg_crm4 = read_excel_files(crm4_files, max_workers=so_tien_trinh, **read_kwargs('crm4'))
+    df_crm4 = pd.concat(df_crm4_ghep, ignore_index=True)
+
+    df_crm32_ghep, tg_crm32 = read_excel_files(crm32_files, max_workers=so_tien_trinh, **read_kwargs('crm32'))
+    df_crm32 = pd.concat(df_crm32_ghep, ignore_index=True)
+
+    do.ket_thuc(dong_ra=len(df_crm4) + len(df_crm32))
+
+    do.bat_dau('Đọc bảng mã & Mục 17/55/56/57')
+    du_lieu = {
+        "df_crm4": df_crm4,
+        "df_crm32": df_crm32,
+        "df_muc_dich": doc_bang_ma(df_muc_dich_file_upload, 'muc_dich'),
+        "df_code_tsbd": doc_bang_ma(df_code_tsbd_file_upload, 'code_tsbd'),
+        "df_giai_ngan": read_excel_cached(df_giai_ngan_file_upload, **read_kwargs('giai_ngan')),
+        "df_sol": read_excel_cached(df_sol_file_upload, **read_kwargs('muc17')),
+        "df_55": read_excel_cached(df_55_file_upload, **read_kwargs('muc55')),
+        "df_56": read_excel_cached(df_56_file_upload, **read_kwargs('muc56')),
+        "df_57": read_excel_cached(df_57_file_upload, **read_kwargs('muc57')),
+    }
+
+    do.ket_thuc(dong_ra=sum(len(df) for df in du_lieu.values()))
+    truoc = dict(du_lieu)
+
+    # Chiều CIF: chuẩn hóa CIF một lần cho mọi bảng, các giai đoạn sau join trên mã số nguyên
+    do.bat_dau('Chiều CIF', dong_vao=sum(len(du_lieu[t]) for t in COT_CIF_DAU_VAO))
+    for t in ('df_crm4', 'df_crm32'):
+        du_lieu[t] = du_lieu[t].copy(deep=False)
+        _chuan_hoa_cif(du_lieu[t], COT_CIF_DAU_VAO[t])
+    kieu_cif = chieu_cif(*(du_lieu[t][c] for t, c in COT_CIF_DAU_VAO.items()))
+    _ma_hoa_cif(du_lieu, kieu_cif)
+    do.ket_thuc(dong_ra=len(kieu_cif.categories))
+
+    # Thu gọn bộ nhớ: category cho cột chuỗi ít giá trị, hạ kiểu số nguyên
+    do.bat_dau('Thu gọn bộ nhớ', dong_vao=sum(len(df) for df in du_lieu.values()))
+    loai_file = {"df_crm4": "crm4", "df_crm32": "crm32", "df_sol": "muc17", "df_55": "muc55", "df_56": "muc56"}
+    for ten, df in truoc.items():
+        du_lieu[ten] = toi_uu_bo_nho(du_lieu[ten], COT_CATEGORY.get(loai_file.get(ten), ()))
+
+    du_lieu["bao_cao_bo_nho"] = bao_cao_bo_nho(truoc, {k: du_lieu[k] for k in truoc})
+    do.ket_thuc(dong_ra=sum(len(df) for df in truoc.values()))
+    du_lieu["tg_doc_file"] = pd.DataFrame(
+        [dict(t, nhom='CRM4') for t in tg_crm4] + [dict(t, nhom='CRM32') for t in tg_crm32]
+    )
+    return du_lieu
+
+
+# ============================================================
+# ĐỌC NGOÀI BỘ NHỚ – LỌC CHI NHÁNH NGAY KHI ĐỌC TỪNG FILE
+# ============================================================
+# Dữ liệu toàn hàng (nhiều file CRM4/CRM32) không cần nằm cùng lúc trong RAM:
+# mỗi tiến trình con đọc một file (qua cache Parquet), chuẩn hóa CIF rồi chỉ
+# gửi về
+#   - các dòng thuộc chi nhánh cần xử lý (giữ số thứ tự dòng toàn hàng)
+#   - CRM4: hai cột SECU_SRL_NUM, CIF_KH_VAY của các TSBĐ là BĐS trong Mục 17
+#     (chỉ Mục 17 cần tra TSBĐ -> CIF trên toàn hàng)
+#   - vài dòng đại diện mỗi cột để chọn kiểu thu gọn như khi đọc cả bảng
+# Bộ nhớ đỉnh ~ số tiến trình × một file + phần của chi nhánh. Các giai đoạn
+# xử lý sau đó dùng chung với chế độ trong bộ nhớ nên kết quả giống hệt.
+# Chế độ 'doc_luong' đẩy luôn điều kiện chi nhánh vào bộ đọc (doc_luong.py):
+# dòng của chi nhánh khác không được dựng thành DataFrame; kiểu thu gọn khi đó
+# chọn trên các dòng đã giữ lại.
+
+CHE_DO_XU_LY = {
+    'trong_bo_nho': 'Trong bộ nhớ (nhanh nhất)',
+    'ngoai_bo_nho': 'Ngoài bộ nhớ – lọc chi nhánh khi đọc từng file (dữ liệu toàn hàng)',
+    'doc_luong': 'Đọc luồng – chỉ parse các dòng của chi nhánh (file lớn, một vài chi nhánh)',
+}
+
+
+def _rut_gon_file(df, cot_cif, cot_chi_nhanh, ds_chi_nhanh, cot_category, tra_cuu=None):
+    # Chạy trong tiến trình con đọc file (ingest.read_excel_files(xu_ly=...))
+    _chuan_hoa_cif(df, cot_cif)
+    chung = None
+    if tra_cuu is not None:
+        cot, ds_khoa = tra_cuu
+        chung = df.loc[df[cot[0]].isin(ds_khoa), list(cot)]
+    return {
+        'so_dong': df.attrs.get('so_dong_goc', len(df)),
+        'theo_chi_nhanh': chia_theo_chi_nhanh(df, cot_chi_nhanh, ds_chi_nhanh),
+        'chung': chung,
+        'mau': mau_dai_dien(df, cot_category),
+    }
+
+
+def _ghep_phan(ds_phan, lay):
+    # Ghép các phần của từng file, đánh lại index theo số thứ tự dòng toàn hàng
+    # (như pd.concat(..., ignore_index=True) trên cả file)
+    khoi = []
+    dau = 0
+    for phan in ds_phan:
+        df = lay(phan)
+        khoi.append(df.set_axis(df.index + dau))
+        dau += phan['so_dong']
+    return pd.concat(khoi)
+
+
+def _doc_rut_gon(files, loai, cot_cif, cot_chi_nhanh, ds_chi_nhanh, so_tien_trinh, tra_cuu=None, doc_luong=False):
+    cot_category = COT_CATEGORY.get(loai, ())
+    xu_ly = partial(_rut_gon_file, cot_cif=cot_cif, cot_chi_nhanh=cot_chi_nhanh, ds_chi_nhanh=ds_chi_nhanh,
+                    cot_category=cot_category, tra_cuu=tra_cuu)
+    tham_so = read_kwargs(loai)
+    if doc_luong:
+        # Giữ dòng của các chi nhánh + dòng cần cho bảng tra (khóa tra_cuu)
+        loc_dong = [loc_chua(cot_chi_nhanh, ds_chi_nhanh)]
+        if tra_cuu is not None:
+            loc_dong.append(loc_thuoc(tra_cuu[0][0], tra_cuu[1]))
+        tham_so['loc_dong'] = tuple(loc_dong)
+    ds_phan, tg = read_excel_files(files, max_workers=so_tien_trinh, xu_ly=xu_ly, **tham_so)
+    kieu = kieu_thu_gon([p['mau'] for p in ds_phan], cot_category)
+    truoc = {cn: _ghep_phan(ds_phan, lambda p: p['theo_chi_nhanh'][cn]) for cn in ds_chi_nhanh}
+    chung = _ghep_phan(ds_phan, lambda p: p['chung']) if tra_cuu is not None else None
+    return truoc, chung, kieu, tg
+
+
+def doc_du_lieu_ngoai_bo_nho(
+    crm4_files,
+    crm32_files,
+    df_muc_dich_file_upload,
+    df_code_tsbd_file_upload,
+    df_giai_ngan_file_upload,
+    df_sol_file_upload,
+    df_55_file_upload,
+    df_56_file_upload,
+    df_57_file_upload,
+    ds_chi_nhanh,
+    so_tien_trinh=None,
+    doc_luong=False,
+    do=None
+):
+    # Như doc_du_lieu, nhưng du_lieu['df_crm4'] chỉ còn bảng tra TSBĐ -> CIF cho
+    # Mục 17, du_lieu['df_crm32'] = None và CRM4/CRM32 đã lọc của từng chi nhánh
+    # nằm trong du_lieu['theo_chi_nhanh'][chi_nhanh] = (df_crm4_filtered, df_crm32_filtered)
+    do = do or DoHieuNang(do_bo_nho=False)
+
+    do.bat_dau('Đọc bảng mã & Mục 17/55/56/57')
+    du_lieu = {
+        "df_muc_dich": doc_bang_ma(df_muc_dich_file_upload, 'muc_dich'),
+        "df_code_tsbd": doc_bang_ma(df_code_tsbd_file_upload, 'code_tsbd'),
+        "df_giai_ngan": read_excel_cached(df_giai_ngan_file_upload, **read_kwargs('giai_ngan')),
+        "df_sol": read_excel_cached(df_sol_file_upload, **read_kwargs('muc17')),
+        "df_55": read_excel_cached(df_55_file_upload, **read_kwargs('muc55')),
+        "df_56": read_excel_cached(df_56_file_upload, **read_kwargs('muc56')),
+        "df_57": read_excel_cached(df_57_file_upload, **read_kwargs('muc57')),
+    }
+    do.ket_thuc(dong_ra=sum(len(df) for df in du_lieu.values()))
+
+    do.bat_dau('Đọc & lọc CRM4/CRM32 theo từng file')
+    df_sol = du_lieu['df_sol']
+    secu_bds = df_sol.loc[df_sol['C02'].astype(str).str.strip() == 'Bat dong san', 'C01'].dropna().unique()
+    crm4_truoc, crm4_chung, kieu_crm4, tg_crm4 = _doc_rut_gon(
+        crm4_files, 'crm4', 'CIF_KH_VAY', 'BRANCH_VAY', ds_chi_nhanh, so_tien_trinh,
+        tra_cuu=(('SECU_SRL_NUM', 'CIF_KH_VAY'), secu_bds), doc_luong=doc_luong
+    )
+    crm32_truoc, _, kieu_crm32, tg_crm32 = _doc_rut_gon(
+        crm32_files, 'crm32', 'CUSTSEQLN', 'BRCD', ds_chi_nhanh, so_tien_trinh, doc_luong=doc_luong
+    )
+    do.ket_thuc(dong_ra=sum(len(df) for df in [*crm4_truoc.values(), *crm32_truoc.values(), crm4_chung]))
+
+    truoc = {
+        "df_crm4": pd.concat(crm4_truoc.values()),
+        "df_crm32": pd.concat(crm32_truoc.values()),
+        **du_lieu,
+    }
+
+    # Chiều CIF dựng trên phần đã giữ lại (bảng tra TSBĐ, các chi nhánh, Mục 55/56/57)
+    do.bat_dau('Chiều CIF', dong_vao=sum(len(df) for df in truoc.values()))
+    kieu_cif = chieu_cif(
+        crm4_chung['CIF_KH_VAY'], truoc['df_crm4']['CIF_KH_VAY'], truoc['df_crm32']['CUSTSEQLN'],
+        *(du_lieu[t][COT_CIF_DAU_VAO[t]] for t in ('df_55', 'df_56', 'df_57'))
+    )
+    _ma_hoa_cif(du_lieu, kieu_cif)
+    crm4_chung = crm4_chung.assign(CIF_KH_VAY=ma_hoa_cif(crm4_chung['CIF_KH_VAY'], kieu_cif))
+    crm4_truoc = {cn: df.assign(CIF_KH_VAY=ma_hoa_cif(df['CIF_KH_VAY'], kieu_cif)) for cn, df in crm4_truoc.items()}
+    crm32_truoc = {cn: df.assign(CUSTSEQLN=ma_hoa_cif(df['CUSTSEQLN'], kieu_cif)) for cn, df in crm32_truoc.items()}
+    # CIF đã là Categorical theo chiều CIF, không áp kiểu thu gọn lên nữa
+    kieu_crm4.pop('CIF_KH_VAY', None)
+    kieu_crm32.pop('CUSTSEQLN', None)
+    do.ket_thuc(dong_ra=len(kieu_cif.categories))
+
+    # Thu gọn bộ nhớ: kiểu chọn trên toàn hàng (kieu_thu_gon), áp lên phần đã lọc
+    do.bat_dau('Thu gọn bộ nhớ', dong_vao=sum(len(df) for df in du_lieu.values()))
+    loai_file = {"df_sol": "muc17", "df_55": "muc55", "df_56": "muc56"}
+    for ten in list(du_lieu):
+        du_lieu[ten] = toi_uu_bo_nho(du_lieu[ten], COT_CATEGORY.get(loai_file.get(ten), ()))
+
+    du_lieu["theo_chi_nhanh"] = {
+        cn: (ap_kieu(crm4_truoc[cn], kieu_crm4), ap_kieu(crm32_truoc[cn], kieu_crm32))
+        for cn in ds_chi_nhanh
+    }
+    sau = {
+        "df_crm4": pd.concat(v[0] for v in du_lieu["theo_chi_nhanh"].values()),
+        "df_crm32": pd.concat(v[1] for v in du_lieu["theo_chi_nhanh"].values()),
+        **{k: du_lieu[k] for k in truoc if k in du_lieu},
+    }
+    du_lieu["bao_cao_bo_nho"] = bao_cao_bo_nho(truoc, sau)
+    du_lieu["df_crm4"] = ap_kieu(crm4_chung, kieu_crm4)
+    du_lieu["df_crm32"] = None
+    do.ket_thuc(dong_ra=sum(len(df) for df in truoc.values()))
+
+    du_lieu["tg_doc_file"] = pd.DataFrame(
+        [dict(t, nhom='CRM4') for t in tg_crm4] + [dict(t, nhom='CRM32') for t in tg_crm32]
+    )
+    return du_lieu
+
+
+def loc_chi_nhanh(du_lieu, chi_nhanh):
+    # ✅ Lọc dữ liệu theo chi nhánh
+    df_crm4 = du_lieu['df_crm4']
+    df_crm32 = du_lieu['df_crm32']
+    df_crm4_filtered = df_crm4[df_crm4['BRANCH_VAY'].astype(str).str.upper().str.contains(chi_nhanh)]
+    df_crm32_filtered = df_crm32[df_crm32['BRCD'].astype(str).str.upper().str.contains(chi_nhanh)]
+    return df_crm4_filtered, df_crm32_filtered
+
+
+def chia_theo_chi_nhanh(df, cot, ds_chi_nhanh):
+    # Chia một lần bằng groupby theo giá trị cột chi nhánh, sau đó mỗi mã chi nhánh
+    # chỉ cần so khớp (str.contains) trên các giá trị duy nhất thay vì toàn bộ dòng.
+    # Thứ tự dòng giữ nguyên như khi lọc trực tiếp.
+    nhom = df.groupby(df[cot].astype(str).str.upper(), sort=False).indices
+    ket_qua = {}
+    for chi_nhanh in ds_chi_nhanh:
+        vi_tri = [v for k, v in nhom.items() if re.search(chi_nhanh, k)]
+        vi_tri = np.sort(np.concatenate(vi_tri)) if vi_tri else np.array([], dtype=int)
+        ket_qua[chi_nhanh] = df.iloc[vi_tri]
+    return ket_qua
+
+
+# ============================================================
+# XỬ LÝ MỘT CHI NHÁNH – CHIA THEO GIAI ĐOẠN
+# ============================================================
+# Mỗi giai đoạn chỉ phụ thuộc vào các tham số liệt kê trong PHU_THUOC_GIAI_DOAN.
+# Khi truyền bo_nho_dem (dict giữ giữa các lần chạy, vd. session_state), giai
+# đoạn nào có khóa phụ thuộc không đổi sẽ dùng lại kết quả lần trước: đổi
+# ngày đánh giá chỉ chạy lại R34 + Mục 57, đổi địa bàn chỉ chạy lại Mục 17,
+# rồi ghép lại pivot_full.
+#   - file          : hash nội dung các file upload
+#   - du_lieu       : đọc file; chế độ ngoài bộ nhớ chỉ đọc phần của một chi nhánh
+#   - co_ban        : lọc chi nhánh, TSBD, CRM32, bảo lãnh/LC, giải ngân tiền mặt
+#   - r34           : theo ngày đánh giá
+#   - muc57         : theo ngày đánh giá, kỳ xét và mốc cấp chậm trả
+#   - muc17         : theo địa bàn kiểm toán và ngày đánh giá trước / sau sáp nhập tỉnh
+#   - muc55_56      : toàn bộ Mục 55/56, theo cửa sổ ngày / khớp theo khế ước
+
+PHU_THUOC_GIAI_DOAN = {
+    'du_lieu': ('file', 'che_do', 'chi_nhanh_doc'),
+    'co_ban': ('file', 'chi_nhanh'),
+    'r34': ('file', 'chi_nhanh', 'ngay_danh_gia'),
+    'muc17': ('file', 'chi_nhanh', 'dia_ban_kt', 'sap_nhap_tinh'),
+    'muc55_56': ('file', 'so_ngay_gn_tt', 'gn_tt_cung_khe_uoc'),
+    'muc57': ('file', 'chi_nhanh', 'ngay_danh_gia', 'ky_cham_tra', 'moc_cham_tra'),
+}
+
+
+def _ghi_nho(bo_nho_dem, ten, tham_so, ham, do):
+    # Tính lại giai đoạn khi khóa phụ thuộc khác lần trước, ngược lại dùng lại kết quả
+    khoa = tuple(tham_so[p] for p in PHU_THUOC_GIAI_DOAN[ten])
+    muc = bo_nho_dem.get(ten)
+    if muc is None or muc[0] != khoa:
+        muc = (khoa, ham())
+        bo_nho_dem[ten] = muc
+    else:
+        do.bat_dau(f'Dùng lại: {ten}')
+        do.ket_thuc()
+    return muc[1]
+
+
+def xu_ly_co_ban(du_lieu, chi_nhanh, df_crm4_filtered=None, df_crm32_filtered=None, do=None):
+    # Có thể truyền sẵn phần CRM4/CRM32 đã chia theo chi nhánh (chạy hàng loạt);
+    # khi đó du_lieu['df_crm4'] chỉ cần hai cột SECU_SRL_NUM, CIF_KH_VAY toàn hàng.
+    do = do or DoHieuNang(do_bo_nho=False)
+
+    if df_crm4_filtered is None or df_crm32_filtered is None:
+        do.bat_dau('Lọc chi nhánh', dong_vao=len(du_lieu['df_crm4']) + len(du_lieu['df_crm32']))
+        df_crm4_filtered, df_crm32_filtered = loc_chi_nhanh(du_lieu, chi_nhanh)
+        do.ket_thuc(dong_ra=len(df_crm4_filtered) + len(df_crm32_filtered))
+
+    # Bảng mã dạng Series mã -> giá trị, gán bằng map (bang_ma.tra_ma) thay cho merge
+    ma_tsbd = bang_ma.bang_tra_cuu(du_lieu['df_code_tsbd'], 'code_tsbd')
+    ma_muc_dich = bang_ma.bang_tra_cuu(du_lieu['df_muc_dich'], 'muc_dich')
+
+    # --------------------------------------------------------
+    # XỬ LÝ LOẠI TSBD
+    # --------------------------------------------------------
+    do.bat_dau('TSBD – loại tài sản', dong_vao=len(df_crm4_filtered))
+    df_crm4_filtered = df_crm4_filtered.reset_index(drop=True)
+    df_crm4_filtered['LOAI_TS'] = bang_ma.tra_ma(df_crm4_filtered['CAP_2'], ma_tsbd)
+
+    khong_ts = df_crm4_filtered['CAP_2'].isna() | (df_crm4_filtered['CAP_2'].astype(str).str.strip() == '')
+    df_crm4_filtered['LOAI_TS'] = df_crm4_filtered['LOAI_TS'].mask(khong_ts, 'Không TS')
+
+    df_crm4_filtered['GHI_CHU_TSBD'] = danh_dau_ma_moi(df_crm4_filtered['CAP_2'], df_crm4_filtered['LOAI_TS'])
+
+    df_vay_4 = df_crm4_filtered.copy()
+
+    # Bỏ Bao lanh, LC
+    df_vay = df_vay_4[~df_vay_4['LOAI'].isin(['Bao lanh', 'LC'])]
+
+    # Dư nợ và giá trị TS theo CIF × loại TS: một lượt groupby cho cả hai cột
+    pivot_ts_no = PivotTong(df_vay, 'CIF_KH_VAY', 'LOAI_TS', ['DU_NO_PHAN_BO_QUY_DOI', 'TS_KW_VND'])
+    pivot_merge = pivot_ts_no.rong({'DU_NO_PHAN_BO_QUY_DOI': '', 'TS_KW_VND': ' (Giá trị TS)'})
+    pivot_merge['GIÁ TRỊ TS'] = pivot_ts_no.tong('TS_KW_VND')
+    pivot_merge['DƯ NỢ'] = pivot_ts_no.tong('DU_NO_PHAN_BO_QUY_DOI')
+
+    df_info = df_crm4_filtered[['CIF_KH_VAY', 'TEN_KH_VAY', 'CUSTTPCD', 'NHOM_NO']].drop_duplicates(subset='CIF_KH_VAY')
+    pivot_final = df_info.merge(pivot_merge, on='CIF_KH_VAY', how='left')
+    pivot_final = pivot_final.reset_index().rename(columns={'index': 'STT'})
+    pivot_final['STT'] += 1
+
+    cols_order = ['STT', 'CUSTTPCD', 'CIF_KH_VAY', 'TEN_KH_VAY', 'NHOM_NO'] + \
+                 sorted([col for col in pivot_merge.columns if col not in ['CIF_KH_VAY', 'GIÁ TRỊ TS', 'DƯ NỢ'] and '(Giá trị TS)' not in col]) + \
+                 sorted([col for col in pivot_merge.columns if '(Giá trị TS)' in col]) + \
+                 ['DƯ NỢ', 'GIÁ TRỊ TS']
+
+    pivot_final = pivot_final[cols_order]
+
+    do.ket_thuc(dong_ra=len(pivot_final))
+
+    # --------------------------------------------------------
+    # XỬ LÝ CRM32 & MỤC ĐÍCH VAY
+    # --------------------------------------------------------
+    do.bat_dau('CRM32 & mục đích vay', dong_vao=len(df_crm32_filtered))
+    df_crm32_filtered = df_crm32_filtered.copy()
+    df_crm32_filtered['MA_PHE_DUYET'] = df_crm32_filtered['CAP_PHE_DUYET'].astype(str).str.split('-').str[0].str.strip().str.zfill(2)
+
+    ma_cap_c = [f"{i:02d}" for i in range(1, 8)] + [f"{i:02d}" for i in range(28, 32)]
+    list_cif_cap_c = df_crm32_filtered[df_crm32_filtered['MA_PHE_DUYET'].isin(ma_cap_c)]['CUSTSEQLN'].unique()
+
+    list_co_cau = ['ACOV1', 'ACOV3', 'ATT01', 'ATT02', 'ATT03', 'ATT04',
+                   'BCOV1', 'BCOV2', 'BTT01', 'BTT02', 'BTT03',
+                   'CCOV2', 'CCOV3', 'CTT03', 'RCOV3', 'RTT03']
+    cif_co_cau = df_crm32_filtered[
+        df_crm32_filtered['SCHEME_CODE'].isin(list_co_cau)
+    ]['CUSTSEQLN'].unique()
+
+    df_crm32_filtered = df_crm32_filtered.reset_index(drop=True)
+    df_crm32_filtered['MUC DICH'] = bang_ma.tra_ma(df_crm32_filtered['MUC_DICH_VAY_CAP_4'], ma_muc_dich).fillna('(blank)')
+    df_crm32_filtered['GHI_CHU_TSBD'] = danh_dau_ma_moi(
+        df_crm32_filtered['MUC_DICH_VAY_CAP_4'], df_crm32_filtered['MUC DICH']
+    )
+
+    pivot_crm32 = PivotTong(df_crm32_filtered, 'CUSTSEQLN', 'MUC DICH', ['DU_NO_QUY_DOI'])
+    pivot_mucdich = pivot_crm32.rong({'DU_NO_QUY_DOI': ''})
+    pivot_mucdich['DƯ NỢ CRM32'] = pivot_crm32.tong('DU_NO_QUY_DOI')
+
+    pivot_final_CRM32 = pivot_mucdich.rename(columns={'CUSTSEQLN': 'CIF_KH_VAY'})
+    pivot_full = pivot_final.merge(pivot_final_CRM32, on='CIF_KH_VAY', how='left')
+    # Cột category (CUSTTPCD, NHOM_NO) phải có sẵn giá trị điền trong danh mục
+    # (trừ CIF_KH_VAY: khóa theo chiều CIF, không điền)
+    for col in pivot_full.select_dtypes('category').columns.drop('CIF_KH_VAY', errors='ignore'):
+        if pivot_full[col].isna().any() and 0 not in pivot_full[col].cat.categories:
+            pivot_full[col] = pivot_full[col].cat.add_categories([0])
+    pivot_full.fillna(0, inplace=True)
+
+    # Lệch dư nợ
+    pivot_full['LECH'] = pivot_full['DƯ NỢ'] - pivot_full['DƯ NỢ CRM32']
+    pivot_full['LECH'] = pivot_full['LECH'].fillna(0)
+    cif_lech = pivot_full[pivot_full['LECH'] != 0]['CIF_KH_VAY'].unique()
+
+    # Bổ sung dư nợ (blank)
+    df_crm4_blank = df_crm4_filtered[~df_crm4_filtered['LOAI'].isin(['Cho vay', 'Bao lanh', 'LC'])].copy()
+
+    du_no_bosung = (
+        df_crm4_blank[df_crm4_blank['CIF_KH_VAY'].isin(cif_lech)]
+        .groupby('CIF_KH_VAY', as_index=False, observed=True)['DU_NO_PHAN_BO_QUY_DOI']
+        .sum()
+        .rename(columns={'DU_NO_PHAN_BO_QUY_DOI': '(blank)'})
+    )
+
+    pivot_full = pivot_full.merge(du_no_bosung, on='CIF_KH_VAY', how='left')
+    pivot_full['(blank)'] = pivot_full['(blank)'].fillna(0)
+    pivot_full['DƯ NỢ CRM32'] = pivot_full['DƯ NỢ CRM32'] + pivot_full['(blank)']
+
+    cols = list(pivot_full.columns)
+    if '(blank)' in cols and 'DƯ NỢ CRM32' in cols:
+        cols.insert(cols.index('DƯ NỢ CRM32'), cols.pop(cols.index('(blank)')))
+        pivot_full = pivot_full[cols]
+
+    # pivot_full['LECH'] = pivot_full['DƯ NỢ'] - pivot_full['DƯ NỢ CRM32']
+
+    # Các cờ tiêu chí theo CIF được gom lại, gắn một lượt ở cuối (gan_co_theo_cif)
+    co_kh = {}
+
+    # Nợ nhóm 2 / Nợ xấu
+    nhom_no = pivot_full['NHOM_NO'].astype(str).str.strip()
+    co_kh['Nợ nhóm 2'] = (nhom_no == '2', 'x')
+    co_kh['Nợ xấu'] = (nhom_no.isin(['3', '4', '5']), 'x')
+
+    # Chuyên gia PD cấp C duyệt & NỢ CƠ_CẤU
+    co_kh['Chuyên gia PD cấp C duyệt'] = (list_cif_cap_c, 'x')
+    co_kh['NỢ CƠ_CẤU'] = (cif_co_cau, 'x')
+
+    do.ket_thuc(dong_ra=len(pivot_full))
+
+    # --------------------------------------------------------
+    # BẢO LÃNH & LC
+    # --------------------------------------------------------
+    do.bat_dau('Bảo lãnh & LC', dong_vao=len(df_crm4_filtered))
+    df_baolanh = df_crm4_filtered[df_crm4_filtered['LOAI'] == 'Bao lanh']
+    df_lc = df_crm4_filtered[df_crm4_filtered['LOAI'] == 'LC']
+
+    df_baolanh_sum = df_baolanh.groupby('CIF_KH_VAY', as_index=False, observed=True)['DU_NO_PHAN_BO_QUY_DOI'].sum()
+    df_baolanh_sum = df_baolanh_sum.rename(columns={'DU_NO_PHAN_BO_QUY_DOI': 'DƯ_NỢ_BẢO_LÃNH'})
+
+    df_lc_sum = df_lc.groupby('CIF_KH_VAY', as_index=False, observed=True)['DU_NO_PHAN_BO_QUY_DOI'].sum()
+    df_lc_sum = df_lc_sum.rename(columns={'DU_NO_PHAN_BO_QUY_DOI': 'DƯ_NỢ_LC'})
+
+    if 'DƯ_NỢ_BẢO_LÃNH' in pivot_full.columns:
+        pivot_full = pivot_full.drop(columns=['DƯ_NỢ_BẢO_LÃNH'])
+    pivot_full = pivot_full.merge(df_baolanh_sum, on='CIF_KH_VAY', how='left')
+
+    if 'DƯ_NỢ_LC' in pivot_full.columns:
+        pivot_full = pivot_full.drop(columns=['DƯ_NỢ_LC'])
+    pivot_full = pivot_full.merge(df_lc_sum, on='CIF_KH_VAY', how='left')
+
+    pivot_full['DƯ_NỢ_BẢO_LÃNH'] = pivot_full['DƯ_NỢ_BẢO_LÃNH'].fillna(0)
+    pivot_full['DƯ_NỢ_LC'] = pivot_full['DƯ_NỢ_LC'].fillna(0)
+
+    do.ket_thuc(dong_ra=len(pivot_full))
+
+    # --------------------------------------------------------
+    # GIẢI NGÂN TIỀN MẶT
+    # --------------------------------------------------------
+    do.bat_dau('Giải ngân tiền mặt', dong_vao=len(du_lieu['df_giai_ngan']))
+    df_giai_ngan = du_lieu['df_giai_ngan'].copy()
+
+    df_crm32_filtered['KHE_UOC'] = df_crm32_filtered['KHE_UOC'].astype(str).str.strip()
+    df_giai_ngan['FORACID'] = df_giai_ngan['FORACID'].astype(str).str.strip()
+
+    df_match = df_crm32_filtered[df_crm32_filtered['KHE_UOC'].isin(df_giai_ngan['FORACID'])].copy()
+    ds_cif_tien_mat = df_match['CUSTSEQLN'].unique()
+
+    co_kh['GIẢI_NGÂN_TIEN_MAT'] = (ds_cif_tien_mat, 'x')
+
+    df_cc_tctd = df_crm4_filtered[df_crm4_filtered['CAP_2'].str.contains('TCTD', case=False, na=False)]
+    co_kh['Cầm cố tại TCTD khác'] = (df_cc_tctd['CIF_KH_VAY'].unique(), 'x')
+
+    # TOP 10 DƯ NỢ KHCN / KHDN
+    top5_khcn = pivot_full[pivot_full['CUSTTPCD'] == 'Ca nhan'].nlargest(10, 'DƯ NỢ')['CIF_KH_VAY']
+    co_kh['Top 10 dư nợ KHCN'] = (top5_khcn.values, 'x')
+
+    top5_khdn = pivot_full[pivot_full['CUSTTPCD'] == 'Doanh nghiep'].nlargest(10, 'DƯ NỢ')['CIF_KH_VAY']
+    co_kh['Top 10 dư nợ KHDN'] = (top5_khdn.values, 'x')
+
+    do.ket_thuc(dong_ra=len(pivot_full))
+
+    df_crm32_filtered = toi_uu_bo_nho(df_crm32_filtered, ['MUC DICH', 'GHI_CHU_TSBD', 'MA_PHE_DUYET'])
+
+    return {
+        "df_crm4_filtered": df_crm4_filtered,
+        "pivot_final": pivot_final,
+        "pivot_merge": pivot_merge,
+        "df_crm32_filtered": df_crm32_filtered,
+        "pivot_full": pivot_full,
+        "pivot_mucdich": pivot_mucdich,
+        "co_kh": co_kh,
+    }
+
+
+def xu_ly_r34(co_ban, ngay_danh_gia, do=None):
+    do = do or DoHieuNang(do_bo_nho=False)
+    df_crm4_filtered = co_ban['df_crm4_filtered'].copy()
+
+    # --------------------------------------------------------
+    # NGÀY ĐỊNH GIÁ TSBĐ (R34) – DÙNG NGÀY ĐÁNH GIÁ NGƯỜI DÙNG NHẬP
+    # --------------------------------------------------------
+    do.bat_dau('R34 – quá hạn định giá', dong_vao=len(df_crm4_filtered))
+    loai_ts_r34 = ['BĐS', 'MMTB', 'PTVT']
+    mask_r34 = df_crm4_filtered['LOAI_TS'].isin(loai_ts_r34)
+
+    df_crm4_filtered['VALUATION_DATE'] = pd.to_datetime(df_crm4_filtered['VALUATION_DATE'], errors='coerce')
+
+    df_crm4_filtered.loc[mask_r34, 'SO_NGAY_QUA_HAN'] = (
+        (ngay_danh_gia - df_crm4_filtered.loc[mask_r34, 'VALUATION_DATE']).dt.days - 365
+    )
+
+    df_crm4_filtered.loc[df_crm4_filtered['LOAI_TS'] == 'BĐS', 'SO_THANG_QUA_HAN'] = (
+        ((ngay_danh_gia - df_crm4_filtered.loc[df_crm4_filtered['LOAI_TS'] == 'BĐS', 'VALUATION_DATE']).dt.days / 31) - 18
+    )
+
+    df_crm4_filtered.loc[df_crm4_filtered['LOAI_TS'].isin(['MMTB', 'PTVT']), 'SO_THANG_QUA_HAN'] = (
+        ((ngay_danh_gia - df_crm4_filtered.loc[df_crm4_filtered['LOAI_TS'].isin(['MMTB', 'PTVT']), 'VALUATION_DATE']).dt.days / 31) - 12
+    )
+
+    cif_quahan = df_crm4_filtered[
+        df_crm4_filtered['SO_THANG_QUA_HAN'] > 0
+    ]['CIF_KH_VAY'].unique()
+
+    co_kh = {'KH có TSBĐ quá hạn định giá': (cif_quahan, 'X')}
+
+    do.ket_thuc(dong_ra=len(cif_quahan))
+
+    # Thu gọn các cột phân loại sinh ra trong lúc xử lý (sau khi đã pivot xong)
+    df_crm4_filtered = toi_uu_bo_nho(df_crm4_filtered, ['CAP_2', 'LOAI_TS', 'GHI_CHU_TSBD'])
+    return {"df_crm4_filtered": df_crm4_filtered, "co_kh": co_kh}
+
+
+def xu_ly_muc17(du_lieu, co_ban, dia_ban_kt, ngay_danh_gia=None, do=None):
+    do = do or DoHieuNang(do_bo_nho=False)
+    df_crm4 = du_lieu['df_crm4']
+    df_crm4_filtered = co_ban['df_crm4_filtered']
+
+    # --------------------------------------------------------
+    # TSBĐ KHÁC ĐỊA BÀN (MỤC 17)
+    # --------------------------------------------------------
+    do.bat_dau('Mục 17 – TSBĐ khác địa bàn', dong_vao=len(du_lieu['df_sol']))
+    df_sol = du_lieu['df_sol']
+    ds_secu = df_crm4_filtered['SECU_SRL_NUM'].dropna().unique()
+    df_17_filtered = df_sol[df_sol['C01'].isin(ds_secu)]
+
+    df_bds = df_17_filtered[df_17_filtered['C02'].str.strip() == 'Bat dong san'].copy()
+    df_bds_matched = df_bds[df_bds['C01'].isin(df_crm4['SECU_SRL_NUM'])].copy()
+
+    # Tỉnh/thành ghi trong địa chỉ (phần sau dấu phẩy cuối) và tên tỉnh chuẩn
+    # theo địa giới tại ngày đánh giá (chỉ gộp tỉnh sáp nhập từ 01/07/2025)
+    df_bds_matched['TINH_TP_TSBD'] = tinh_cuoi_dia_chi(df_bds_matched['C19'])
+    df_bds_matched['TINH_TP_CHUAN'] = tinh_tu_dia_chi(df_bds_matched['C19'], ngay_danh_gia)
+
+    # So theo tên tỉnh chuẩn; địa chỉ không nhận ra tỉnh thì so chuỗi như cũ
+    tinh_kt = set(chuan_hoa_tinh(dia_ban_kt, ngay_danh_gia).dropna())
+    khac_dia_ban = np.where(
+        df_bds_matched['TINH_TP_CHUAN'].notna(),
+        ~df_bds_matched['TINH_TP_CHUAN'].isin(tinh_kt),
+        (df_bds_matched['TINH_TP_TSBD'] != '') & ~df_bds_matched['TINH_TP_TSBD'].isin(dia_ban_kt)
+    )
+    df_bds_matched['CANH_BAO_TS_KHAC_DIABAN'] = np.where(khac_dia_ban, 'x', '')
+
+    ma_ts_canh_bao = df_bds_matched[df_bds_matched['CANH_BAO_TS_KHAC_DIABAN'] == 'x']['C01'].unique()
+    cif_canh_bao = df_crm4[df_crm4['SECU_SRL_NUM'].isin(ma_ts_canh_bao)]['CIF_KH_VAY'].dropna().unique()
+
+    co_kh = {'KH có TSBĐ khác địa bàn': (cif_canh_bao, 'x')}
+
+    do.ket_thuc(dong_ra=len(df_bds_matched))
+
+    return {"df_bds_matched": df_bds_matched, "co_kh": co_kh}
+
+
+def xu_ly_muc55_56(du_lieu, so_ngay_gn_tt=0, gn_tt_cung_khe_uoc=False, do=None):
+    # Dùng toàn bộ Mục 55/56 (không lọc theo chi nhánh)
+    do = do or DoHieuNang(do_bo_nho=False)
+
+    # --------------------------------------------------------
+    # MỤC 55 & 56 – TẤT TOÁN / GIẢI NGÂN
+    # --------------------------------------------------------
+    do.bat_dau('Mục 55/56 – GN & TT', dong_vao=len(du_lieu['df_55']) + len(du_lieu['df_56']))
+    df_55 = du_lieu['df_55']
+    df_56 = du_lieu['df_56']
+
+    df_tt = df_55[['CUSTSEQLN', 'NMLOC', 'KHE_UOC', 'SOTIENGIAINGAN', 'NGAYGN', 'NGAYDH', 'NGAY_TT', 'LOAITIEN']].copy()
+    df_tt.columns = ['CIF', 'TEN_KHACH_HANG', 'KHE_UOC', 'SO_TIEN_GIAI_NGAN_VND',
+                     'NGAY_GIAI_NGAN', 'NGAY_DAO_HAN', 'NGAY_TT', 'LOAI_TIEN_HD']
+    df_tt['GIAI_NGAN_TT'] = 'Tất toán'
+    df_tt['NGAY'] = pd.to_datetime(df_tt['NGAY_TT'], errors='coerce')
+
+    df_gn = df_56[['CIF', 'TEN_KHACH_HANG', 'KHE_UOC', 'SO_TIEN_GIAI_NGAN_VND',
+                   'NGAY_GIAI_NGAN', 'NGAY_DAO_HAN', 'LOAI_TIEN_HD']].copy()
+    df_gn['GIAI_NGAN_TT'] = 'Giải ngân'
+    df_gn['NGAY_GIAI_NGAN'] = pd.to_datetime(df_gn['NGAY_GIAI_NGAN'], format='%Y%m%d', errors='coerce')
+    df_gn['NGAY_DAO_HAN'] = pd.to_datetime(df_gn['NGAY_DAO_HAN'], format='%Y%m%d', errors='coerce')
+    df_gn['NGAY'] = df_gn['NGAY_GIAI_NGAN']
+
+    df_gop = pd.concat([df_tt, df_gn], ignore_index=True)
+    df_gop = df_gop[df_gop['NGAY'].notna()]
+    df_gop = df_gop.sort_values(by=['CIF', 'NGAY', 'GIAI_NGAN_TT'])
+
+    # Khớp GN – TT bằng hash join trên (CIF[, KHE_UOC], ngày) trong cửa sổ so_ngay_gn_tt
+    cap_gn_tt = khop_gn_tt(df_gn, df_tt, so_ngay_gn_tt, gn_tt_cung_khe_uoc)
+    ds_ca_gn_tt = cap_gn_tt['CIF'].unique()
+
+    # Bảng đếm số GN / TT theo CIF × ngày (sheet 'tieu chi 3_dot3_1')
+    df_count = df_gop.groupby(['CIF', 'NGAY', 'GIAI_NGAN_TT'], observed=True).size().unstack(fill_value=0).reset_index()
+    df_count['CO_CA_GN_VA_TT'] = ngay_co_khop(df_count, cap_gn_tt).astype(int)
+
+    co_kh = {'KH có cả GNG và TT trong 1 ngày': (ds_ca_gn_tt, 'x')}
+
+    do.ket_thuc(dong_ra=len(df_count))
+
+    df_gop = toi_uu_bo_nho(df_gop, ['GIAI_NGAN_TT', 'LOAI_TIEN_HD'])
+    return {"df_gop": df_gop, "df_count": df_count, "co_kh": co_kh}
+
+
+def xu_ly_muc57(du_lieu, co_ban, ngay_danh_gia, ky_cham_tra=KY_CHAM_TRA, moc_cham_tra=MOC_CHAM_TRA, do=None):
+    do = do or DoHieuNang(do_bo_nho=False)
+
+    # --------------------------------------------------------
+    # MỤC 57 – CHẬM TRẢ
+    # --------------------------------------------------------
+    do.bat_dau('Mục 57 – chậm trả', dong_vao=len(du_lieu['df_57']))
+    df_delay = du_lieu['df_57'].copy()
+
+    df_delay['NGAY_DEN_HAN_TT'] = pd.to_datetime(df_delay['NGAY_DEN_HAN_TT'], errors='coerce')
+    df_delay['NGAY_THANH_TOAN'] = pd.to_datetime(df_delay['NGAY_THANH_TOAN'], errors='coerce')
+
+    df_delay['NGAY_THANH_TOAN_FILL'] = df_delay['NGAY_THANH_TOAN'].fillna(ngay_danh_gia)
+    df_delay['SO_NGAY_CHAM_TRA'] = (df_delay['NGAY_THANH_TOAN_FILL'] - df_delay['NGAY_DEN_HAN_TT']).dt.days
+
+    # Chia cấp trước khi ghép dư nợ: chỉ giữ các dòng thực sự chậm trả trong kỳ
+    df_delay['CAP_CHAM_TRA'] = cap_cham_tra(df_delay['SO_NGAY_CHAM_TRA'], moc_cham_tra)
+    mask_period = df_delay['NGAY_DEN_HAN_TT'].dt.year.between(*ky_cham_tra)
+    df_delay = df_delay[mask_period & df_delay['CAP_CHAM_TRA'].notna()]
+
+    df_crm32_tmp = co_ban['pivot_full'][['CIF_KH_VAY', 'DƯ NỢ', 'NHOM_NO']]
+    df_crm32_tmp = df_crm32_tmp.rename(columns={'CIF_KH_VAY': 'CIF_ID'})
+
+    # CAP_CHAM_TRA đứng cuối như trước
+    df_delay = df_delay.merge(df_crm32_tmp, on='CIF_ID', how='left')
+    df_delay = df_delay[df_delay['NHOM_NO'] == 1]
+    df_delay['CAP_CHAM_TRA'] = df_delay.pop('CAP_CHAM_TRA')
+
+    # Ngày đến hạn dạng date: chỉ chuyển các ngày duy nhất rồi trải ra
+    ma_ngay, ds_ngay = pd.factorize(df_delay['NGAY_DEN_HAN_TT'].dt.normalize())
+    df_delay['NGAY'] = np.asarray(ds_ngay.date, dtype=object)[ma_ngay]
+
+    # Cấp nặng nhất lên trước (sắp xếp ổn định trên mã cấp)
+    thu_tu = np.argsort(-np.asarray(df_delay['CAP_CHAM_TRA'].cat.codes, dtype='int64'), kind='stable')
+    df_delay = df_delay.iloc[thu_tu].copy()
+
+    df_dem = dem_cham_tra(df_delay['CIF_ID'], df_delay['NGAY_DEN_HAN_TT'], df_delay['CAP_CHAM_TRA'], moc_cham_tra)
+
+    do.ket_thuc(dong_ra=len(df_delay))
+    return {"df_delay": df_delay, "df_dem": df_dem, "cot_co": ten_co_cham_tra(moc_cham_tra)}
+
+
+def ghep_ket_qua(co_ban, r34, muc17, muc55_56, muc57, do=None):
+    do = do or DoHieuNang(do_bo_nho=False)
+    pivot_full = co_ban['pivot_full'].copy()
+    df_dem = muc57['df_dem']
+
+    # Cờ theo đúng thứ tự cột của script gốc
+    co_kh = {**co_ban['co_kh'], **r34['co_kh'], **muc17['co_kh'], **muc55_56['co_kh']}
+    co_kh = {k: co_kh[k] for k in COT_TIEU_CHI if k in co_kh}
+
+    # --------------------------------------------------------
+    # GẮN CỜ TIÊU CHÍ THEO CIF (MỘT LƯỢT)
+    # --------------------------------------------------------
+    do.bat_dau('Gắn cờ & ghép pivot_full', dong_vao=len(pivot_full))
+    pivot_full = gan_co_theo_cif(pivot_full, 'CIF_KH_VAY', co_kh)
+
+    # Giữ thứ tự cột như trước: dư nợ bảo lãnh/LC đứng trước nhóm cờ giải ngân tiền mặt
+    cols = [c for c in pivot_full.columns if c not in ['DƯ_NỢ_BẢO_LÃNH', 'DƯ_NỢ_LC']]
+    vi_tri = cols.index('GIẢI_NGÂN_TIEN_MAT')
+    pivot_full = pivot_full[cols[:vi_tri] + ['DƯ_NỢ_BẢO_LÃNH', 'DƯ_NỢ_LC'] + cols[vi_tri:]]
+
+    # Cờ chậm trả Mục 57
+    cols_to_merge = muc57['cot_co']
+    cols_to_merge_existing = [col for col in cols_to_merge if col in df_dem.columns]
+
+    if cols_to_merge_existing:
+        pivot_full = pivot_full.merge(
+            df_dem[cols_to_merge_existing],
+            left_on='CIF_KH_VAY', right_index=True, how='left'
+        )
+
+    for col in cols_to_merge_existing:
+        pivot_full[col] = pivot_full[col].fillna('')
+
+    do.ket_thuc(dong_ra=len(pivot_full))
+
+    # Ranh giới kết quả: CIF giải mã về chuỗi cho hiển thị / xuất file / lịch sử
+    ket_qua = {
+        "df_crm4_filtered": r34['df_crm4_filtered'],
+        "pivot_final": co_ban['pivot_final'],
+        "pivot_merge": co_ban['pivot_merge'],
+        "df_crm32_filtered": co_ban['df_crm32_filtered'],
+        "pivot_full": pivot_full,
+        "pivot_mucdich": co_ban['pivot_mucdich'],
+        "df_delay": muc57['df_delay'],
+        "df_gop": muc55_56['df_gop'],
+        "df_count": muc55_56['df_count'],
+        "df_bds_matched": muc17['df_bds_matched']
+    }
+    return {ten: giai_ma_bang(df) for ten, df in ket_qua.items()}
+
+
+def giai_doan_chung(du_lieu, so_ngay_gn_tt=0, gn_tt_cung_khe_uoc=False, khoa_file=None):
+    # Các giai đoạn không phụ thuộc chi nhánh (Mục 55/56), tính một lần cho cả
+    # lượt chạy hàng loạt: trả về bo_nho_dem để mỗi chi nhánh nhận một bản sao
+    bo_nho_dem = {}
+    tham_so = {'file': khoa_file, 'so_ngay_gn_tt': so_ngay_gn_tt, 'gn_tt_cung_khe_uoc': gn_tt_cung_khe_uoc}
+    _ghi_nho(bo_nho_dem, 'muc55_56', tham_so, lambda: xu_ly_muc55_56(
+        du_lieu, so_ngay_gn_tt, gn_tt_cung_khe_uoc
+    ), DoHieuNang())
+    return bo_nho_dem
+
+
+def xu_ly_chi_nhanh(
+    du_lieu,
+    chi_nhanh,
+    ngay_danh_gia,
+    dia_ban_kt,
+    df_crm4_filtered=None,
+    df_crm32_filtered=None,
+    do=None,
+    bo_nho_dem=None,
+    khoa_file=None,
+    so_ngay_gn_tt=0,
+    gn_tt_cung_khe_uoc=False,
+    ky_cham_tra=KY_CHAM_TRA,
+    moc_cham_tra=MOC_CHAM_TRA
+):
+    # bo_nho_dem=None: tính lại toàn bộ (chạy hàng loạt, mỗi chi nhánh một lần)
+    do = do or DoHieuNang(do_bo_nho=False)
+    bo_nho_dem = {} if bo_nho_dem is None else bo_nho_dem
+    tham_so = {
+        'file': khoa_file,
+        'chi_nhanh': chi_nhanh,
+        'ngay_danh_gia': ngay_danh_gia,
+        'dia_ban_kt': tuple(dia_ban_kt),
+        'sap_nhap_tinh': da_sap_nhap(ngay_danh_gia),
+        'so_ngay_gn_tt': so_ngay_gn_tt,
+        'gn_tt_cung_khe_uoc': gn_tt_cung_khe_uoc,
+        'ky_cham_tra': tuple(ky_cham_tra),
+        'moc_cham_tra': tuple(moc_cham_tra),
+    }
+
+    co_ban = _ghi_nho(bo_nho_dem, 'co_ban', tham_so, lambda: xu_ly_co_ban(
+        du_lieu, chi_nhanh, df_crm4_filtered, df_crm32_filtered, do=do
+    ), do)
+    r34 = _ghi_nho(bo_nho_dem, 'r34', tham_so, lambda: xu_ly_r34(co_ban, ngay_danh_gia, do=do), do)
+    muc17 = _ghi_nho(bo_nho_dem, 'muc17', tham_so, lambda: xu_ly_muc17(
+        du_lieu, co_ban, dia_ban_kt, ngay_danh_gia, do=do
+    ), do)
+    muc55_56 = _ghi_nho(bo_nho_dem, 'muc55_56', tham_so, lambda: xu_ly_muc55_56(
+        du_lieu, so_ngay_gn_tt, gn_tt_cung_khe_uoc, do=do
+    ), do)
+    muc57 = _ghi_nho(bo_nho_dem, 'muc57', tham_so, lambda: xu_ly_muc57(
+        du_lieu, co_ban, ngay_danh_gia, ky_cham_tra, moc_cham_tra, do=do
+    ), do)
+    return ghep_ket_qua(co_ban, r34, muc17, muc55_56, muc57, do=do)
+
+
+# ============================================================
+# HÀM CHÍNH XỬ LÝ DỮ LIỆU (CHUYỂN TỪ SCRIPT GỐC)
+# ============================================================
+
+def process_data(
+    crm4_files,
+    crm32_files,
+    df_muc_dich_file_upload,
+    df_code_tsbd_file_upload,
+    df_giai_ngan_file_upload,
+    df_sol_file_upload,
+    df_55_file_upload,
+    df_56_file_upload,
+    df_57_file_upload,
+    chi_nhanh,
+    ngay_danh_gia,
+    dia_ban_kt,
+    so_tien_trinh=None,
+    do_bo_nho=False,
+    bo_nho_dem=None,
+    so_ngay_gn_tt=0,
+    gn_tt_cung_khe_uoc=False,
+    ky_cham_tra=KY_CHAM_TRA,
+    moc_cham_tra=MOC_CHAM_TRA,
+    che_do='trong_bo_nho',
+    dung_chung=False
+):
+    # bo_nho_dem: dict giữ qua các lần chạy để chỉ tính lại những giai đoạn có
+    # tham số đầu vào thay đổi (xem PHU_THUOC_GIAI_DOAN); với dung_chung mà không
+    # truyền thì dùng bộ nhớ đệm chung của bộ file (ket_qua_chung.bo_nho_giai_doan)
+    # che_do: xem CHE_DO_XU_LY – 'ngoai_bo_nho' / 'doc_luong' lọc chi nhánh ngay khi đọc từng file
+    # Không upload bảng mã -> dùng kho bảng mã theo ngày đánh giá (bang_ma.py)
+    # dung_chung: dùng bộ nhớ kết quả chung của tiến trình (ket_qua_chung.py);
+    # results['dung_lai_ket_qua_chung'] cho biết kết quả có lấy lại từ đó không
+    uploads = [
+        crm4_files,
+        crm32_files,
+        chon_bang_ma(df_muc_dich_file_upload, 'muc_dich', ngay_danh_gia),
+        chon_bang_ma(df_code_tsbd_file_upload, 'code_tsbd', ngay_danh_gia),
+        df_giai_ngan_file_upload,
+        df_sol_file_upload,
+        df_55_file_upload,
+        df_56_file_upload,
+        df_57_file_upload,
+    ]
+
+    khoa_file = None
+    if bo_nho_dem is not None or dung_chung:
+        khoa_file = tuple(
+            tuple(_khoa_file(f) for f in up) if isinstance(up, (list, tuple)) else _khoa_file(up)
+            for up in uploads
+        )
+    dung_giai_doan_chung = dung_chung and bo_nho_dem is None
+
+    def tinh():
+        bo_nho = ket_qua_chung.bo_nho_giai_doan(khoa_file) if dung_giai_doan_chung else bo_nho_dem
+        try:
+            return _process_data(
+                uploads, khoa_file, chi_nhanh, ngay_danh_gia, dia_ban_kt, so_tien_trinh, do_bo_nho,
+                {} if bo_nho is None else bo_nho,
+                so_ngay_gn_tt, gn_tt_cung_khe_uoc, ky_cham_tra, moc_cham_tra, che_do
+            )
+        finally:
+            if dung_giai_doan_chung:
+                ket_qua_chung.cap_nhat_giai_doan(khoa_file, bo_nho)
+
+    if not dung_chung:
+        results, dung_lai = tinh(), False
+    else:
+        # Chế độ đọc không đổi kết quả nên không nằm trong khóa
+        khoa = (
+            khoa_file, chi_nhanh, pd.Timestamp(ngay_danh_gia), tuple(dia_ban_kt),
+            so_ngay_gn_tt, gn_tt_cung_khe_uoc, tuple(ky_cham_tra), tuple(moc_cham_tra)
+        )
+        results, dung_lai = ket_qua_chung.lay_hoac_tinh(khoa, tinh)
+    results["dung_lai_ket_qua_chung"] = dung_lai
+    return results
+
+
+def _process_data(
+    uploads, khoa_file, chi_nhanh, ngay_danh_gia, dia_ban_kt, so_tien_trinh, do_bo_nho, bo_nho_dem,
+    so_ngay_gn_tt, gn_tt_cung_khe_uoc, ky_cham_tra, moc_cham_tra, che_do
+):
+    do = DoHieuNang(do_bo_nho=do_bo_nho)
+    if che_do in ('ngoai_bo_nho', 'doc_luong'):
+        tham_so_doc = {'file': khoa_file, 'che_do': che_do, 'chi_nhanh_doc': chi_nhanh}
+        du_lieu = _ghi_nho(bo_nho_dem, 'du_lieu', tham_so_doc, lambda: doc_du_lieu_ngoai_bo_nho(
+            *uploads,
+            [chi_nhanh],
+            so_tien_trinh=so_tien_trinh,
+            doc_luong=che_do == 'doc_luong',
+            do=do
+        ), do)
+        df_crm4_filtered, df_crm32_filtered = du_lieu['theo_chi_nhanh'][chi_nhanh]
+    else:
+        tham_so_doc = {'file': khoa_file, 'che_do': che_do, 'chi_nhanh_doc': None}
+        du_lieu = _ghi_nho(bo_nho_dem, 'du_lieu', tham_so_doc, lambda: doc_du_lieu(
+            *uploads,
+            so_tien_trinh=so_tien_trinh,
+            do=do
+        ), do)
+        df_crm4_filtered = df_crm32_filtered = None
+
+    results = xu_ly_chi_nhanh(
+        du_lieu, chi_nhanh, ngay_danh_gia, dia_ban_kt,
+        df_crm4_filtered=df_crm4_filtered, df_crm32_filtered=df_crm32_filtered,
+        do=do, bo_nho_dem=bo_nho_dem, khoa_file=khoa_file,
+        so_ngay_gn_tt=so_ngay_gn_tt, gn_tt_cung_khe_uoc=gn_tt_cung_khe_uoc,
+        ky_cham_tra=ky_cham_tra, moc_cham_tra=moc_cham_tra
+    )
+    do.dong()
+    results["tg_giai_doan"] = do.bang()
+    results["tg_doc_file"] = du_lieu["tg_doc_file"]
+    results["bao_cao_bo_nho"] = du_lieu["bao_cao_bo_nho"]
+    return results
@@ -0,0 +1,56 @@
+# pivot.py
+
+import numpy as np
+import pandas as pd
+
+# ============================================================
+# PIVOT TỔNG MỘT LƯỢT TRÊN KHÓA ĐÃ FACTORIZE
+# ============================================================
+# Thay cho nhiều lần pivot_table(aggfunc='sum', fill_value=0) trên cùng
+# index/columns rồi merge lại và tính tổng dòng bằng drop(...).sum(axis=1):
+#   - factorize index và columns một lần, ghép thành một mã cặp (hàng, cột)
+#   - groupby mã cặp một lượt cho tất cả cột giá trị: chỉ các cặp CIF × loại
+#     thực sự có, phần lớn CIF chỉ có 1–2 loại
+#   - tổng theo hàng cộng thẳng trên các cặp này; bảng rộng (ma trận 0) dựng
+#     một lần bằng rong() vì pivot_merge / pivot_mucdich là bảng kết quả xuất
+#     ra Excel ở dạng rộng
+# Kết quả giống pivot_table: index/columns sắp xếp tăng dần, khóa NaN bị bỏ.
+
+
+class PivotTong:
+    def __init__(self, df, index, columns, values):
+        self.index = index
+        self.columns = columns
+        self.values = list(values)
+
+        # Bỏ dòng có khóa NaN trước khi factorize để CIF chỉ có khóa cột NaN
+        # không sinh hàng rỗng (giống pivot_table)
+        df = df[df[index].notna() & df[columns].notna()]
+        ma_hang, self.hang = pd.factorize(df[index], sort=True)
+        ma_cot, self.cot = pd.factorize(df[columns], sort=True)
+        ma_cap = ma_hang.astype('int64') * max(len(self.cot), 1) + ma_cot
+
+        tong = df[self.values].groupby(ma_cap, sort=True).sum()
+        self.ma_cap = tong.index.to_numpy()
+        self.ma_hang = self.ma_cap // max(len(self.cot), 1)
+        self.ma_cot = self.ma_cap % max(len(self.cot), 1)
+        self.tong_cap = tong.reset_index(drop=True)
+
+    def rong(self, hau_to):
+        # hau_to: {cột giá trị: hậu tố tên cột}, theo thứ tự các khối cột trong bảng rộng
+        khoi = [pd.DataFrame({self.index: self.hang})]
+        for value, suffix in hau_to.items():
+            gia_tri = self.tong_cap[value].to_numpy()
+            mang = np.zeros((len(self.hang), len(self.cot)), dtype=gia_tri.dtype)
+            mang[self.ma_hang, self.ma_cot] = gia_tri
+            khoi.append(pd.DataFrame(mang, columns=[f'{c}{suffix}' for c in self.cot]))
+        ket_qua = pd.concat(khoi, axis=1)
+        ket_qua.columns.name = self.columns
+        return ket_qua
+
+    def tong(self, value):
+        # Tổng theo hàng (tương đương bảng rộng .sum(axis=1)), cùng thứ tự self.hang
+        gia_tri = self.tong_cap[value].to_numpy()
+        tong = np.zeros(len(self.hang), dtype=gia_tri.dtype)
+        np.add.at(tong, self.ma_hang, gia_tri)
+        return tong
@@ -0,0 +1,96 @@
+# schema.py
+
+# ============================================================
+# DANH MỤC CỘT & KIỂU DỮ LIỆU CỦA TỪNG LOẠI FILE ĐẦU VÀO
+# ============================================================
+# Mỗi loại file chỉ đọc đúng các cột mà process_data dùng tới (usecols),
+# ép sẵn kiểu (dtype) và parse ngày ngay lúc đọc.
+#   - None  : để pandas tự suy kiểu (cột CIF được chuẩn hóa sau, NHOM_NO so
+#             sánh với số, ngày dạng số yyyymmdd của Mục 56...)
+#   - "date": parse thành datetime khi đọc
+# Muốn giữ thêm cột nào trong file kết quả thì bổ sung vào đây.
+
+SCHEMAS = {
+    "crm4": {
+        "CIF_KH_VAY": None,
+        "TEN_KH_VAY": str,
+        "CUSTTPCD": str,
+        "NHOM_NO": None,
+        "BRANCH_VAY": str,
+        "LOAI": str,
+        "CAP_2": str,
+        "TS_KW_VND": "float64",
+        "DU_NO_PHAN_BO_QUY_DOI": "float64",
+        "VALUATION_DATE": "date",
+        "SECU_SRL_NUM": str,
+    },
+    "crm32": {
+        "CUSTSEQLN": None,
+        "BRCD": str,
+        "CAP_PHE_DUYET": str,
+        "SCHEME_CODE": str,
+        "MUC_DICH_VAY_CAP_4": str,
+        "DU_NO_QUY_DOI": "float64",
+        "KHE_UOC": str,
+    },
+    "muc_dich": {
+        "CODE_MDSDV4": str,
+        "GROUP": str,
+    },
+    "code_tsbd": {
+        "CODE CAP 2": str,
+        "CODE": str,
+    },
+    "giai_ngan": {
+        "FORACID": str,
+    },
+    "muc17": {
+        "C01": str,
+        "C02": str,
+        "C19": str,
+    },
+    "muc55": {
+        "CUSTSEQLN": None,
+        "NMLOC": str,
+        "KHE_UOC": str,
+        "SOTIENGIAINGAN": "float64",
+        "NGAYGN": None,
+        "NGAYDH": None,
+        "NGAY_TT": "date",
+        "LOAITIEN": str,
+    },
+    "muc56": {
+        "CIF": None,
+        "TEN_KHACH_HANG": str,
+        "KHE_UOC": str,
+        "SO_TIEN_GIAI_NGAN_VND": "float64",
+        "NGAY_GIAI_NGAN": None,
+        "NGAY_DAO_HAN": None,
+        "LOAI_TIEN_HD": str,
+    },
+    "muc57": {
+        "CIF_ID": None,
+        "NGAY_DEN_HAN_TT": "date",
+        "NGAY_THANH_TOAN": "date",
+    },
+}
+
+
+def read_kwargs(loai):
+    # Tham số truyền thẳng cho pd.read_excel / read_excel_cached
+    cols = SCHEMAS[loai]
+    return {
+        "usecols": list(cols),
+        "dtype": {c: t for c, t in cols.items() if t is not None and t != "date"},
+        "parse_dates": [c for c, t in cols.items() if t == "date"],
+    }
+
+
+# Cột chuỗi ít giá trị khác nhau: chuyển sang category sau khi đọc (memory.py)
+COT_CATEGORY = {
+    "crm4": ["LOAI", "CAP_2", "BRANCH_VAY", "CUSTTPCD", "NHOM_NO"],
+    "crm32": ["BRCD", "CAP_PHE_DUYET", "SCHEME_CODE", "MUC_DICH_VAY_CAP_4"],
+    "muc17": ["C02"],
+    "muc55": ["LOAITIEN"],
+    "muc56": ["LOAI_TIEN_HD"],
+}
@@ -0,0 +1,7 @@
+# tests/conftest.py
+
+import os
+import sys
+
+# Các module nằm phẳng ở thư mục gốc repo
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
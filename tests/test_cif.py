@@ -0,0 +1,41 @@
+# tests/test_cif.py
+
+import pandas as pd
+
+from cif import chieu_cif, giai_ma_bang, giai_ma_cif, ma_hoa_cif
+from pipeline import xu_ly_muc55_56
+
+
+def test_chieu_cif_giu_cif_khong_phai_so():
+    crm4 = pd.Series(['1002', 'KH01', '1001'])
+    muc55 = pd.Series(['001001', ' KH01 ', 'KH02', None, ''])
+    kieu = chieu_cif(pd.Series([1002, None, 1001], dtype='Int64'), muc55)
+    assert list(kieu.categories) == [1001, 1002, 'KH01', 'KH02']
+
+    # '001001' và 1001 là cùng một KH (thay đổi có chủ đích); rỗng -> NaN
+    assert giai_ma_cif(ma_hoa_cif(muc55, kieu)).fillna('').tolist() == ['1001', 'KH01', 'KH02', '', '']
+    assert giai_ma_cif(ma_hoa_cif(crm4, kieu)).tolist() == ['1002', 'KH01', '1001']
+
+
+def test_muc55_56_giu_dong_cif_khong_phai_so():
+    du_lieu = {
+        'df_55': pd.DataFrame({
+            'CUSTSEQLN': ['KH01', '1001'], 'NMLOC': ['A', 'B'], 'KHE_UOC': ['K1', 'K2'],
+            'SOTIENGIAINGAN': [100, 200], 'NGAYGN': ['20250101', '20250101'],
+            'NGAYDH': ['20260101', '20260101'], 'NGAY_TT': ['2025-03-01', '2025-03-01'], 'LOAITIEN': ['VND', 'VND'],
+        }),
+        'df_56': pd.DataFrame({
+            'CIF': ['KH01'], 'TEN_KHACH_HANG': ['A'], 'KHE_UOC': ['K3'], 'SO_TIEN_GIAI_NGAN_VND': [50],
+            'NGAY_GIAI_NGAN': ['20250301'], 'NGAY_DAO_HAN': ['20260301'], 'LOAI_TIEN_HD': ['VND'],
+        }),
+    }
+    kieu = chieu_cif(du_lieu['df_55']['CUSTSEQLN'], du_lieu['df_56']['CIF'])
+    du_lieu['df_55']['CUSTSEQLN'] = ma_hoa_cif(du_lieu['df_55']['CUSTSEQLN'], kieu)
+    du_lieu['df_56']['CIF'] = ma_hoa_cif(du_lieu['df_56']['CIF'], kieu)
+
+    kq = xu_ly_muc55_56(du_lieu)
+    assert giai_ma_bang(kq['df_gop'])['CIF'].tolist() == ['1001', 'KH01', 'KH01']
+    df_count = giai_ma_bang(kq['df_count'])
+    assert df_count['CIF'].tolist() == ['1001', 'KH01']
+    assert df_count['CO_CA_GN_VA_TT'].tolist() == [0, 1]
+    assert list(kq['co_kh']['KH có cả GNG và TT trong 1 ngày'][0]) == ['KH01']
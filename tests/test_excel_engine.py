@@ -0,0 +1,153 @@
+# tests/test_excel_engine.py
+
+import io
+import os
+from datetime import datetime
+
+import pandas as pd
+import pytest
+
+import excel_engine
+from cif import so_cif
+from doc_luong import doc_excel_loc, loc_chua
+from excel_engine import ENGINE_THEO_DINH_DANG, chon_engine, co_engine, read_excel
+from pipeline import COT_CIF_DAU_VAO
+from schema import read_kwargs
+
+XLS = b'\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1' + b'\x00' * 8
+XLSX = b'PK\x03\x04' + b'\x00' * 12
+
+
+@pytest.mark.parametrize('ep, data, ket_qua', [
+    ('openpyxl', XLSX, 'openpyxl'),
+    ('xlrd', XLS, 'xlrd'),
+    ('calamine', XLS, 'calamine'),
+])
+def test_chon_engine_ep_dung_dinh_dang(monkeypatch, ep, data, ket_qua):
+    monkeypatch.setattr(excel_engine, 'ENGINE_CHI_DINH', ep)
+    assert chon_engine(data) == ket_qua
+
+
+@pytest.mark.parametrize('ep, data, dinh_dang', [
+    ('openpyxl', XLS, 'xls'),
+    ('xlrd', XLSX, 'xlsx'),
+])
+def test_chon_engine_ep_sai_dinh_dang_dung_mac_dinh(monkeypatch, ep, data, dinh_dang):
+    # Engine ép không đọc được định dạng này -> chọn như không ép
+    monkeypatch.setattr(excel_engine, 'ENGINE_CHI_DINH', None)
+    tu_dong = chon_engine(data)
+    monkeypatch.setattr(excel_engine, 'ENGINE_CHI_DINH', ep)
+    assert chon_engine(data) == tu_dong
+    assert chon_engine(data) in ENGINE_THEO_DINH_DANG[dinh_dang]
+
+
+def workbook_o_kho():
+    # Mục 57 giả lập: CIF đủ dạng + ngày có / không có giờ / rỗng
+    from openpyxl import Workbook
+
+    wb = Workbook()
+    ws = wb.active
+    ws.append(['CIF_ID', 'NGAY_DEN_HAN_TT', 'NGAY_THANH_TOAN'])
+    for dong in [
+        (1234, datetime(2024, 1, 31), datetime(2024, 2, 3, 10, 30)),
+        (1234.0, datetime(2024, 2, 29), None),
+        ('001234', datetime(2025, 12, 31, 23, 59, 59), datetime(2025, 12, 31)),
+        (10 ** 15 + 7, datetime(1999, 1, 1), datetime(2023, 6, 15)),
+        (1234.5, None, datetime(2024, 3, 1)),
+        ('KH01', datetime(2024, 1, 1), datetime(2024, 1, 1, 0, 0, 1)),
+        (None, datetime(2024, 5, 5), datetime(2024, 5, 6)),
+    ]:
+        ws.append(dong)
+    buf = io.BytesIO()
+    wb.save(buf)
+    return buf.getvalue()
+
+
+def _engine(dinh_dang):
+    return [
+        pytest.param(e, marks=pytest.mark.skipif(not co_engine(e), reason=f"chưa cài engine {e}"))
+        for e in ENGINE_THEO_DINH_DANG[dinh_dang]
+    ]
+
+
+@pytest.fixture(scope='module')
+def o_kho():
+    pytest.importorskip('openpyxl')
+    data = workbook_o_kho()
+    return data, read_excel(data, engine='openpyxl', **read_kwargs('muc57'))
+
+
+def _so_sanh(ref, df):
+    pd.testing.assert_frame_equal(ref, df, check_exact=True)
+    cot_cif = COT_CIF_DAU_VAO['df_57']
+    pd.testing.assert_series_equal(so_cif(ref[cot_cif]), so_cif(df[cot_cif]), check_exact=True)
+
+
+@pytest.mark.parametrize('engine', _engine('xlsx'))
+def test_read_excel_giong_engine_mac_dinh(o_kho, engine):
+    # Mọi engine của định dạng cho DataFrame giống hệt engine mặc định của pandas,
+    # kể cả kiểu cột, cột ngày và CIF sau chuẩn hóa
+    data, ref = o_kho
+    _so_sanh(ref, read_excel(data, engine=engine, **read_kwargs('muc57')))
+
+
+@pytest.mark.parametrize('engine', _engine('xlsx'))
+def test_doc_excel_loc_giong_read_excel(o_kho, engine):
+    # Đọc luồng có lọc = read_excel cả file rồi lấy đúng các dòng khớp (giữ
+    # dòng 'KH01' để kiểu cột CIF suy ra từ các dòng khớp vẫn như cả file)
+    data, ref = o_kho
+    df = doc_excel_loc(data, (loc_chua('CIF_ID', ['1234', 'KH']),), engine=engine, **read_kwargs('muc57'))
+    assert list(df.index) == [0, 1, 2, 4, 5]
+    assert df.attrs['so_dong_goc'] == len(ref)
+    df.attrs = {}
+    _so_sanh(ref.loc[df.index], df)
+
+
+# Loại file -> cột CIF (như COT_CIF_DAU_VAO của pipeline, theo tên loại file)
+COT_CIF = {
+    'crm4': COT_CIF_DAU_VAO['df_crm4'],
+    'crm32': COT_CIF_DAU_VAO['df_crm32'],
+    'muc55': COT_CIF_DAU_VAO['df_55'],
+    'muc56': COT_CIF_DAU_VAO['df_56'],
+    'muc57': COT_CIF_DAU_VAO['df_57'],
+}
+
+# Cột chi nhánh để thử bộ đọc luồng
+COT_CHI_NHANH = {'crm4': 'BRANCH_VAY', 'crm32': 'BRCD'}
+
+
+@pytest.fixture(scope='module')
+def bo_du_lieu(tmp_path_factory):
+    # Bộ file giả lập nhỏ như benchmarks/gen_data.py sinh cho benchmark
+    pytest.importorskip('openpyxl')
+    from benchmarks.gen_data import ghi_bo_du_lieu, tao_du_lieu
+
+    thu_muc = str(tmp_path_factory.mktemp('du_lieu'))
+    du_lieu, ds_chi_nhanh = tao_du_lieu(2000)
+    manifest = ghi_bo_du_lieu(du_lieu, ds_chi_nhanh, thu_muc)
+    files = {}
+    for loai, ten in manifest['files'].items():
+        with open(os.path.join(thu_muc, ten[0] if isinstance(ten, list) else ten), 'rb') as fh:
+            files[loai] = fh.read()
+    return files, manifest['chi_nhanh'][0]
+
+
+@pytest.mark.parametrize('engine', _engine('xlsx'))
+@pytest.mark.parametrize('loai', ['crm4', 'crm32', 'muc_dich', 'code_tsbd', 'giai_ngan', 'muc17', 'muc55',
+                                  'muc56', 'muc57'])
+def test_file_gia_lap_giong_engine_mac_dinh(bo_du_lieu, loai, engine):
+    files, chi_nhanh = bo_du_lieu
+    data, kw = files[loai], read_kwargs(loai)
+    ref = read_excel(data, engine='openpyxl', **kw)
+    df = read_excel(data, engine=engine, **kw)
+    pd.testing.assert_frame_equal(ref, df, check_exact=True)
+    if loai in COT_CIF:
+        pd.testing.assert_series_equal(so_cif(ref[COT_CIF[loai]]), so_cif(df[COT_CIF[loai]]), check_exact=True)
+
+    if loai in COT_CHI_NHANH:
+        loc = (loc_chua(COT_CHI_NHANH[loai], [chi_nhanh]),)
+        df = doc_excel_loc(data, loc, engine=engine, **kw)
+        khop = ref[COT_CHI_NHANH[loai]].astype(str).str.contains(chi_nhanh)
+        assert 0 < len(df) < len(ref) and list(df.index) == list(ref.index[khop])
+        df.attrs = {}
+        pd.testing.assert_frame_equal(ref.loc[df.index], df, check_exact=True)
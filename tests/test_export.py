@@ -0,0 +1,24 @@
+# tests/test_export.py
+
+import io
+from datetime import date, datetime
+
+import pandas as pd
+from openpyxl import load_workbook
+
+from export import SHEETS_KQ, excel_kq_bytes
+
+
+def test_excel_kq_ngay_khong_co_gio():
+    # Ô date chỉ hiện ngày, ô datetime có cả giờ – như pd.ExcelWriter của bản gốc
+    results = {key: pd.DataFrame() for _, key in SHEETS_KQ}
+    results['df_delay'] = pd.DataFrame({
+        'NGAY_DEN_HAN_TT': pd.to_datetime(['2024-01-31 10:30']),
+        'NGAY': [date(2024, 1, 31)],
+    })
+    ws = load_workbook(io.BytesIO(excel_kq_bytes(results)))['tieu chi 4']
+
+    assert ws['A2'].value == datetime(2024, 1, 31, 10, 30)
+    assert ws['A2'].number_format == 'yyyy-mm-dd hh:mm:ss'
+    assert ws['B2'].value == datetime(2024, 1, 31)
+    assert ws['B2'].number_format == 'yyyy-mm-dd'
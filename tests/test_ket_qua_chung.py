@@ -0,0 +1,28 @@
+# tests/test_ket_qua_chung.py
+
+import pandas as pd
+
+import ket_qua_chung
+
+
+def _bang(so_dong):
+    return pd.DataFrame({'a': range(so_dong)}, dtype='int64')
+
+
+def test_bo_nho_giai_doan_tinh_vao_ngan_sach(monkeypatch):
+    ket_qua_chung.xoa()
+    monkeypatch.setattr(ket_qua_chung, 'NGAN_SACH_BYTES', 3 * 8000 + 1000)
+
+    # Cùng bộ file -> cùng một bộ nhớ đệm giai đoạn cho mọi phiên
+    bo_nho = ket_qua_chung.bo_nho_giai_doan('file')
+    assert ket_qua_chung.bo_nho_giai_doan('file') is bo_nho
+    bo_nho['du_lieu'] = (('file',), {'df_crm4': _bang(2000)})
+    ket_qua_chung.cap_nhat_giai_doan('file', bo_nho)
+    assert ket_qua_chung.thong_ke()['dung_luong_mb'] * 1024 ** 2 >= 16000
+
+    # Kết quả mới vượt ngân sách -> bỏ bộ nhớ đệm giai đoạn lâu không dùng
+    ket_qua_chung.lay_hoac_tinh('kq', lambda: {'pivot_full': _bang(1500)})
+    assert ('giai_doan', 'file') not in ket_qua_chung._KET_QUA
+    assert ket_qua_chung.thong_ke()['so_ket_qua'] == 1
+    assert ket_qua_chung.bo_nho_giai_doan('file') == {}
+    ket_qua_chung.xoa()
@@ -0,0 +1,32 @@
+# tests/test_lich_su.py
+
+import sqlite3
+
+import numpy as np
+import pandas as pd
+
+import lich_su
+
+
+def _results(cif):
+    pivot_full = pd.DataFrame({
+        'CIF_KH_VAY': cif,
+        'TEN_KH_VAY': ['A', 'B', 'C'],
+        'DƯ NỢ': [100.0, 200.0, 300.0],
+        'Nợ xấu': ['x', 'x', ''],
+    })
+    return {'pivot_full': pivot_full}
+
+
+def test_luu_ky_bo_cif_rong(tmp_path):
+    # CIF không phải số giữ NaN sau chiều CIF: trước đây lỗi NOT NULL constraint failed: kh.cif
+    path = str(tmp_path / 'ls.sqlite')
+    ky_id = lich_su.luu_ky(_results(['1001', np.nan, '1003']), '001', '2025-09-30', path=path)
+
+    with sqlite3.connect(path) as con:
+        kh = con.execute("SELECT cif FROM kh WHERE ky_id = ? ORDER BY cif", (ky_id,)).fetchall()
+        co = con.execute("SELECT cif FROM co_tieu_chi WHERE ky_id = ?", (ky_id,)).fetchall()
+        so_cif = con.execute("SELECT so_cif FROM ky WHERE ky_id = ?", (ky_id,)).fetchone()[0]
+    assert kh == [('1001',), ('1003',)]
+    assert co == [('1001',)]
+    assert so_cif == 2
@@ -0,0 +1,54 @@
+# tests/test_pipeline.py
+
+import os
+
+import pandas as pd
+import pytest
+
+import excel_cache
+from pipeline import CHE_DO_XU_LY, process_data
+
+# Bảng thời gian / bộ nhớ đo được, không phải kết quả
+BANG_DO = ('tg_giai_doan', 'tg_doc_file', 'bao_cao_bo_nho')
+
+
+@pytest.fixture(scope='module')
+def bo_file(tmp_path_factory):
+    # Bộ file giả lập (benchmarks/gen_data.py), CRM4/CRM32 chia nhiều file
+    pytest.importorskip('openpyxl')
+    from benchmarks.gen_data import ghi_bo_du_lieu, tao_du_lieu
+
+    thu_muc = str(tmp_path_factory.mktemp('du_lieu'))
+    du_lieu, ds_chi_nhanh = tao_du_lieu(3000, seed=1)
+    manifest = ghi_bo_du_lieu(du_lieu, ds_chi_nhanh, thu_muc, so_dong_moi_file=1200)
+    files = {loai: (
+        [os.path.join(thu_muc, f) for f in ten] if isinstance(ten, list) else os.path.join(thu_muc, ten)
+    ) for loai, ten in manifest['files'].items()}
+    return files, manifest
+
+
+def _chay(bo_file, che_do):
+    files, manifest = bo_file
+    return process_data(
+        files['crm4'], files['crm32'], files['muc_dich'], files['code_tsbd'], files['giai_ngan'],
+        files['muc17'], files['muc55'], files['muc56'], files['muc57'],
+        manifest['chi_nhanh'][0], pd.Timestamp(manifest['ngay_danh_gia']), manifest['dia_ban_kt'],
+        so_tien_trinh=1, che_do=che_do
+    )
+
+
+def test_process_data_moi_che_do_cung_ket_qua(bo_file, tmp_path, monkeypatch):
+    monkeypatch.setattr(excel_cache, 'CACHE_DIR', str(tmp_path))
+    ket_qua = {che_do: _chay(bo_file, che_do) for che_do in CHE_DO_XU_LY}
+    goc = ket_qua['trong_bo_nho']
+
+    bang = [k for k, v in goc.items() if isinstance(v, pd.DataFrame) and k not in BANG_DO]
+    assert {'pivot_full', 'pivot_final', 'df_bds_matched', 'df_gop', 'df_count', 'df_delay'} <= set(bang)
+    assert (goc['pivot_full']['KH có TSBĐ khác địa bàn'] == 'x').any()
+    for che_do in ('ngoai_bo_nho', 'doc_luong'):
+        for ten in bang:
+            # Danh mục của cột category phụ thuộc các dòng đã parse (đọc luồng chỉ
+            # parse dòng của chi nhánh) -> so giá trị, không so danh mục
+            pd.testing.assert_frame_equal(
+                goc[ten], ket_qua[che_do][ten], check_dtype=False, check_categorical=False, obj=f'{che_do}: {ten}'
+            )
@@ -0,0 +1,40 @@
+# tests/test_tinh_thanh.py
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from pipeline import xu_ly_muc17
+from tinh_thanh import chuan_hoa_tinh, tinh_tu_dia_chi
+
+
+@pytest.mark.parametrize('ngay, ket_qua', [
+    ('2025-06-30', ['Bình Dương', 'Hồ Chí Minh', 'Thừa Thiên Huế']),
+    ('2025-07-01', ['Hồ Chí Minh', 'Hồ Chí Minh', 'Huế']),
+])
+def test_chuan_hoa_tinh_theo_ngay_sap_nhap(ngay, ket_qua):
+    dia_chi = pd.Series(['1 Đại lộ Bình Dương, Tỉnh Bình Dương', 'Q1, TP.HCM', 'Phú Hội, TP. Huế'])
+    assert tinh_tu_dia_chi(dia_chi, pd.Timestamp(ngay)).tolist() == ket_qua
+    assert chuan_hoa_tinh(['tp hcm', 'xyz'], pd.Timestamp(ngay)).iloc[1] is np.nan
+
+
+@pytest.mark.parametrize('ngay, khac_dia_ban', [
+    ('2025-06-30', ['x', '']),
+    ('2025-07-01', ['', '']),
+])
+def test_muc17_khac_dia_ban_truoc_sau_sap_nhap(ngay, khac_dia_ban):
+    # TSBĐ ở Bình Dương khi kiểm toán Hồ Chí Minh: khác địa bàn trước 01/07/2025
+    du_lieu = {
+        'df_crm4': pd.DataFrame({'SECU_SRL_NUM': ['TS1', 'TS2'], 'CIF_KH_VAY': ['1001', '1002']}),
+        'df_sol': pd.DataFrame({
+            'C01': ['TS1', 'TS2'],
+            'C02': ['Bat dong san', 'Bat dong san'],
+            'C19': ['Thủ Dầu Một, Bình Dương', 'Quận 1, TP. Hồ Chí Minh'],
+        }),
+    }
+    co_ban = {'df_crm4_filtered': du_lieu['df_crm4']}
+    kq = xu_ly_muc17(du_lieu, co_ban, ['hồ chí minh'], pd.Timestamp(ngay))
+
+    assert kq['df_bds_matched']['CANH_BAO_TS_KHAC_DIABAN'].tolist() == khac_dia_ban
+    cif = kq['co_kh']['KH có TSBĐ khác địa bàn'][0]
+    assert list(cif) == (['1001'] if khac_dia_ban[0] else [])
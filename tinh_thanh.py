@@ -0,0 +1,165 @@
+# tinh_thanh.py
+
+import numpy as np
+import pandas as pd
+
+# ============================================================
+# CHUẨN HÓA TÊN TỈNH/THÀNH TRONG ĐỊA CHỈ TSBĐ (MỤC 17)
+# ============================================================
+# Địa chỉ C19 ghi tỉnh/thành rất nhiều kiểu: "TP. Hồ Chí Minh", "TP.HCM",
+# "Ho Chi Minh", "Tỉnh Long An", tên tỉnh cũ trước sáp nhập 2025...
+# Mọi cách ghi được đưa về một khóa (không dấu, bỏ tiền tố TP./Tỉnh, bỏ
+# khoảng trắng, ký tự đặc biệt) rồi tra ra tên tỉnh chuẩn theo địa giới tại
+# ngày đánh giá:
+#   - từ NGAY_SAP_NHAP (34 tỉnh/thành, hiệu lực 01/07/2025): CHI_MUC_TINH,
+#     tỉnh cũ quy về tỉnh mới đã sáp nhập, nên địa bàn kiểm toán nhập theo
+#     tên cũ hay tên mới đều so khớp được
+#   - trước đó: CHI_MUC_TINH_CU, mỗi tỉnh cũ giữ nguyên tên (TSBĐ ở Bình
+#     Dương vẫn là khác địa bàn khi kiểm toán Hồ Chí Minh)
+# Toàn bộ xử lý dùng pandas .str trên cả cột, chỉ tính khóa trên các giá trị
+# duy nhất.
+
+# Tỉnh/thành mới -> các tỉnh/thành cũ được sáp nhập vào (gồm cả chính nó)
+TINH_MOI = {
+    'Hà Nội': ['Hà Nội'],
+    'Huế': ['Thừa Thiên Huế', 'Huế'],
+    'Lai Châu': ['Lai Châu'],
+    'Điện Biên': ['Điện Biên'],
+    'Sơn La': ['Sơn La'],
+    'Lạng Sơn': ['Lạng Sơn'],
+    'Quảng Ninh': ['Quảng Ninh'],
+    'Thanh Hóa': ['Thanh Hóa'],
+    'Nghệ An': ['Nghệ An'],
+    'Hà Tĩnh': ['Hà Tĩnh'],
+    'Cao Bằng': ['Cao Bằng'],
+    'Tuyên Quang': ['Tuyên Quang', 'Hà Giang'],
+    'Lào Cai': ['Lào Cai', 'Yên Bái'],
+    'Thái Nguyên': ['Thái Nguyên', 'Bắc Kạn'],
+    'Phú Thọ': ['Phú Thọ', 'Vĩnh Phúc', 'Hòa Bình'],
+    'Bắc Ninh': ['Bắc Ninh', 'Bắc Giang'],
+    'Hưng Yên': ['Hưng Yên', 'Thái Bình'],
+    'Hải Phòng': ['Hải Phòng', 'Hải Dương'],
+    'Ninh Bình': ['Ninh Bình', 'Hà Nam', 'Nam Định'],
+    'Quảng Trị': ['Quảng Trị', 'Quảng Bình'],
+    'Đà Nẵng': ['Đà Nẵng', 'Quảng Nam'],
+    'Quảng Ngãi': ['Quảng Ngãi', 'Kon Tum'],
+    'Gia Lai': ['Gia Lai', 'Bình Định'],
+    'Khánh Hòa': ['Khánh Hòa', 'Ninh Thuận'],
+    'Lâm Đồng': ['Lâm Đồng', 'Đắk Nông', 'Bình Thuận'],
+    'Đắk Lắk': ['Đắk Lắk', 'Phú Yên'],
+    'Hồ Chí Minh': ['Hồ Chí Minh', 'Bình Dương', 'Bà Rịa - Vũng Tàu'],
+    'Đồng Nai': ['Đồng Nai', 'Bình Phước'],
+    'Tây Ninh': ['Tây Ninh', 'Long An'],
+    'Cần Thơ': ['Cần Thơ', 'Sóc Trăng', 'Hậu Giang'],
+    'Vĩnh Long': ['Vĩnh Long', 'Bến Tre', 'Trà Vinh'],
+    'Đồng Tháp': ['Đồng Tháp', 'Tiền Giang'],
+    'Cà Mau': ['Cà Mau', 'Bạc Liêu'],
+    'An Giang': ['An Giang', 'Kiên Giang'],
+}
+
+NGAY_SAP_NHAP = pd.Timestamp('2025-07-01')
+
+# Tên trong TINH_MOI chỉ là đổi tên (cùng địa giới) -> tên trước NGAY_SAP_NHAP
+TEN_TRUOC_SAP_NHAP = {
+    'Huế': 'Thừa Thiên Huế',
+}
+
+# Cách viết tắt / tên gọi khác -> tên tỉnh (cũ hoặc mới) trong TINH_MOI
+BI_DANH = {
+    'HCM': 'Hồ Chí Minh',
+    'TPHCM': 'Hồ Chí Minh',
+    'Sài Gòn': 'Hồ Chí Minh',
+    'Saigon': 'Hồ Chí Minh',
+    'HN': 'Hà Nội',
+    'Hanoi': 'Hà Nội',
+    'Bà Rịa': 'Bà Rịa - Vũng Tàu',
+    'Vũng Tàu': 'Bà Rịa - Vũng Tàu',
+    'BRVT': 'Bà Rịa - Vũng Tàu',
+    'TT Huế': 'Thừa Thiên Huế',
+    'Đắc Lắc': 'Đắk Lắk',
+    'Daklak': 'Đắk Lắk',
+    'Đắc Nông': 'Đắk Nông',
+    'Kontum': 'Kon Tum',
+}
+
+# Tiền tố hành chính đứng trước tên tỉnh (sau khi đã bỏ dấu, chữ thường)
+_TIEN_TO = r'^(?:thanh pho|tp|tinh)\s+'
+
+
+def khoa_tinh(s):
+    # Khóa so khớp: chữ thường, bỏ dấu, đ -> d, bỏ tiền tố và mọi ký tự không phải chữ/số
+    s = pd.Series(s, dtype='str')
+    s = (s.str.lower()
+          .str.normalize('NFD')
+          .str.replace('[\u0300-\u036f]', '', regex=True)
+          .str.replace('đ', 'd', regex=False)
+          .str.replace(r'[^a-z0-9]+', ' ', regex=True)
+          .str.strip()
+          .str.replace(_TIEN_TO, '', regex=True))
+    return s.str.replace(' ', '', regex=False)
+
+
+def _tao_chi_muc(sap_nhap=True):
+    ten_chuan = {}
+    for moi, ds_cu in TINH_MOI.items():
+        ten_chuan[moi] = moi if sap_nhap else TEN_TRUOC_SAP_NHAP.get(moi, moi)
+        for cu in ds_cu:
+            ten_chuan[cu] = moi if sap_nhap else TEN_TRUOC_SAP_NHAP.get(cu, cu)
+    for bi_danh, ten in BI_DANH.items():
+        ten_chuan[bi_danh] = ten_chuan[ten]
+    ten = pd.Series(list(ten_chuan))
+    return dict(zip(khoa_tinh(ten), ten.map(ten_chuan)))
+
+
+# khóa -> tên tỉnh/thành mới / tên tỉnh/thành trước sáp nhập
+CHI_MUC_TINH = _tao_chi_muc()
+CHI_MUC_TINH_CU = _tao_chi_muc(sap_nhap=False)
+
+
+def da_sap_nhap(ngay_danh_gia=None):
+    # Không truyền ngày -> địa giới hiện hành (sau sáp nhập)
+    return ngay_danh_gia is None or pd.Timestamp(ngay_danh_gia) >= NGAY_SAP_NHAP
+
+
+def _tren_gia_tri_duy_nhat(s, ham):
+    # Áp ham lên các giá trị duy nhất của s rồi trải ngược về từng dòng
+    codes, uniques = pd.factorize(s)
+    if not len(uniques):
+        return pd.Series(np.nan, index=s.index, dtype=object)
+    out = ham(pd.Series(uniques)).to_numpy(dtype=object)[codes]
+    out[codes < 0] = np.nan
+    return pd.Series(out, index=s.index, dtype=object)
+
+
+def chuan_hoa_tinh(s, ngay_danh_gia=None):
+    # Tên tỉnh/thành (mọi cách ghi) -> tên tỉnh theo địa giới tại ngày đánh giá; không nhận ra -> NaN
+    s = pd.Series(s)
+    chi_muc = CHI_MUC_TINH if da_sap_nhap(ngay_danh_gia) else CHI_MUC_TINH_CU
+    return _tren_gia_tri_duy_nhat(s, lambda u: khoa_tinh(u).map(chi_muc))
+
+
+def _chuoi(s):
+    return s.astype('str').where(s.notna())
+
+
+def _phan_cuoi(dia_chi):
+    # Phần sau dấu phẩy cuối cùng (regex tham lam trên cả cột, nhanh hơn split ra list).
+    # Địa chỉ rỗng giữ NaN: pandas < 3 đổi NaN thành chuỗi 'nan' khi astype('str')
+    return _chuoi(dia_chi).str.replace(r'^.*,', '', regex=True)
+
+
+def tinh_cuoi_dia_chi(dia_chi):
+    # Phần sau dấu phẩy cuối cùng, chữ thường ('' nếu địa chỉ rỗng)
+    return _phan_cuoi(dia_chi).str.strip().str.lower().fillna('').astype('str')
+
+
+def tinh_tu_dia_chi(dia_chi, ngay_danh_gia=None):
+    # Tên tỉnh chuẩn từ địa chỉ: thử phần cuối, nếu không nhận ra (vd. ", Việt Nam")
+    # thì thử phần kế cuối – chỉ trên các dòng chưa nhận ra
+    tinh = chuan_hoa_tinh(_phan_cuoi(dia_chi), ngay_danh_gia)
+    con_lai = tinh.isna() & dia_chi.astype('str').str.contains(',', regex=False, na=False)
+    if con_lai.any():
+        bo_phan_cuoi = dia_chi[con_lai].astype('str').str.replace(r',[^,]*$', '', regex=True)
+        tinh[con_lai] = chuan_hoa_tinh(_phan_cuoi(bo_phan_cuoi), ngay_danh_gia)
+    # Không nhận ra tỉnh -> NaN (xu_ly_muc17 dựa vào notna() để chọn cách so địa bàn)
+    return _chuoi(tinh)
@@ -0,0 +1,69 @@
+# viewer.py
+
+import numpy as np
+import streamlit as st
+
+# ============================================================
+# XEM BẢNG KẾT QUẢ THEO TRANG (LỌC / SẮP XẾP PHÍA SERVER)
+# ============================================================
+# Trình duyệt chỉ nhận đúng trang đang xem thay vì cả DataFrame. Kết quả
+# lọc/sắp xếp (mảng vị trí dòng) được lưu trong session_state theo điều kiện
+# lọc và thế hệ dữ liệu (the_he: đổi mỗi khi app tạo bảng mới – không dùng
+# id(df), vì bảng mới có thể nhận lại id của bảng vừa giải phóng), nên
+# chuyển trang chỉ tốn một lần iloc. Mỗi bảng là một fragment:
+# thao tác trên bảng này không chạy lại cả app hay các bảng khác.
+
+PAGE_SIZES = [50, 100, 500, 1000]
+
+
+def _vi_tri_dong(df, cot_loc, tu_khoa, cot_sap_xep, tang_dan):
+    pos = np.arange(len(df))
+
+    if cot_loc and tu_khoa:
+        mask = df[cot_loc].astype(str).str.contains(tu_khoa, case=False, regex=False, na=False)
+        pos = pos[mask.to_numpy()]
+
+    if cot_sap_xep:
+        s = df[cot_sap_xep].iloc[pos].reset_index(drop=True)
+        order = s.sort_values(ascending=tang_dan, kind='stable', na_position='last').index.to_numpy()
+        pos = pos[order]
+
+    return pos
+
+
+@st.fragment
+def hien_thi_bang(df, key, the_he):
+    all_cols = [str(c) for c in df.columns]
+
+    with st.expander("🔎 Lọc / sắp xếp / chọn cột", expanded=False):
+        c1, c2, c3, c4 = st.columns([2, 2, 2, 1])
+        cot_loc = c1.selectbox("Lọc theo cột", [''] + all_cols, key=f"{key}_cot_loc")
+        tu_khoa = c2.text_input("Chứa nội dung", key=f"{key}_tu_khoa").strip()
+        cot_sap_xep = c3.selectbox("Sắp xếp theo", [''] + all_cols, key=f"{key}_sap_xep")
+        tang_dan = c4.checkbox("Tăng dần", value=True, key=f"{key}_tang_dan")
+        cot_hien = st.multiselect("Cột hiển thị", all_cols, default=all_cols, key=f"{key}_cot_hien")
+
+    # Chỉ lọc/sắp xếp lại khi điều kiện hoặc bảng thay đổi
+    dieu_kien = (the_he, cot_loc, tu_khoa, cot_sap_xep, tang_dan)
+    cache = st.session_state.get(f"{key}_vi_tri")
+    if cache is None or cache[0] != dieu_kien:
+        cache = (dieu_kien, _vi_tri_dong(df, cot_loc, tu_khoa, cot_sap_xep, tang_dan))
+        st.session_state[f"{key}_vi_tri"] = cache
+    pos = cache[1]
+
+    c1, c2, c3 = st.columns([1, 1, 3])
+    page_size = c1.selectbox("Số dòng / trang", PAGE_SIZES, key=f"{key}_page_size")
+    so_trang = max(1, -(-len(pos) // page_size))
+    if st.session_state.get(f"{key}_trang", 1) > so_trang:
+        # Sau khi lọc ít dòng hơn -> đưa về trang cuối còn hợp lệ
+        st.session_state[f"{key}_trang"] = so_trang
+    trang = c2.number_input("Trang", min_value=1, max_value=so_trang, key=f"{key}_trang")
+
+    start = (trang - 1) * page_size
+    end = min(start + page_size, len(pos))
+    loc = f" (lọc từ {len(df):,})" if len(pos) != len(df) else ""
+    c3.caption(f"Dòng {start + 1 if len(pos) else 0:,}–{end:,} / {len(pos):,}{loc} · {so_trang:,} trang")
+
+    cols = [c for c in df.columns if str(c) in cot_hien]
+    st.dataframe(df.iloc[pos[start:end]][cols])
+